@@ -14,23 +14,30 @@ from bpy.props import PointerProperty
 from .main_panel import EPBRB_PT_main_panel
 from .properties import EasyPBRBakeProp
 from .easy_pbr_bake import EasyPBRBake
+from .batch_bake import EasyPBRBatchBake
+from .atlas_bake import EasyPBRAtlasBake
+from .bake_api import bake_to_arrays
 from .albedo_section import EPBRB_PT_albedo_section
 from .channels_section import EPBRB_PT_channels_section
 from .metallic_section import EPBRB_PT_metallic_section
 from .roughness_section import EPBRB_PT_roughness_section
 from .ao_section import EPBRB_PT_ao_section
 from .normal_section import EPBRB_PT_normal_section
+from .batch_section import EPBRB_PT_batch_section
 
 classes = (
     EasyPBRBakeProp,
     EPBRB_PT_main_panel,
     EasyPBRBake,
+    EasyPBRBatchBake,
+    EasyPBRAtlasBake,
     EPBRB_PT_albedo_section,
     EPBRB_PT_channels_section,
     EPBRB_PT_metallic_section,
     EPBRB_PT_roughness_section,
     EPBRB_PT_ao_section,
-    EPBRB_PT_normal_section
+    EPBRB_PT_normal_section,
+    EPBRB_PT_batch_section
 )
 
 def register():
@@ -27,6 +27,7 @@ class EPBRB_PT_albedo_section(Panel):
             row.enabled = False
         else:
             row.enabled = True
+        layout.prop(props, 'albedo_format')
         layout.prop(props, 'albedo_clear')
         if props.albedo_clear:
             layout.prop(props, 'albedo_clear_color')
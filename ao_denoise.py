@@ -0,0 +1,102 @@
+import numpy as np
+
+from .uv_raster import _neighbour_slices
+
+# B3 spline weights of the a-trous wavelet filter
+KERNEL = (1.0 / 16.0, 1.0 / 4.0, 3.0 / 8.0, 1.0 / 4.0, 1.0 / 16.0)
+# Number of texels filtered at once, bounds the memory used by the temporary arrays
+CHUNK_TEXELS = 1 << 20
+
+class TexelGuide:
+    """ Surface position, normal and UV island of the texels, computed per band of rows on demand """
+
+    def __init__(self, tri_index, barycentric, tri_positions, tri_normals, tri_islands):
+        self.tri_index = tri_index
+        self.barycentric = barycentric
+        self.tri_positions = tri_positions
+        self.tri_normals = tri_normals
+        self.tri_islands = tri_islands
+
+    def rows(self, start, stop):
+        """ Return the islands (-1 where nothing is covered), positions and normals of a band of rows
+
+        Positions and normals have shape (3, rows, columns), planes are faster to combine than
+        the last axis.
+        """
+        tri_index = self.tri_index[start:stop]
+        covered = tri_index >= 0
+        tris = tri_index[covered]
+        bary = self.barycentric[start:stop][covered]
+
+        islands = np.full(tri_index.shape, -1, dtype = np.int32)
+        islands[covered] = self.tri_islands[tris]
+        positions = np.zeros((3,) + tri_index.shape, dtype = np.float32)
+        positions[:, covered] = np.einsum('ni,nij->jn', bary, self.tri_positions[tris])
+        normals = np.zeros((3,) + tri_index.shape, dtype = np.float32)
+        normal = np.einsum('ni,nij->jn', bary, self.tri_normals[tris])
+        normals[:, covered] = normal / np.maximum(np.linalg.norm(normal, axis = 0), 1e-12)
+        return islands, positions, normals
+
+    def texel_size(self):
+        """ Median world space distance between horizontally adjacent texels of the same island """
+        sizes = []
+        height = self.tri_index.shape[0]
+        for start in range(0, height, max(1, height // 16)):
+            islands, positions, _ = self.rows(start, start + 1)
+            same = (islands[:, 1:] == islands[:, :-1]) & (islands[:, 1:] >= 0)
+            sizes.append(np.linalg.norm(positions[:, :, 1:] - positions[:, :, :-1], axis = 0)[same])
+        sizes = np.concatenate(sizes)
+        return float(np.median(sizes)) if len(sizes) > 0 else 1.0
+
+def denoise(values, guide, iterations = 3, position_scale = 2.0):
+    """ Smooth a single channel with an edge-avoiding a-trous filter guided by the surface
+
+    Texels only take values from texels of the same UV island whose position and normal
+    are close to theirs, so creases and island borders stay sharp. Each iteration doubles
+    the reach of the filter. Texels outside the UVs are left unchanged.
+    """
+    height, width = values.shape
+    texel_size = guide.texel_size()
+    band = max(1, CHUNK_TEXELS // width)
+
+    for i in range(iterations):
+        step = 1 << i
+        halo = 2 * step
+        sigma = texel_size * step * position_scale
+        result = values.copy()
+        for start in range(0, height, band):
+            stop = min(height, start + band)
+            top = max(0, start - halo)
+            bottom = min(height, stop + halo)
+            islands, positions, normals = guide.rows(top, bottom)
+            source = values[top:bottom]
+            rows = bottom - top
+
+            total = np.zeros((rows, width), dtype = np.float32)
+            weights = np.zeros((rows, width), dtype = np.float32)
+            for ky, wy in enumerate(KERNEL):
+                for kx, wx in enumerate(KERNEL):
+                    dst, src = _neighbour_slices((ky - 2) * step, (kx - 2) * step, rows, width)
+                    same = (islands[dst] == islands[src]) & (islands[src] >= 0)
+                    distance = np.zeros(same.shape, dtype = np.float32)
+                    facing = np.zeros(same.shape, dtype = np.float32)
+                    for c in range(3):
+                        offset = positions[c][dst] - positions[c][src]
+                        distance += offset * offset
+                        facing += normals[c][dst] * normals[c][src]
+                    # Cosine to the power of 32
+                    np.clip(facing, 0.0, 1.0, out = facing)
+                    for _ in range(5):
+                        facing *= facing
+                    weight = np.exp(distance * np.float32(-0.5 / (sigma * sigma)))
+                    weight *= facing
+                    weight *= same
+                    weight *= wy * wx
+                    total[dst] += weight * source[src]
+                    weights[dst] += weight
+
+            covered = islands[start - top:stop - top] >= 0
+            filtered = total[start - top:stop - top][covered] / weights[start - top:stop - top][covered]
+            result[start:stop][covered] = filtered
+        values = result
+    return values
@@ -30,9 +30,14 @@ class EPBRB_PT_ao_section(Panel):
             row.enabled = False
         else:
             row.enabled = True
+        layout.prop(props, 'ao_format')
         
         layout.prop(props, 'ao_samples')
         layout.prop(props, 'ao_distance')
+        layout.prop(props, 'ao_denoise')
+        row = layout.row()
+        row.prop(props, 'ao_denoise_iterations')
+        row.enabled = props.ao_denoise
 
         layout.prop(props, 'ao_clear')
         if props.ao_clear:
@@ -0,0 +1,100 @@
+import bpy
+
+from .atlas_uvs import generate_atlas_uvs, build_atlas_mesh
+from .batch_bake import EasyPBRBatchBake
+from .easy_pbr_bake import EasyPBRBake
+from .node_analysis import object_dependent_nodes
+
+# Name of the temporary object joining the objects of an atlas bake
+ATLAS_OBJECT = 'EasyPBRBake_atlas'
+
+class EasyPBRAtlasBake(EasyPBRBatchBake):
+    """ Bake the objects of the batch into one set of textures through a shared UV atlas
+
+    The objects are joined into a temporary object in world space, so each map takes a
+    single Cycles bake for the whole set, and the objects are hidden from rendering
+    while it is baked so they don't shadow it. Materials reading object coordinates or
+    properties see the joined object instead, the bake warns about them.
+    """
+    bl_idname = "object.easy_pbr_atlas_bake"
+    bl_label = "Atlas Bake"
+
+    def get_atlas_objects(self, context, props):
+        return [obj for _, obj in self.get_batch_objects(context, props) if obj is not None and obj.type == 'MESH']
+
+    def check(self, context, props):
+        if props.selected_to_active:
+            return 'Selected to Active is not supported in atlas mode'
+        if props.output_mode != 'TEXTURE':
+            return 'Atlas bakes only output textures'
+        objects = self.get_atlas_objects(context, props)
+        if len(objects) == 0:
+            return 'No objects to bake'
+        for obj in objects:
+            if not obj.visible_get():
+                return "'{}' is hidden".format(obj.name)
+            if props.atlas_generate_uvs:
+                if obj.data.uv_layers.active is None:
+                    return "'{}' has no UV map to build the atlas from".format(obj.name)
+            elif obj.data.uv_layers.get(props.atlas_uv_layer) is None:
+                return "'{}' has no UV map named '{}'".format(obj.name, props.atlas_uv_layer)
+        return None
+
+    def warn_object_dependent(self, objects):
+        """ Warn about the materials of the objects that shade differently on the joined object """
+        materials = []
+        for obj in objects:
+            for ms in obj.material_slots:
+                if ms.material is not None and ms.material.use_nodes and ms.material not in materials:
+                    materials.append(ms.material)
+        found = []
+        for material in materials:
+            names = object_dependent_nodes(material.node_tree)
+            if names:
+                found.append('{} ({})'.format(material.name, ', '.join(names)))
+        if found:
+            message = 'Atlas bake: nodes reading object coordinates or properties will see the joined object: ' + \
+                      ', '.join(found)
+            print(message)
+            self.report({'WARNING'}, message)
+
+    def run_steps(self, context, props):
+        """ Bake the joined objects one pass per step, returns an error message if they can't be baked """
+        view_layer = context.view_layer
+        objects = self.get_atlas_objects(context, props)
+        print('Atlas bake: ' + str(len(objects)) + ' objects')
+        self.warn_object_dependent(objects)
+
+        if props.atlas_generate_uvs:
+            # Keep the margin of both sides between the objects
+            padding = 2.0 * max(props.margin, 1) / min(props.x_res, props.y_res)
+            error = generate_atlas_uvs(objects, props.atlas_uv_layer, padding)
+            if error is not None:
+                return error
+
+        with self.bake_report.stage('atlas_setup'):
+            mesh = build_atlas_mesh(ATLAS_OBJECT, objects, context.evaluated_depsgraph_get(), props.atlas_uv_layer)
+            atlas = bpy.data.objects.new(ATLAS_OBJECT, mesh)
+            context.scene.collection.objects.link(atlas)
+
+        selection = list(context.selected_objects)
+        active = view_layer.objects.active
+        hidden = [(obj, obj.hide_render) for obj in objects]
+        try:
+            for obj in objects:
+                obj.hide_render = True
+            self.select_only(view_layer, atlas)
+            error = yield from self.bake_steps(context, atlas, props)
+        finally:
+            for obj, hide_render in hidden:
+                obj.hide_render = hide_render
+            bpy.data.objects.remove(atlas, do_unlink = True)
+            bpy.data.meshes.remove(mesh)
+            for obj in view_layer.objects:
+                obj.select_set(obj in selection)
+            view_layer.objects.active = active
+
+        return error
+
+    def finish_run(self, result):
+        return EasyPBRBake.finish_run(self, result)
@@ -0,0 +1,304 @@
+import bpy
+import numpy as np
+
+# Maximum number of UV maps of a mesh
+MAX_UV_LAYERS = 8
+
+# Property read and written for each attribute type, with its number of components and array type
+ATTRIBUTE_FIELDS = {
+    'FLOAT': ('value', 1, np.float32),
+    'INT': ('value', 1, np.int32),
+    'INT8': ('value', 1, np.int32),
+    'BOOLEAN': ('value', 1, bool),
+    'FLOAT2': ('vector', 2, np.float32),
+    'FLOAT_VECTOR': ('vector', 3, np.float32),
+    'FLOAT_COLOR': ('color', 4, np.float32),
+    'BYTE_COLOR': ('color', 4, np.float32)
+}
+# Attribute domains kept when meshes are joined, edges are rebuilt so their attributes are lost
+ATTRIBUTE_DOMAINS = ('POINT', 'FACE', 'CORNER')
+
+def pack_rectangles(sizes, padding):
+    """ Return the scale and the lower left corners of rectangles packed without overlap in the unit square
+
+    Rectangles keep their proportions and are all scaled by the largest factor for which
+    they fit in rows, tallest first, with padding between them.
+    """
+    sizes = np.maximum(np.asarray(sizes, dtype = np.float64), 1e-8)
+    order = np.argsort(-sizes[:, 1], kind = 'stable')
+
+    def shelf(scale):
+        positions = np.zeros_like(sizes)
+        x = y = row = 0.0
+        for i in order:
+            width, height = sizes[i] * scale
+            if x > 0.0 and x + width > 1.0:
+                x = 0.0
+                y += row + padding
+                row = 0.0
+            positions[i] = (x, y)
+            x += width + padding
+            row = max(row, height)
+        return positions, y + row
+
+    low, high = 0.0, 1.0 / sizes.max()
+    positions, height = shelf(high)
+    if height <= 1.0:
+        return high, positions
+    positions = shelf(low)[0]
+    for _ in range(40):
+        scale = 0.5 * (low + high)
+        scaled_positions, height = shelf(scale)
+        if height <= 1.0:
+            low, positions = scale, scaled_positions
+        else:
+            high = scale
+    return low, positions
+
+def _mesh_areas(obj, uvs):
+    """ Return the world space area and the UV area of the triangles of the mesh of an object """
+    mesh = obj.data
+    mesh.calc_loop_triangles()
+    num_tris = len(mesh.loop_triangles)
+    loops = np.empty(num_tris * 3, dtype = np.int32)
+    mesh.loop_triangles.foreach_get('loops', loops)
+    loop_vertices = np.empty(len(mesh.loops), dtype = np.int32)
+    mesh.loops.foreach_get('vertex_index', loop_vertices)
+    co = np.empty(len(mesh.vertices) * 3, dtype = np.float32)
+    mesh.vertices.foreach_get('co', co)
+
+    matrix = np.array(obj.matrix_world, dtype = np.float32)
+    co = co.reshape(-1, 3) @ matrix[:3, :3].T + matrix[:3, 3]
+    positions = co[loop_vertices[loops]].reshape(num_tris, 3, 3)
+    tri_uvs = uvs[loops].reshape(num_tris, 3, 2)
+
+    edges = positions[:, 1:] - positions[:, :1]
+    world_area = 0.5 * np.linalg.norm(np.cross(edges[:, 0], edges[:, 1]), axis = 1).sum()
+    uv_edges = tri_uvs[:, 1:] - tri_uvs[:, :1]
+    uv_area = 0.5 * np.abs(uv_edges[:, 0, 0] * uv_edges[:, 1, 1] - uv_edges[:, 0, 1] * uv_edges[:, 1, 0]).sum()
+    return world_area, uv_area
+
+def generate_atlas_uvs(objects, layer_name, padding):
+    """ Fill a UV map of the objects with their active UVs packed side by side without overlap
+
+    The UVs of each mesh are scaled so every object gets the same texel density, then
+    the meshes are packed in the unit square with padding between them. Objects sharing
+    a mesh share their part of the atlas. The atlas UV map is kept on the meshes, as the
+    baked textures need it, but the active UV map doesn't change.
+
+    Returns an error message if a UV map can't be added.
+    """
+    meshes = {}
+    for obj in objects:
+        meshes.setdefault(obj.data.as_pointer(), obj)
+
+    parts = []
+    for obj in meshes.values():
+        mesh = obj.data
+        uvs = np.empty(len(mesh.loops) * 2, dtype = np.float32)
+        mesh.uv_layers.active.data.foreach_get('uv', uvs)
+        uvs = uvs.reshape(-1, 2)
+        world_area, uv_area = _mesh_areas(obj, uvs)
+        # Scale of the UVs giving the same texel density as the other objects
+        density = np.sqrt(world_area / uv_area) if world_area > 0.0 and uv_area > 0.0 else 1.0
+        low = uvs.min(axis = 0) if len(uvs) > 0 else np.zeros(2, dtype = np.float32)
+        high = uvs.max(axis = 0) if len(uvs) > 0 else np.zeros(2, dtype = np.float32)
+        parts.append((mesh, uvs, low, (high - low) * density, density))
+
+    scale, positions = pack_rectangles([size for _, _, _, size, _ in parts], padding)
+
+    for (mesh, uvs, low, _, density), position in zip(parts, positions):
+        active_index = mesh.uv_layers.active_index
+        uv_layer = mesh.uv_layers.get(layer_name)
+        if uv_layer is None:
+            uv_layer = mesh.uv_layers.new(name = layer_name, do_init = False)
+            if uv_layer is None:
+                return "'{}' already has the maximum number of UV maps".format(mesh.name)
+        atlas_uvs = (uvs - low) * (density * scale) + position
+        uv_layer.data.foreach_set('uv', atlas_uvs.astype(np.float32).ravel())
+        mesh.uv_layers.active_index = active_index
+        mesh.update()
+    return None
+
+def _read_attributes(mesh):
+    """ Return the color and generic attributes of a mesh, and the name of the color attribute used for rendering
+
+    Attributes are (name, kind, domain, data type, values) with values of shape (elements, components).
+    kind is 'ATTRIBUTE' for generic attributes and 'VERTEX_COLOR' for the vertex color layers of
+    Blender versions without them.
+    """
+    attributes = []
+    names = set(uv_layer.name for uv_layer in mesh.uv_layers)
+    for attribute in getattr(mesh, 'attributes', ()):
+        if attribute.name.startswith('.') or attribute.name in names:
+            continue
+        if attribute.domain not in ATTRIBUTE_DOMAINS or attribute.data_type not in ATTRIBUTE_FIELDS:
+            continue
+        field, size, dtype = ATTRIBUTE_FIELDS[attribute.data_type]
+        values = np.empty(len(attribute.data) * size, dtype = dtype)
+        attribute.data.foreach_get(field, values)
+        attributes.append((attribute.name, 'ATTRIBUTE', attribute.domain, attribute.data_type, values.reshape(-1, size)))
+        names.add(attribute.name)
+
+    render_name = None
+    for layer in getattr(mesh, 'vertex_colors', ()):
+        if layer.active_render:
+            render_name = layer.name
+        if layer.name in names:
+            continue
+        values = np.empty(len(layer.data) * 4, dtype = np.float32)
+        layer.data.foreach_get('color', values)
+        attributes.append((layer.name, 'VERTEX_COLOR', 'CORNER', 'BYTE_COLOR', values.reshape(-1, 4)))
+        names.add(layer.name)
+
+    color_attributes = getattr(mesh, 'color_attributes', None)
+    if color_attributes is not None and 0 <= color_attributes.render_color_index < len(color_attributes):
+        render_name = color_attributes[color_attributes.render_color_index].name
+    return attributes, render_name
+
+def _write_attributes(mesh, layouts, parts, domain_sizes, render_name):
+    """ Add the attributes read from the joined meshes to the new mesh
+
+    layouts maps the attribute names to the (kind, domain, data type) of their first mesh. The
+    elements of the meshes without an attribute, or with a different layout, are zeros.
+    """
+    for name, (kind, domain, data_type) in layouts.items():
+        if name in mesh.uv_layers or name in getattr(mesh, 'attributes', ()):
+            continue
+        field, size, dtype = ATTRIBUTE_FIELDS[data_type]
+        values = []
+        for attributes, sizes in zip(parts, domain_sizes):
+            part_values = attributes.get(name)
+            if part_values is None or part_values[:3] != (kind, domain, data_type):
+                values.append(np.zeros((sizes[domain], size), dtype = dtype))
+            else:
+                values.append(part_values[3])
+        if kind == 'VERTEX_COLOR':
+            layer = mesh.vertex_colors.new(name = name)
+            if layer is None:
+                continue
+            data = layer.data
+        else:
+            data = mesh.attributes.new(name, data_type, domain).data
+        data.foreach_set(field, np.concatenate(values).astype(dtype).ravel())
+
+    if render_name is None:
+        return
+    color_attributes = getattr(mesh, 'color_attributes', None)
+    if color_attributes is not None:
+        for index, attribute in enumerate(color_attributes):
+            if attribute.name == render_name:
+                color_attributes.render_color_index = index
+                color_attributes.active_color = attribute
+    elif render_name in mesh.vertex_colors:
+        mesh.vertex_colors[render_name].active_render = True
+
+def build_atlas_mesh(name, objects, depsgraph, layer_name):
+    """ Return a new mesh joining the evaluated meshes of objects, in world space
+
+    The material slots of the objects are merged, and every UV map, vertex color and
+    generic point, face or corner attribute is copied, filled with zeros for the objects
+    without it. The UV map named layer_name is the active one. Loop normals are kept as
+    custom normals, so the shading doesn't change.
+    """
+    materials = []
+    uv_names = [layer_name]
+    render_name = None
+    layouts = {}
+    render_color = None
+    parts = []
+    part_attributes = []
+    domain_sizes = []
+    for obj in objects:
+        slots = []
+        for ms in obj.material_slots:
+            if ms.material not in materials:
+                materials.append(ms.material)
+            slots.append(materials.index(ms.material))
+        if len(slots) == 0:
+            # Objects without materials make the bake fail like they do alone
+            if None not in materials:
+                materials.append(None)
+            slots.append(materials.index(None))
+
+        eval_obj = obj.evaluated_get(depsgraph)
+        mesh = eval_obj.to_mesh()
+        try:
+            mesh.calc_normals_split()
+            co = np.empty(len(mesh.vertices) * 3, dtype = np.float32)
+            mesh.vertices.foreach_get('co', co)
+            loop_vertices = np.empty(len(mesh.loops), dtype = np.int32)
+            mesh.loops.foreach_get('vertex_index', loop_vertices)
+            normals = np.empty(len(mesh.loops) * 3, dtype = np.float32)
+            mesh.loops.foreach_get('normal', normals)
+            num_faces = len(mesh.polygons)
+            loop_starts = np.empty(num_faces, dtype = np.int32)
+            mesh.polygons.foreach_get('loop_start', loop_starts)
+            loop_totals = np.empty(num_faces, dtype = np.int32)
+            mesh.polygons.foreach_get('loop_total', loop_totals)
+            material_indices = np.empty(num_faces, dtype = np.int32)
+            mesh.polygons.foreach_get('material_index', material_indices)
+            smooth = np.empty(num_faces, dtype = bool)
+            mesh.polygons.foreach_get('use_smooth', smooth)
+            uvs = {}
+            for uv_layer in mesh.uv_layers:
+                layer_uvs = np.empty(len(mesh.loops) * 2, dtype = np.float32)
+                uv_layer.data.foreach_get('uv', layer_uvs)
+                uvs[uv_layer.name] = layer_uvs.reshape(-1, 2)
+                if uv_layer.name not in uv_names:
+                    uv_names.append(uv_layer.name)
+                if uv_layer.active_render and render_name is None:
+                    render_name = uv_layer.name
+            attributes, mesh_render_color = _read_attributes(mesh)
+        finally:
+            eval_obj.to_mesh_clear()
+
+        matrix = np.array(obj.matrix_world, dtype = np.float32)
+        co = co.reshape(-1, 3) @ matrix[:3, :3].T + matrix[:3, 3]
+        normals = normals.reshape(-1, 3) @ np.linalg.inv(matrix[:3, :3])
+        normals /= np.maximum(np.linalg.norm(normals, axis = 1, keepdims = True), 1e-12)
+        slots = np.array(slots, dtype = np.int32)
+        material_indices = slots[np.clip(material_indices, 0, len(slots) - 1)]
+        parts.append((co, loop_vertices, normals, loop_starts, loop_totals, material_indices, smooth, uvs))
+        for attribute_name, kind, domain, data_type, values in attributes:
+            layouts.setdefault(attribute_name, (kind, domain, data_type))
+        part_attributes.append({attribute_name: (kind, domain, data_type, values)
+                                for attribute_name, kind, domain, data_type, values in attributes})
+        domain_sizes.append({'POINT': len(co), 'FACE': num_faces, 'CORNER': len(loop_vertices)})
+        if render_color is None:
+            render_color = mesh_render_color
+
+    vertex_offsets = np.cumsum([0] + [len(part[0]) for part in parts])
+    loop_offsets = np.cumsum([0] + [len(part[1]) for part in parts])
+
+    atlas_mesh = bpy.data.meshes.new(name)
+    atlas_mesh.vertices.add(int(vertex_offsets[-1]))
+    atlas_mesh.vertices.foreach_set('co', np.concatenate([part[0] for part in parts]).ravel())
+    atlas_mesh.loops.add(int(loop_offsets[-1]))
+    atlas_mesh.loops.foreach_set('vertex_index', np.concatenate(
+        [part[1] + offset for part, offset in zip(parts, vertex_offsets)]).astype(np.int32))
+    atlas_mesh.polygons.add(sum(len(part[3]) for part in parts))
+    atlas_mesh.polygons.foreach_set('loop_start', np.concatenate(
+        [part[3] + offset for part, offset in zip(parts, loop_offsets)]).astype(np.int32))
+    atlas_mesh.polygons.foreach_set('loop_total', np.concatenate([part[4] for part in parts]))
+    atlas_mesh.polygons.foreach_set('material_index', np.concatenate([part[5] for part in parts]))
+    atlas_mesh.polygons.foreach_set('use_smooth', np.concatenate([part[6] for part in parts]))
+    atlas_mesh.update(calc_edges = True)
+
+    for uv_name in uv_names[:MAX_UV_LAYERS]:
+        uv_layer = atlas_mesh.uv_layers.new(name = uv_name, do_init = False)
+        uv_layer.data.foreach_set('uv', np.concatenate(
+            [part[7].get(uv_name, np.zeros((len(part[1]), 2), dtype = np.float32)) for part in parts]).ravel())
+    atlas_mesh.uv_layers.active = atlas_mesh.uv_layers[layer_name]
+    # Textures without a UV map node are sampled with the render UV map
+    if render_name is not None and render_name in atlas_mesh.uv_layers:
+        atlas_mesh.uv_layers[render_name].active_render = True
+    _write_attributes(atlas_mesh, layouts, part_attributes, domain_sizes, render_color)
+
+    for material in materials:
+        atlas_mesh.materials.append(material)
+
+    if hasattr(atlas_mesh, 'use_auto_smooth'):
+        atlas_mesh.use_auto_smooth = True
+    atlas_mesh.normals_split_custom_set(np.concatenate([part[2] for part in parts]))
+    return atlas_mesh
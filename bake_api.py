@@ -0,0 +1,67 @@
+import os
+
+import bpy
+
+class ArrayCapture:
+    """ Maps kept in memory by a bake started from bake_to_arrays """
+
+    def __init__(self, write_files):
+        self.write_files = write_files
+        self.arrays = {}
+        self.error = None
+
+    def add(self, file_path, values):
+        """ Keep the values of a texture under the name of its file, without extension """
+        self.arrays[os.path.splitext(os.path.basename(file_path))[0]] = values
+
+_capture = None
+
+def get_capture():
+    """ Return the capture of the running bake_to_arrays call, None when the bake was started otherwise """
+    return _capture
+
+def bake_to_arrays(obj = None, write_files = False, **settings):
+    """ Bake the enabled maps of an object and return them as NumPy arrays keyed by texture name
+
+    Runs the same plan as the Bake Textures operator in the current Blender process.
+    Textures are float32 arrays with shape (rows, columns, channels), rows from bottom
+    to top, holding the values that are saved to the files (sRGB encoded for 8 bit color
+    maps). Smaller sizes and tiles are keyed by their file names. Vertex color layers are
+    arrays of linear RGBA colors with shape (loops, 4).
+
+    obj defaults to the active object. settings are EasyPBRBakeProp values used for this
+    bake only. Files are only written when write_files is set, and the bake cache is only
+    used then. Raises RuntimeError if the bake fails.
+    """
+    global _capture
+    context = bpy.context
+    view_layer = context.view_layer
+    props = context.scene.easy_pbr_bake_props
+    active = view_layer.objects.active
+    if obj is None:
+        obj = active
+    if obj is None:
+        raise RuntimeError('No object to bake')
+
+    saved = {name: getattr(props, name) for name in settings}
+    selected = obj.select_get()
+    capture = ArrayCapture(write_files)
+    try:
+        for name, value in settings.items():
+            setattr(props, name, value)
+        view_layer.objects.active = obj
+        obj.select_set(True)
+        _capture = capture
+        result = bpy.ops.object.easy_pbr_bake()
+    finally:
+        _capture = None
+        for name, value in saved.items():
+            setattr(props, name, value)
+        obj.select_set(selected)
+        view_layer.objects.active = active
+
+    if capture.error is not None:
+        raise RuntimeError(capture.error)
+    if 'CANCELLED' in result:
+        raise RuntimeError('Bake cancelled')
+    return capture.arrays
@@ -0,0 +1,314 @@
+""" Benchmark Easy PBR Bake on synthetic scenes built inside background Blender
+
+Usage:
+    python bake_benchmark.py [options]
+
+Options:
+    --blender PATH          Blender executable (default: blender)
+    --scenes NAME,...       Only run these scenes (default: every scene of the suite)
+    --quick                 Only run the scenes up to 2K
+    --repeat N              Runs of each scene, the median is kept (default: 1)
+    --threads N             Cycles threads of the Blender process (default: all cores)
+    --output FILE           Write the results to a file
+    --baseline FILE         Compare the results against a baseline written with --output
+    --tolerance PERCENT     Slowdown reported as a regression (default: 10)
+
+Every scene runs in its own Blender process so the peak memory of one scene doesn't
+hide the next one. The scenes are generated from fixed parameters, so results of
+different versions of the add-on can be compared on the same machine. For each scene
+the wall time of each map, the time spent in Cycles, the Python overhead around it and
+the peak resident memory are recorded.
+"""
+
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+ADDON_DIR = os.path.dirname(os.path.abspath(__file__))
+MAP_KEYS = ('albedo', 'metallic', 'roughness', 'ao', 'normal')
+ALL_MAPS = list(MAP_KEYS)
+
+# Metrics compared against the baseline, lower is better
+METRICS = ('total_seconds', 'cycles_seconds', 'python_seconds', 'peak_memory_mb')
+
+def _scene(name, resolution, slots = 1, segments = 32, maps = ALL_MAPS, pack_channels = False,
+           selected_to_active = False):
+    return {
+        'name': name,
+        'resolution': resolution,
+        'slots': slots,
+        'segments': segments,
+        'maps': list(maps),
+        'pack_channels': pack_channels,
+        'selected_to_active': selected_to_active
+    }
+
+SCENES = [
+    _scene('base_512', 512),
+    _scene('base_1k', 1024),
+    _scene('base_2k', 2048),
+    _scene('base_4k', 4096),
+    _scene('base_8k', 8192, maps = ['albedo', 'roughness', 'normal']),
+    _scene('slots_8_1k', 1024, slots = 8),
+    _scene('slots_32_1k', 1024, slots = 32),
+    _scene('polys_high_1k', 1024, segments = 512),
+    _scene('albedo_only_2k', 2048, maps = ['albedo']),
+    _scene('scalars_2k', 2048, maps = ['metallic', 'roughness', 'ao']),
+    _scene('packed_2k', 2048, maps = ['metallic', 'roughness', 'ao'], pack_channels = True),
+    _scene('packed_slots_8_2k', 2048, slots = 8, maps = ['metallic', 'roughness', 'ao'], pack_channels = True),
+    _scene('selected_to_active_1k', 1024, selected_to_active = True),
+    _scene('selected_to_active_4k', 4096, segments = 128, maps = ['albedo', 'normal'], selected_to_active = True)
+]
+
+########### Inside Blender #######################
+
+def build_material(bpy, index, slots):
+    """ Principled material whose inputs mix procedural textures and constants """
+    material = bpy.data.materials.new('Benchmark_{}'.format(index))
+    material.use_nodes = True
+    nodes = material.node_tree.nodes
+    links = material.node_tree.links
+    principled = nodes['Principled BSDF']
+
+    # Procedural base color and roughness need Cycles, metallic is a constant
+    noise = nodes.new('ShaderNodeTexNoise')
+    noise.inputs['Scale'].default_value = 4.0 + index
+    ramp = nodes.new('ShaderNodeValToRGB')
+    ramp.color_ramp.elements[0].color = (index / max(1, slots), 0.2, 0.1, 1.0)
+    links.new(noise.outputs['Fac'], ramp.inputs['Fac'])
+    links.new(ramp.outputs['Color'], principled.inputs['Base Color'])
+    links.new(noise.outputs['Fac'], principled.inputs['Roughness'])
+    principled.inputs['Metallic'].default_value = (index % 2) * 1.0
+
+    # Bump so the normal map isn't flat
+    bump = nodes.new('ShaderNodeBump')
+    bump.inputs['Strength'].default_value = 0.3
+    links.new(noise.outputs['Fac'], bump.inputs['Height'])
+    links.new(bump.outputs['Normal'], principled.inputs['Normal'])
+    return material
+
+def build_scene(bpy, scene_def):
+    """ Replace the open file with the synthetic scene, return the object to bake """
+    bpy.ops.wm.read_factory_settings(use_empty = True)
+    scene = bpy.context.scene
+    scene.render.engine = 'CYCLES'
+    scene.cycles.samples = 1
+    scene.cycles.seed = 0
+
+    segments = scene_def['segments']
+    bpy.ops.mesh.primitive_uv_sphere_add(segments = segments, ring_count = max(3, segments // 2))
+    obj = bpy.context.active_object
+    obj.name = 'Benchmark'
+
+    slots = scene_def['slots']
+    for i in range(slots):
+        obj.data.materials.append(build_material(bpy, i, slots))
+    for polygon in obj.data.polygons:
+        polygon.material_index = polygon.index % slots
+
+    if scene_def['selected_to_active']:
+        # The high poly object is a denser, slightly bigger sphere
+        bpy.ops.mesh.primitive_uv_sphere_add(segments = segments * 4, ring_count = segments * 2, radius = 1.02)
+        high = bpy.context.active_object
+        high.name = 'Benchmark_high'
+        high.data.materials.append(obj.data.materials[0])
+        high.select_set(True)
+        obj.select_set(True)
+        bpy.context.view_layer.objects.active = obj
+    return obj
+
+def run_scene(scene_def, result_path):
+    """ Build a scene, bake it and write the timings """
+    import bpy
+    sys.path.insert(0, ADDON_DIR)
+    from headless_bake import import_addon
+
+    result = {'name': scene_def['name'], 'status': 'FAILED'}
+    try:
+        # Loading factory settings unregisters add-ons, build the scene first
+        build_scene(bpy, scene_def)
+        addon = import_addon()
+        props = bpy.context.scene.easy_pbr_bake_props
+        with tempfile.TemporaryDirectory(prefix = 'easy_pbr_bench_') as dir_path:
+            props.dir_path = dir_path + os.sep
+            props.autonames = True
+            props.base_name = scene_def['name']
+            props.x_res = scene_def['resolution']
+            props.y_res = scene_def['resolution']
+            props.use_cache = False
+            props.pack_channels = scene_def['pack_channels']
+            props.selected_to_active = scene_def['selected_to_active']
+            props.cage_extrusion = 0.05
+            for key in MAP_KEYS:
+                setattr(props, 'enable_' + key, key in scene_def['maps'])
+
+            start = time.perf_counter()
+            status = bpy.ops.object.easy_pbr_bake()
+            wall_time = time.perf_counter() - start
+
+        if 'CANCELLED' in status:
+            result['error'] = 'Bake cancelled'
+        else:
+            result.update(summarize(addon.bake_report.get_last_report(), wall_time))
+            result['status'] = 'FINISHED'
+    except Exception as e:
+        result['error'] = str(e)
+
+    with open(result_path, 'w') as file:
+        json.dump(result, file)
+
+def summarize(report, wall_time):
+    """ Reduce a bake report to the benchmark metrics """
+    map_seconds = {}
+    for entry in report['stages']:
+        maps = entry.get('maps')
+        if not maps:
+            continue
+        # Stages shared by several maps are split evenly between them
+        for key in maps:
+            map_seconds[key] = map_seconds.get(key, 0.0) + entry['seconds'] / len(maps)
+    cycles_seconds = report['stage_seconds'].get('cycles_bake', 0.0)
+    return {
+        'total_seconds': wall_time,
+        'cycles_seconds': cycles_seconds,
+        'python_seconds': wall_time - cycles_seconds,
+        'peak_memory_mb': report['peak_memory_mb'],
+        'map_seconds': map_seconds,
+        'stage_seconds': report['stage_seconds']
+    }
+
+########### Driver #######################
+
+def run_in_blender(blender, scene_def, threads, work_dir):
+    """ Run one scene in a new background Blender process and return its result """
+    scene_path = os.path.join(work_dir, scene_def['name'] + '.json')
+    result_path = os.path.join(work_dir, scene_def['name'] + '_result.json')
+    with open(scene_path, 'w') as file:
+        json.dump(scene_def, file)
+
+    command = [blender, '--background', '--factory-startup', '--python-exit-code', '1']
+    if threads:
+        command += ['--threads', str(threads)]
+    command += ['--python', os.path.abspath(__file__), '--', '--scene', scene_path, result_path]
+    process = subprocess.run(command, stdout = subprocess.PIPE, stderr = subprocess.STDOUT, universal_newlines = True)
+    try:
+        with open(result_path) as file:
+            result = json.load(file)
+        os.remove(result_path)
+    except (OSError, ValueError):
+        result = {'name': scene_def['name'], 'status': 'FAILED', 'error': 'Blender exited without result'}
+    if result['status'] == 'FAILED':
+        result['log'] = process.stdout[-4000:]
+    return result
+
+def median_result(results):
+    """ Keep the run with the median total time """
+    results = sorted(results, key = lambda result: result['total_seconds'])
+    return results[len(results) // 2]
+
+def blender_version(blender):
+    try:
+        output = subprocess.run([blender, '--version'], stdout = subprocess.PIPE, universal_newlines = True).stdout
+        return output.splitlines()[0].strip()
+    except (OSError, IndexError):
+        return None
+
+def compare(results, baseline, tolerance):
+    """ Print the change of every metric against the baseline, return the regressed (scene, metric) pairs """
+    regressions = []
+    baseline_scenes = baseline.get('scenes', {})
+    print('{:<26}{:>16}{:>12}{:>12}{:>9}'.format('Scene', 'Metric', 'Baseline', 'Current', 'Change'))
+    for name, result in results['scenes'].items():
+        old = baseline_scenes.get(name)
+        if result['status'] != 'FINISHED' or old is None or old.get('status') != 'FINISHED':
+            continue
+        for metric in METRICS:
+            if result.get(metric) is None or not old.get(metric):
+                continue
+            change = (result[metric] - old[metric]) / old[metric] * 100
+            flag = ''
+            if change > tolerance:
+                flag = '  REGRESSION'
+                regressions.append((name, metric))
+            print('{:<26}{:>16}{:>12.2f}{:>12.2f}{:>8.1f}%{}'.format(name, metric, old[metric], result[metric], change, flag))
+    return regressions
+
+def parse_args(argv):
+    options = {'blender': 'blender', 'scenes': None, 'quick': False, 'repeat': 1, 'threads': 0,
+               'output': None, 'baseline': None, 'tolerance': 10.0}
+    i = 0
+    while i < len(argv):
+        name = argv[i][2:].replace('-', '_')
+        if name not in options:
+            raise SystemExit('Unknown option ' + argv[i])
+        if name == 'quick':
+            options['quick'] = True
+            i += 1
+            continue
+        value = argv[i + 1]
+        if name == 'scenes':
+            value = value.split(',')
+        elif name in ('repeat', 'threads'):
+            value = int(value)
+        elif name == 'tolerance':
+            value = float(value)
+        options[name] = value
+        i += 2
+    return options
+
+def main(argv):
+    if '--scene' in argv:
+        index = argv.index('--scene')
+        with open(argv[index + 1]) as file:
+            run_scene(json.load(file), argv[index + 2])
+        return 0
+
+    options = parse_args(argv)
+    scenes = SCENES
+    if options['scenes'] is not None:
+        scenes = [scene_def for scene_def in SCENES if scene_def['name'] in options['scenes']]
+    if options['quick']:
+        scenes = [scene_def for scene_def in scenes if scene_def['resolution'] <= 2048]
+
+    results = {
+        'blender': blender_version(options['blender']),
+        'machine': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'threads': options['threads'],
+        'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'scenes': {}
+    }
+    with tempfile.TemporaryDirectory(prefix = 'easy_pbr_bench_') as work_dir:
+        for scene_def in scenes:
+            runs = [run_in_blender(options['blender'], scene_def, options['threads'], work_dir)
+                    for _ in range(options['repeat'])]
+            failed = [run for run in runs if run['status'] == 'FAILED']
+            result = failed[0] if failed else median_result(runs)
+            result['scene'] = scene_def
+            results['scenes'][scene_def['name']] = result
+            if failed:
+                print('{}: FAILED ({})'.format(scene_def['name'], result['error']))
+            else:
+                print('{}: {:.2f}s total, {:.2f}s Cycles, {:.2f}s Python, {} MB peak'.format(
+                    scene_def['name'], result['total_seconds'], result['cycles_seconds'],
+                    result['python_seconds'], result['peak_memory_mb']))
+
+    if options['output']:
+        with open(options['output'], 'w') as file:
+            json.dump(results, file, indent = 2)
+
+    failed = [name for name, result in results['scenes'].items() if result['status'] == 'FAILED']
+    regressions = []
+    if options['baseline']:
+        with open(options['baseline']) as file:
+            regressions = compare(results, json.load(file), options['tolerance'])
+        print('{} regressions over {:.0f}%'.format(len(regressions), options['tolerance']))
+    return 1 if failed or regressions else 0
+
+if __name__ == "__main__":
+    args = sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else sys.argv[1:]
+    sys.exit(main(args))
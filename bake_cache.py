@@ -0,0 +1,301 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import bpy
+import numpy as np
+
+# Increase to invalidate every cached bake when the baking code changes its output
+CACHE_VERSION = 1
+CACHE_DIR = '.easy_pbr_bake_cache'
+INDEX_FILE = 'index.json'
+
+# Node properties that don't change the result of a shader
+IGNORED_NODE_PROPERTIES = {'rna_type', 'type', 'location', 'width', 'width_hidden', 'height', 'dimensions',
+                           'name', 'label', 'inputs', 'outputs', 'internal_links', 'parent', 'use_custom_color',
+                           'color', 'select', 'show_options', 'show_preview', 'hide', 'mute', 'show_texture',
+                           'bl_idname', 'bl_label', 'bl_description', 'bl_icon', 'bl_static_type', 'bl_width_default',
+                           'bl_width_min', 'bl_width_max', 'bl_height_default', 'bl_height_min', 'bl_height_max'}
+
+def _update(hasher, value):
+    """ Add a value to a hash """
+    if isinstance(value, np.ndarray):
+        hasher.update(value.tobytes())
+    else:
+        hasher.update(repr(value).encode('utf-8'))
+
+def _value(value):
+    """ Return a hashable description of an RNA property value """
+    if isinstance(value, bpy.types.Image):
+        # Images are identified by their file as well
+        try:
+            mtime = os.path.getmtime(bpy.path.abspath(value.filepath_raw))
+        except OSError:
+            mtime = None
+        return (value.name, value.filepath_raw, mtime, value.is_dirty)
+    if isinstance(value, bpy.types.ID):
+        return value.name
+    if isinstance(value, str):
+        return value
+    try:
+        return tuple(value)
+    except TypeError:
+        return value
+
+def _hash_node(hasher, node, visited):
+    """ Add a node and every node upstream of it to a hash """
+    if node.as_pointer() in visited:
+        _update(hasher, ('visited', node.name))
+        return
+    visited.add(node.as_pointer())
+
+    _update(hasher, node.bl_idname)
+    for prop in node.bl_rna.properties:
+        if prop.identifier in IGNORED_NODE_PROPERTIES or prop.type == 'COLLECTION':
+            continue
+        value = getattr(node, prop.identifier)
+        if prop.type == 'POINTER' and value is not None and not isinstance(value, bpy.types.ID):
+            continue
+        _update(hasher, (prop.identifier, _value(value)))
+
+    if getattr(node, 'color_ramp', None) is not None:
+        ramp = node.color_ramp
+        _update(hasher, (ramp.interpolation, ramp.color_mode, [(e.position, tuple(e.color)) for e in ramp.elements]))
+    if getattr(node, 'mapping', None) is not None and hasattr(node.mapping, 'curves'):
+        _update(hasher, [[tuple(p.location) for p in curve.points] for curve in node.mapping.curves])
+    if getattr(node, 'node_tree', None) is not None:
+        # Node group, hash every node inside it
+        for inner in node.node_tree.nodes:
+            _hash_node(hasher, inner, visited)
+        _update(hasher, [(l.from_node.name, l.from_socket.identifier, l.to_node.name, l.to_socket.identifier)
+                         for l in node.node_tree.links])
+
+    for input_socket in node.inputs:
+        _hash_socket(hasher, input_socket, visited)
+
+def _hash_socket(hasher, input_socket, visited):
+    """ Add an input socket and everything linked to it to a hash """
+    _update(hasher, input_socket.identifier)
+    if input_socket.is_linked:
+        link = input_socket.links[0]
+        _update(hasher, ('link', link.from_socket.identifier))
+        _hash_node(hasher, link.from_node, visited)
+    elif hasattr(input_socket, 'default_value'):
+        _update(hasher, _value(input_socket.default_value))
+
+def socket_hash(input_socket):
+    """ Hash of the part of a node tree that feeds an input socket """
+    hasher = hashlib.sha1()
+    _hash_socket(hasher, input_socket, set())
+    return hasher.hexdigest()
+
+def mesh_hash(obj, depsgraph):
+    """ Hash of the evaluated geometry, normals, UVs and material indices of an object """
+    hasher = hashlib.sha1()
+    eval_obj = obj.evaluated_get(depsgraph)
+    mesh = eval_obj.to_mesh()
+    try:
+        co = np.empty(len(mesh.vertices) * 3, dtype = np.float32)
+        mesh.vertices.foreach_get('co', co)
+        _update(hasher, co)
+
+        loop_vertices = np.empty(len(mesh.loops), dtype = np.int32)
+        mesh.loops.foreach_get('vertex_index', loop_vertices)
+        _update(hasher, loop_vertices)
+
+        loop_starts = np.empty(len(mesh.polygons), dtype = np.int32)
+        mesh.polygons.foreach_get('loop_start', loop_starts)
+        _update(hasher, loop_starts)
+
+        material_indices = np.empty(len(mesh.polygons), dtype = np.int32)
+        mesh.polygons.foreach_get('material_index', material_indices)
+        _update(hasher, material_indices)
+
+        # Loop normals include smooth shading and custom normals
+        mesh.calc_normals_split()
+        normals = np.empty(len(mesh.loops) * 3, dtype = np.float32)
+        mesh.loops.foreach_get('normal', normals)
+        _update(hasher, normals)
+
+        if mesh.uv_layers.active is not None:
+            uvs = np.empty(len(mesh.loops) * 2, dtype = np.float32)
+            mesh.uv_layers.active.data.foreach_get('uv', uvs)
+            _update(hasher, (mesh.uv_layers.active.name, uvs))
+    finally:
+        eval_obj.to_mesh_clear()
+
+    _update(hasher, np.array(obj.matrix_world, dtype = np.float32))
+    return hasher.hexdigest()
+
+# Object types whose geometry Cycles renders
+GEOMETRY_TYPES = {'MESH', 'CURVE', 'SURFACE', 'META', 'FONT'}
+
+def _world_bounds(bound_box, matrix):
+    """ Return the corners of the world space bounding box of local bounds """
+    matrix = np.array(matrix, dtype = np.float64)
+    corners = np.array(bound_box, dtype = np.float64) @ matrix[:3, :3].T + matrix[:3, 3]
+    return corners.min(axis = 0), corners.max(axis = 0)
+
+def occluders_hash(obj, depsgraph, distance):
+    """ Hash of the render visible geometry, other than the object, that ambient occlusion rays of
+    some length can reach from it
+
+    Objects and instances are only hashed when their bounds are within distance of the
+    bounds of the object.
+    """
+    low, high = _world_bounds(obj.bound_box, obj.matrix_world)
+    low -= distance
+    high += distance
+    geometry = {}
+    entries = []
+    for instance in depsgraph.object_instances:
+        other = instance.object
+        if other.type not in GEOMETRY_TYPES or other.original == obj or other.original.hide_render:
+            continue
+        other_low, other_high = _world_bounds(other.bound_box, instance.matrix_world)
+        if (other_low > high).any() or (other_high < low).any():
+            continue
+        if other.name not in geometry:
+            hasher = hashlib.sha1()
+            mesh = other.to_mesh()
+            try:
+                co = np.empty(len(mesh.vertices) * 3, dtype = np.float32)
+                mesh.vertices.foreach_get('co', co)
+                _update(hasher, co)
+                loop_vertices = np.empty(len(mesh.loops), dtype = np.int32)
+                mesh.loops.foreach_get('vertex_index', loop_vertices)
+                _update(hasher, loop_vertices)
+            finally:
+                other.to_mesh_clear()
+            geometry[other.name] = hasher.hexdigest()
+        entries.append((other.name, geometry[other.name],
+                        tuple(np.array(instance.matrix_world, dtype = np.float32).ravel())))
+
+    hasher = hashlib.sha1()
+    _update(hasher, sorted(entries))
+    return hasher.hexdigest()
+
+def combine_hash(*values):
+    """ Hash of several values """
+    hasher = hashlib.sha1()
+    _update(hasher, CACHE_VERSION)
+    for value in values:
+        _update(hasher, value)
+    return hasher.hexdigest()
+
+class BakeCache:
+    """ Baked textures stored by the hash of everything they were baked from
+
+    The index records which key produced each output file, so unchanged files can be
+    skipped. Cached copies of the files allow restoring maps after they were rebaked
+    with other settings. The modification time of a copy is updated when it is used,
+    and the least recently used copies are removed once they take more than max_size
+    bytes.
+
+    Several processes may share the cache, the index is merged with the one on disk
+    when it is saved and replaced atomically.
+    """
+
+    def __init__(self, dir_path, max_size):
+        self.cache_path = os.path.join(dir_path, CACHE_DIR)
+        self.index_path = os.path.join(self.cache_path, INDEX_FILE)
+        self.max_size = max_size
+        self.index = self.load_index()
+        # Entries set by this process, kept over the ones on disk when saving
+        self.changed = {}
+
+    def load_index(self):
+        try:
+            with open(self.index_path) as file:
+                index = json.load(file)
+        except (OSError, ValueError):
+            return {}
+        return index if isinstance(index, dict) else {}
+
+    def cached_file(self, key, file_path):
+        return os.path.join(self.cache_path, key + os.path.splitext(file_path)[1])
+
+    def is_current(self, file_path, key):
+        """ True if the file exists and was produced from the key """
+        entry = self.index.get(file_path)
+        if entry is None or entry['key'] != key:
+            return False
+        try:
+            return os.path.getmtime(file_path) == entry['mtime']
+        except OSError:
+            return False
+
+    def has(self, file_path, key):
+        """ True if the map with the key can be skipped or restored """
+        return self.is_current(file_path, key) or os.path.exists(self.cached_file(key, file_path))
+
+    def touch(self, key, file_path):
+        """ Mark the cached copy of a map as used """
+        try:
+            os.utime(self.cached_file(key, file_path))
+        except OSError:
+            pass
+
+    def set_entry(self, file_path, key):
+        entry = {'key': key, 'mtime': os.path.getmtime(file_path)}
+        self.index[file_path] = entry
+        self.changed[file_path] = entry
+
+    def restore(self, file_path, key):
+        """ Make the file at file_path hold the map baked from the key """
+        self.touch(key, file_path)
+        if self.is_current(file_path, key):
+            return
+        shutil.copyfile(self.cached_file(key, file_path), file_path)
+        self.set_entry(file_path, key)
+
+    def store(self, file_path, key):
+        """ Keep a copy of a newly baked file """
+        os.makedirs(self.cache_path, exist_ok = True)
+        shutil.copyfile(file_path, self.cached_file(key, file_path))
+        self.set_entry(file_path, key)
+
+    def evict(self):
+        """ Remove the least recently used copies until the others fit in max_size """
+        copies = []
+        try:
+            with os.scandir(self.cache_path) as entries:
+                for entry in entries:
+                    if entry.is_file() and entry.name != INDEX_FILE and not entry.name.endswith('.tmp'):
+                        stat = entry.stat()
+                        copies.append((stat.st_mtime, stat.st_size, entry.path))
+        except OSError:
+            return
+        total = sum(size for _, size, _ in copies)
+        for _, size, path in sorted(copies):
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+
+    def save(self):
+        """ Merge the entries set by this process into the index on disk, then remove old copies """
+        if not self.changed:
+            return
+        os.makedirs(self.cache_path, exist_ok = True)
+        index = self.load_index()
+        index.update(self.changed)
+        handle, temp_path = tempfile.mkstemp(dir = self.cache_path, prefix = INDEX_FILE, suffix = '.tmp')
+        try:
+            with os.fdopen(handle, 'w') as file:
+                json.dump(index, file, indent = 1)
+            os.replace(temp_path, self.index_path)
+        except BaseException:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise
+        self.index = index
+        self.changed = {}
+        self.evict()
@@ -0,0 +1,128 @@
+import json
+import os
+import tempfile
+import threading
+
+import bpy
+
+from .bake_rig import BAKE_COPY_TAG
+
+JOURNAL_DIR = '.easy_pbr_bake_journal'
+JOURNAL_VERSION = 1
+
+class BakeJournal:
+    """ Progress of the bake of an object, kept next to its textures so an interrupted run can be resumed
+
+    Every file is checkpointed with the key of the settings it was baked from once it is
+    completely written, and the bake copies put in the material slots are recorded while
+    they are there. The journal is written again after each change, replacing the old
+    file atomically, so it is never left half written. It is removed when the object
+    is completely baked.
+
+    job identifies the maps baked from the object, processes baking other maps of the
+    same object at the same time keep their own journals.
+    """
+
+    def __init__(self, dir_path, object_name, job):
+        self.path = os.path.join(dir_path, JOURNAL_DIR, bpy.path.clean_name(object_name) + '_' + job + '.json')
+        self.lock = threading.Lock()
+        self.maps = {}
+        self.materials = []
+        # Set once every map of the object is saved
+        self.complete = False
+        self.removed = False
+        try:
+            with open(self.path) as file:
+                data = json.load(file)
+            if data.get('version') == JOURNAL_VERSION:
+                self.maps = data['maps']
+                self.materials = data['materials']
+        except (OSError, ValueError, KeyError):
+            self.maps = {}
+            self.materials = []
+
+    def is_finished(self, file_path, key):
+        """ True if the file was completely written from the key and didn't change since """
+        entry = self.maps.get(file_path)
+        if key is None or entry is None or entry['key'] != key:
+            return False
+        try:
+            return os.path.getmtime(file_path) == entry['mtime']
+        except OSError:
+            return False
+
+    def finish(self, file_path, key):
+        """ Checkpoint a written file, may be called from the image writer threads """
+        if key is None:
+            return
+        with self.lock:
+            if self.removed:
+                return
+            self.maps[file_path] = {'key': key, 'mtime': os.path.getmtime(file_path)}
+            self.save()
+
+    def swap_materials(self, mat_slots, materials):
+        """ Record the bake copies about to replace the materials of the slots """
+        with self.lock:
+            self.materials = [[i, ms.material.name, material.name]
+                              for i, (ms, material) in enumerate(zip(mat_slots, materials))]
+            self.save()
+
+    def clear_materials(self):
+        """ Record that the original materials are back in the slots """
+        with self.lock:
+            self.materials = []
+            self.save()
+
+    def restore_materials(self, mat_slots):
+        """ Put back the original materials of slots still holding the bake copies of an interrupted run
+
+        Only materials tagged as bake copies of the recorded original are replaced or removed.
+        Returns the number of restored slots.
+        """
+        restored = 0
+        with self.lock:
+            for index, original_name, copy_name in self.materials:
+                original = bpy.data.materials.get(original_name)
+                copy = bpy.data.materials.get(copy_name)
+                if index >= len(mat_slots) or original is None or copy is None:
+                    continue
+                if copy.get(BAKE_COPY_TAG) != original_name:
+                    continue
+                if mat_slots[index].material == copy:
+                    mat_slots[index].material = original
+                    restored += 1
+                if copy.users == 0:
+                    bpy.data.materials.remove(copy)
+            if self.materials:
+                self.materials = []
+                self.save()
+        return restored
+
+    def save(self):
+        """ Write the journal to a temporary file and move it over the old one """
+        dir_path = os.path.dirname(self.path)
+        os.makedirs(dir_path, exist_ok = True)
+        handle, temp_path = tempfile.mkstemp(dir = dir_path, prefix = os.path.basename(self.path), suffix = '.tmp')
+        try:
+            with os.fdopen(handle, 'w') as file:
+                json.dump({'version': JOURNAL_VERSION, 'maps': self.maps, 'materials': self.materials}, file,
+                          indent = 1)
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(temp_path, self.path)
+        except BaseException:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise
+
+    def remove(self):
+        """ Delete the journal, files written afterwards aren't checkpointed """
+        with self.lock:
+            self.removed = True
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
@@ -0,0 +1,134 @@
+from .channel_packing import CHANNEL_MAPS, layout_channels
+
+SCALAR_KEYS = ('metallic', 'roughness', 'ao')
+
+# Principled BSDF input each map is baked from (AO comes from its own node)
+MAP_INPUTS = {
+    'albedo': 'Base Color',
+    'metallic': 'Metallic',
+    'roughness': 'Roughness',
+    'ao': None
+}
+
+# Pass kinds that run a Cycles bake
+CYCLES_PASS_KINDS = ('EMIT', 'SPLIT', 'NORMAL')
+
+class BakeMap:
+    """ Output texture of a bake and the settings used to create it """
+
+    def __init__(self, key, name, clear, clear_color, colorspace, file_format = 'PNG'):
+        self.key = key
+        self.name = name
+        self.clear = clear
+        self.clear_color = clear_color
+        self.colorspace = colorspace
+        self.file_format = file_format
+        self.input_name = MAP_INPUTS.get(key)
+        # Name of the map in the bake cache keys, extra outputs of a map have their own
+        self.cache_name = key
+        # Maps only baked to fill packed textures aren't saved
+        self.save = True
+        # Channel of each component of a packed texture, and if the texture is saved with alpha
+        self.channels = None
+        self.alpha = False
+
+    @classmethod
+    def from_props(cls, key, props, colorspace = 'Linear', object_name = None):
+        return cls(key, props.get_map_name(key, object_name), getattr(props, key + '_clear'),
+                   getattr(props, key + '_clear_color'), colorspace, getattr(props, key + '_format'))
+
+class BakePass:
+    """ A single Cycles bake call and the maps it produces
+
+    kind is one of:
+        'EMIT'     - one map baked through the emission shader
+        'SPLIT'    - up to three scalar maps routed into the R, G and B channels and split afterwards
+        'NORMAL'   - normal map
+        'DIRECT'   - map filled from constant inputs or image textures without a Cycles bake
+        'PROJECTED' - map of a selected to active bake filled from the inputs of the selected
+                      objects at the surface hit by each texel, shared by every projected map
+        'CACHED'   - map restored from the bake cache
+        'RESUMED'  - map already saved by an interrupted bake with the same settings, kept as it is
+        'PACK'     - texture packing the channels of scalar maps baked by the previous passes,
+                     without a Cycles bake
+    """
+
+    def __init__(self, kind, maps):
+        self.kind = kind
+        self.maps = maps
+
+def packed_outputs(props, object_name = None):
+    """ Return the map of every channel packed texture, one per selected layout
+
+    Channels of maps that aren't enabled keep the clear color. With several layouts the
+    layout name is added to the texture names.
+    """
+    layouts = sorted(props.packed_layouts)
+    name = props.get_map_name('packed', object_name)
+    maps = []
+    for layout in layouts:
+        suffix = '_' + layout.lower() if len(layouts) > 1 else ''
+        layout_maps = layout_channels(props, layout)
+        channels = tuple(channel if channel is not None and getattr(props, 'enable_' + CHANNEL_MAPS[channel]) else None
+                         for channel in layout_maps)
+        packed_map = BakeMap('packed', name + suffix, props.packed_clear, props.packed_clear_color, 'Linear',
+                             props.packed_format)
+        packed_map.cache_name = 'packed_' + layout.lower()
+        packed_map.channels = channels
+        packed_map.alpha = layout_maps[3] is not None
+        maps.append(packed_map)
+    return maps
+
+def plan_passes(props, sources = None, object_name = None):
+    """ Return the list of bake passes needed for the enabled maps
+
+    sources maps the cache name of a map to the pass kind that produces it without
+    Cycles (e.g. 'DIRECT'), maps not in it are baked. object_name is added to
+    the texture names when baking several objects.
+    """
+    if sources is None:
+        sources = {}
+    passes = []
+
+    if props.enable_albedo:
+        albedo_map = BakeMap.from_props('albedo', props, 'sRGB', object_name)
+        passes.append(BakePass(sources.get('albedo', 'EMIT'), [albedo_map]))
+
+    # Packed textures are assembled from the enabled scalar maps, which are only saved packed
+    pack_passes = []
+    pack_keys = set()
+    if props.pack_channels:
+        for packed_map in packed_outputs(props, object_name):
+            if all(channel is None for channel in packed_map.channels):
+                continue
+            if sources.get(packed_map.cache_name) in ('CACHED', 'RESUMED'):
+                pack_passes.append(BakePass(sources[packed_map.cache_name], [packed_map]))
+                continue
+            pack_passes.append(BakePass('PACK', [packed_map]))
+            pack_keys.update(CHANNEL_MAPS[channel] for channel in packed_map.channels if channel is not None)
+
+    scalar_maps = []
+    for key in SCALAR_KEYS:
+        # Maps of packed textures restored from the cache or an interrupted bake aren't needed
+        if not getattr(props, 'enable_' + key) or (props.pack_channels and key not in pack_keys):
+            continue
+        bake_map = BakeMap.from_props(key, props, 'Linear', object_name)
+        bake_map.save = not props.pack_channels
+        if key in sources:
+            passes.append(BakePass(sources[key], [bake_map]))
+        else:
+            scalar_maps.append(bake_map)
+
+    if len(scalar_maps) == 1:
+        passes.append(BakePass('EMIT', scalar_maps))
+    elif scalar_maps:
+        passes.append(BakePass('SPLIT', scalar_maps))
+    passes += pack_passes
+
+    # Normal maps need textures
+    if props.enable_normal and props.output_mode == 'TEXTURE':
+        normal_map = BakeMap('normal', props.get_map_name('normal', object_name), props.normal_clear, (0.5, 0.5, 1.0, 1.0), 'Linear',
+                             props.normal_format)
+        passes.append(BakePass(sources.get('normal', 'NORMAL'), [normal_map]))
+
+    return passes
@@ -0,0 +1,100 @@
+import time
+
+# Seconds per texel of each pass kind, measured by the passes baked so far in this session
+PASS_RATES = {}
+
+# Weight of the last pass in the measured rates
+RATE_SMOOTHING = 0.5
+
+def format_seconds(seconds):
+    seconds = int(round(seconds))
+    if seconds >= 3600:
+        return '{}h {:02d}m'.format(seconds // 3600, seconds % 3600 // 60)
+    if seconds >= 60:
+        return '{}m {:02d}s'.format(seconds // 60, seconds % 60)
+    return '{}s'.format(seconds)
+
+class BakeProgress:
+    """ Progress of a bake run measured in texels, with the remaining time estimated from past passes
+
+    Passes are added as they are planned and finished in the same order.
+    """
+
+    def __init__(self, objects_total = 1):
+        self.start = time.perf_counter()
+        self.pending = []
+        self.done_passes = 0
+        self.done_texels = 0
+        self.total_texels = 0
+        self.objects_total = objects_total
+        self.objects_done = 0
+        self.objects_seconds = 0.0
+
+    def add_pass(self, kind, texels):
+        self.pending.append((kind, texels))
+        self.total_texels += texels
+
+    def finish_pass(self, seconds):
+        """ Record the time of the oldest pending pass """
+        kind, texels = self.pending.pop(0)
+        self.done_passes += 1
+        self.done_texels += texels
+        if texels > 0:
+            rate = seconds / texels
+            if kind in PASS_RATES:
+                rate = RATE_SMOOTHING * rate + (1.0 - RATE_SMOOTHING) * PASS_RATES[kind]
+            PASS_RATES[kind] = rate
+
+    def skip_passes(self, count):
+        """ Drop the oldest pending passes without baking them """
+        for kind, texels in self.pending[:count]:
+            self.total_texels -= texels
+        del self.pending[:count]
+
+    def finish_object(self, seconds):
+        self.objects_done += 1
+        self.objects_seconds += seconds
+
+    def objects_left(self):
+        """ Objects whose passes aren't planned yet """
+        planning = 1 if self.pending else 0
+        return max(0, self.objects_total - self.objects_done - planning)
+
+    @property
+    def fraction(self):
+        """ Fraction of the run done, objects not planned yet count as much as the planned ones """
+        if self.total_texels == 0:
+            return 0.0
+        objects_left = self.objects_left()
+        objects_planned = self.objects_total - objects_left
+        if objects_left and objects_planned:
+            total = self.total_texels + objects_left * self.total_texels / objects_planned
+        else:
+            total = self.total_texels
+        return min(1.0, self.done_texels / total)
+
+    def eta(self):
+        """ Estimated seconds left, None before anything can be estimated """
+        if len(PASS_RATES) > 0:
+            default_rate = sum(PASS_RATES.values()) / len(PASS_RATES)
+        elif self.done_texels > 0:
+            default_rate = (time.perf_counter() - self.start) / self.done_texels
+        else:
+            return None
+        seconds = sum(PASS_RATES.get(kind, default_rate) * texels for kind, texels in self.pending)
+
+        # Objects of a batch that aren't planned yet take as long as the finished ones
+        objects_left = self.objects_left()
+        if objects_left and self.objects_done:
+            seconds += objects_left * self.objects_seconds / self.objects_done
+        return seconds
+
+    def status(self):
+        """ One line description of the progress """
+        text = '{:.0f}%'.format(self.fraction * 100)
+        if self.objects_total > 1:
+            text += ', object {} of {}'.format(min(self.objects_done + 1, self.objects_total), self.objects_total)
+        eta = self.eta()
+        if eta is not None:
+            text += ', ' + format_seconds(eta) + ' left'
+        return text
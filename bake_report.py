@@ -0,0 +1,72 @@
+import json
+import sys
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows
+    resource = None
+
+_last_report = None
+
+def peak_memory_mb():
+    """ Peak resident memory of the process in MB, None if it can't be measured """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KB, macOS bytes
+    if sys.platform == 'darwin':
+        return peak / (1024 * 1024)
+    return peak / 1024
+
+def get_last_report():
+    """ Return the report of the last bake run as a dictionary, None if nothing was baked yet """
+    return _last_report
+
+class BakeReport:
+    """ Timings, texel counts and peak memory of every stage of a bake run """
+
+    def __init__(self):
+        self.started = time.time()
+        self.start = time.perf_counter()
+        self.stages = []
+        self.object_name = None
+
+    @contextmanager
+    def stage(self, name, **info):
+        """ Time the code in the with block as a stage, info is stored with the stage """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            entry = {'stage': name, 'object': self.object_name, 'seconds': time.perf_counter() - start}
+            entry.update(info)
+            entry['peak_memory_mb'] = peak_memory_mb()
+            self.stages.append(entry)
+
+    def to_dict(self):
+        totals = {}
+        texels = {}
+        for entry in self.stages:
+            totals[entry['stage']] = totals.get(entry['stage'], 0.0) + entry['seconds']
+            texels[entry['stage']] = texels.get(entry['stage'], 0) + entry.get('texels', 0)
+        return {
+            'started': self.started,
+            'total_seconds': time.perf_counter() - self.start,
+            'peak_memory_mb': peak_memory_mb(),
+            'stage_seconds': totals,
+            'stage_texels': texels,
+            'stages': self.stages
+        }
+
+    def finish(self, log_path = ''):
+        """ Publish the report, print it and append it as a JSON line to log_path if given """
+        global _last_report
+        _last_report = self.to_dict()
+        print('Easy PBR Bake report: ' + json.dumps(_last_report))
+        if log_path:
+            with open(log_path, 'a') as file:
+                file.write(json.dumps(_last_report) + '\n')
+        return _last_report
@@ -0,0 +1,95 @@
+import bpy
+
+from .node_analysis import socket_value
+
+# Custom property of the bake copies holding the name of their original material
+BAKE_COPY_TAG = 'easy_pbr_bake_copy'
+
+class BakeRig:
+    """ Copy of a material with every node needed to bake its maps
+
+    The nodes are created once per material, each pass only relinks the socket that
+    feeds the emission shader, so the shader Cycles compiles doesn't grow with the
+    number of maps.
+    """
+
+    def __init__(self, material):
+        self.original = material
+        self.material = material.copy()
+        self.material[BAKE_COPY_TAG] = material.name
+        self.output = None
+        self.principled = None
+        self.emission = None
+        self.texture = None
+        self.constants = {}
+        self.ao = None
+        self.combine = None
+
+        nodes = self.material.node_tree.nodes
+        for node in nodes:
+            if node.bl_idname == 'ShaderNodeOutputMaterial':
+                links = node.inputs['Surface'].links
+                if len(links) == 0:
+                    break
+                if links[0].from_node.bl_idname != 'ShaderNodeBsdfPrincipled':
+                    break
+                self.output = node
+                self.principled = links[0].from_node
+                self.emission = nodes.new('ShaderNodeEmission')
+                self.link(self.emission.outputs[0], node.inputs['Surface'])
+                self.texture = nodes.new('ShaderNodeTexImage')
+                nodes.active = self.texture
+                break
+
+    @property
+    def valid(self):
+        """ True if the material can be baked """
+        return self.principled is not None
+
+    def link(self, from_socket, to_socket):
+        self.material.node_tree.links.new(from_socket, to_socket, verify_limits = True)
+
+    def input_socket(self, input_name):
+        """ Return the socket with the value of a Principled input
+
+        Unlinked inputs get an RGB node with their value, created the first time.
+        """
+        input_socket = self.principled.inputs[input_name]
+        if input_socket.is_linked:
+            return input_socket.links[0].from_socket
+        if input_name not in self.constants:
+            self.constants[input_name] = self.material.node_tree.nodes.new('ShaderNodeRGB')
+        output_socket = self.constants[input_name].outputs['Color']
+        output_socket.default_value = socket_value(input_socket)
+        return output_socket
+
+    def ao_socket(self, samples, distance):
+        """ Return the output of the ambient occlusion node """
+        if self.ao is None:
+            self.ao = self.material.node_tree.nodes.new('ShaderNodeAmbientOcclusion')
+        self.ao.samples = samples
+        self.ao.inputs[1].default_value = distance
+        return self.ao.outputs[1]
+
+    def combine_node(self):
+        """ Return the Combine RGB node with every input unlinked and set to zero """
+        if self.combine is None:
+            self.combine = self.material.node_tree.nodes.new('ShaderNodeCombineRGB')
+        links = self.material.node_tree.links
+        for input_socket in self.combine.inputs:
+            for link in input_socket.links:
+                links.remove(link)
+            input_socket.default_value = 0.0
+        return self.combine
+
+    def set_emission(self, socket):
+        """ Bake the value of a socket through the emission shader """
+        self.link(self.emission.outputs[0], self.output.inputs['Surface'])
+        self.link(socket, self.emission.inputs['Color'])
+
+    def set_shader(self):
+        """ Bake the original shader, used for normal maps """
+        self.link(self.principled.outputs[0], self.output.inputs['Surface'])
+
+    def remove(self):
+        bpy.data.materials.remove(self.material, do_unlink = True, do_id_user = True, do_ui_user = True)
@@ -0,0 +1,76 @@
+import numpy as np
+
+# Rough memory used per texel of a tile by Blender, Cycles and the NumPy post-processing
+BYTES_PER_TEXEL = 64
+MIN_BAND_ROWS = 16
+
+TILE_UV_LAYER = 'EasyPBRBake_tile'
+
+class BakeTile:
+    """ Part of the UV space baked into its own image
+
+    UVs of the tile are mapped to the [0, 1] range of the image by (uv - offset) * scale.
+    Tiles with rows are bands of a single texture: only those image rows are saved, the
+    others are baked so the margin and filters see the texels around the band.
+    """
+
+    def __init__(self, suffix, u_offset, v_offset, u_scale, v_scale, width, height, name = None, rows = None,
+                 last = False):
+        self.suffix = suffix
+        self.name = suffix if name is None else name
+        self.offset = np.array((u_offset, v_offset), dtype = np.float32)
+        self.scale = np.array((u_scale, v_scale), dtype = np.float32)
+        self.width = width
+        self.height = height
+        # First and last image rows saved from a band, and if it is the last band of the texture
+        self.rows = rows
+        self.last = last
+
+    @property
+    def window(self):
+        """ UV rectangle covered by the tile as (u_min, v_min, u_max, v_max) """
+        u_min, v_min = self.offset
+        return (u_min, v_min, u_min + 1.0 / self.scale[0], v_min + 1.0 / self.scale[1])
+
+    def transform(self, uvs):
+        """ Map UVs to the UV space of the tile image """
+        return (uvs - self.offset) * self.scale
+
+def band_rows(props):
+    """ Number of texture rows saved from each band, the rows baked around it included in the memory budget """
+    texels = props.memory_budget * 1024 * 1024 // BYTES_PER_TEXEL
+    rows = texels // props.x_res - 2 * props.margin
+    return min(props.y_res, max(MIN_BAND_ROWS, rows))
+
+def get_tiles(props, tri_uvs):
+    """ Return the tiles to bake for the tile mode, or [None] to bake the whole image at once
+
+    TILES bakes bands of rows from the top of the texture down, so each band can be added
+    to the file as soon as it is finished. Bands without faces are kept, their rows are
+    filled with the clear color.
+    """
+    if props.tile_mode == 'TILES':
+        size = band_rows(props)
+        tiles = []
+        top = props.y_res
+        while top > 0:
+            bottom = max(0, top - size)
+            # Rows of the margin around the band
+            low = max(0, bottom - props.margin)
+            high = min(props.y_res, top + props.margin)
+            tiles.append(BakeTile('', 0.0, low / props.y_res, 1.0, props.y_res / (high - low), props.x_res, high - low,
+                                  name = 'rows {}-{}'.format(bottom, top), rows = (bottom - low, top - low),
+                                  last = bottom == 0))
+            top = bottom
+        return tiles
+
+    elif props.tile_mode == 'UDIM':
+        # UDIM tiles used by the center of each face
+        centers = np.floor(tri_uvs.mean(axis = 1)).astype(np.int64)
+        centers = centers[(centers[:, 0] >= 0) & (centers[:, 0] < 10) & (centers[:, 1] >= 0)]
+        tiles = []
+        for col, row in np.unique(centers, axis = 0):
+            tiles.append(BakeTile('.{}'.format(1001 + col + 10 * row), col, row, 1.0, 1.0, props.x_res, props.y_res))
+        return tiles
+
+    return [None]
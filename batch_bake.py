@@ -0,0 +1,90 @@
+import time
+from collections import deque
+
+from .easy_pbr_bake import EasyPBRBake
+
+class EasyPBRBatchBake(EasyPBRBake):
+    bl_idname = "object.easy_pbr_batch_bake"
+    bl_label = "Batch Bake"
+
+    def get_batch_objects(self, context, props):
+        """ Return the (name, object) pairs to bake, object is None when it doesn't exist """
+        if props.batch_source == 'SELECTED':
+            return [(obj.name, obj) for obj in context.selected_objects]
+        elif props.batch_source == 'COLLECTION':
+            if props.batch_collection is None:
+                return []
+            return [(obj.name, obj) for obj in props.batch_collection.all_objects]
+        names = [name.strip() for name in props.batch_names.split(',') if name.strip() != '']
+        return [(name, context.scene.objects.get(name)) for name in names]
+
+    def select_only(self, view_layer, obj):
+        """ Make an object the only selected one and the active one """
+        for other in view_layer.objects:
+            other.select_set(False)
+        obj.select_set(True)
+        view_layer.objects.active = obj
+
+    def check(self, context, props):
+        if props.selected_to_active:
+            return 'Selected to Active is not supported in batch mode'
+        if len(self.get_batch_objects(context, props)) == 0:
+            return 'No objects to bake'
+        return None
+
+    def run_steps(self, context, props):
+        """ Bake every object of the batch one pass per step, returns the results of the objects """
+        view_layer = context.view_layer
+        queue = deque(self.get_batch_objects(context, props))
+        self.progress.objects_total = len(queue)
+
+        selection = list(context.selected_objects)
+        active = view_layer.objects.active
+        results = []
+        batch_start = time.perf_counter()
+
+        try:
+            while queue:
+                name, obj = queue.popleft()
+                print('Batch bake: ' + name + ' (' + str(len(queue)) + ' left)')
+                start = time.perf_counter()
+                if obj is None:
+                    error = 'Object not found'
+                elif obj.type != 'MESH':
+                    error = 'Not a mesh'
+                elif not obj.visible_get():
+                    error = 'Object is hidden'
+                else:
+                    self.select_only(view_layer, obj)
+                    try:
+                        error = yield from self.bake_steps(context, obj, props, name)
+                    except RuntimeError as e:
+                        error = str(e)
+                results.append((name, error, time.perf_counter() - start))
+                self.progress.finish_object(time.perf_counter() - start)
+        finally:
+            # Restore selection
+            for obj in view_layer.objects:
+                obj.select_set(obj in selection)
+            view_layer.objects.active = active
+
+        return results, time.perf_counter() - batch_start
+
+    def finish_run(self, result):
+        self.print_summary(*result)
+        return {'FINISHED'}
+
+    def print_summary(self, results, total_time):
+        """ Print the result of every object and report the totals """
+        print('Batch bake summary:')
+        for name, error, elapsed in results:
+            status = 'OK' if error is None else 'FAILED (' + error + ')'
+            print('  {}: {} in {:.2f}s'.format(name, status, elapsed))
+
+        failed = [name for name, error, elapsed in results if error is not None]
+        message = 'Baked {} objects, {} failed in {:.2f}s'.format(len(results) - len(failed), len(failed), total_time)
+        print(message)
+        if failed:
+            self.report({'WARNING'}, message + ': ' + ', '.join(failed))
+        else:
+            self.report({'INFO'}, message)
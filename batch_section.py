@@ -0,0 +1,33 @@
+import bpy
+from bpy.types import Panel
+
+from .main_panel import EPBRB_PT_main_panel
+
+class EPBRB_PT_batch_section(Panel):
+    bl_label = 'Batch'
+    bl_space_type = 'PROPERTIES'
+    bl_region_type = 'WINDOW'
+    bl_context = 'render'
+    bl_idname  = 'EPBRB_PT_batch_section'
+    bl_parent_id = 'EPBRB_PT_main_panel'
+    bl_options = {'DEFAULT_CLOSED'}
+
+    def draw(self, context):
+        layout = self.layout
+        props = context.scene.easy_pbr_bake_props
+
+        layout.use_property_split = True
+        layout.use_property_decorate = False
+
+        layout.prop(props, 'batch_source')
+        if props.batch_source == 'COLLECTION':
+            layout.prop(props, 'batch_collection')
+        elif props.batch_source == 'NAMES':
+            layout.prop(props, 'batch_names')
+
+        layout.operator('object.easy_pbr_batch_bake')
+
+        layout.separator()
+        layout.prop(props, 'atlas_uv_layer')
+        layout.prop(props, 'atlas_generate_uvs')
+        layout.operator('object.easy_pbr_atlas_bake')
@@ -0,0 +1,37 @@
+# Channel of the R, G, B and A components of each packed layout, None keeps the clear color
+PACK_LAYOUTS = {
+    'ORM': ('ao', 'roughness', 'metallic', None),
+    'MRA': ('metallic', 'roughness', 'ao', None),
+    # Unity HDRP mask map, the blue channel is the detail mask
+    'MAS': ('metallic', 'ao', None, 'smoothness')
+}
+
+# Maps each packed channel is read from
+CHANNEL_MAPS = {
+    'metallic': 'metallic',
+    'roughness': 'roughness',
+    'smoothness': 'roughness',
+    'ao': 'ao'
+}
+
+def layout_channels(props, layout):
+    """ Return the channel of the R, G, B and A components of a layout """
+    if layout == 'CUSTOM':
+        return tuple(None if channel == 'NONE' else channel.lower()
+                     for channel in (props.packed_r, props.packed_g, props.packed_b, props.packed_a))
+    return PACK_LAYOUTS[layout]
+
+def channel_values(channel, values):
+    """ Return the values of a packed channel from the values of the map it is read from """
+    if channel == 'smoothness':
+        return 1.0 - values
+    return values
+
+def pack_texels(pixels, channels, sources, mask):
+    """ Write the masked texels of single channel source maps into the components of pixels, in place
+
+    sources holds an array with the shape of mask for every map of the channels.
+    """
+    for component, channel in enumerate(channels):
+        if channel is not None:
+            pixels[mask, component] = channel_values(channel, sources[CHANNEL_MAPS[channel]][mask])
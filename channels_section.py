@@ -29,6 +29,7 @@ class EPBRB_PT_channels_section(Panel):
             row.enabled = False
         else:
             row.enabled = True
+        layout.prop(props, 'packed_format')
 
         layout.prop(props, 'enable_metallic', text="Metallic")
         layout.prop(props, 'enable_roughness', text="Roughness")
@@ -38,6 +39,18 @@ class EPBRB_PT_channels_section(Panel):
             box = layout.box()
             box.prop(props, 'ao_samples', text = 'AO Samples')
             box.prop(props, 'ao_distance', text = 'AO Distance')
+            box.prop(props, 'ao_denoise', text = 'AO Denoise')
+            row = box.row()
+            row.prop(props, 'ao_denoise_iterations', text = 'AO Denoise Radius')
+            row.enabled = props.ao_denoise
+
+        layout.prop(props, 'packed_layouts')
+        if 'CUSTOM' in props.packed_layouts:
+            box = layout.box()
+            box.prop(props, 'packed_r')
+            box.prop(props, 'packed_g')
+            box.prop(props, 'packed_b')
+            box.prop(props, 'packed_a')
 
         layout.prop(props, 'packed_clear')
         if props.packed_clear:
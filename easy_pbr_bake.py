@@ -1,62 +1,140 @@
+import time
+
 import bpy
 from bpy.types import Operator
 
+import numpy as np
+
+from .ao_denoise import TexelGuide, denoise
+from .bake_api import get_capture
+from .bake_cache import BakeCache, socket_hash, mesh_hash, occluders_hash, combine_hash
+from .bake_journal import BakeJournal
+from .bake_planner import plan_passes, packed_outputs, SCALAR_KEYS, MAP_INPUTS, CYCLES_PASS_KINDS
+from .bake_progress import BakeProgress
+from .bake_report import BakeReport
+from .bake_rig import BakeRig
+from .channel_packing import CHANNEL_MAPS, pack_texels
+from .bake_tiles import get_tiles, TILE_UV_LAYER
+from .image_pool import ImagePool
+from .image_writer import ImageWriter, RowStreamWriter, FORMAT_EXTENSIONS, FLOAT_FORMATS
+from .mip_levels import downsample, lod_sizes
+from .node_analysis import constant_input, texture_input
+from .normal_maps import normal_outputs, mesh_tangent_frames, flip_green, object_to_tangent
+from .render_profiles import RenderSettings, get_profile, get_profile_kind
+from .projection import projection_sources, replace_hit_materials, restore_hit_materials, read_hit_map
+from .pixel_buffers import BufferPool, read_pixels, write_pixels, linear_to_srgb, srgb_to_linear, LUMINANCE
+from .texture_sampling import resample, sample_points
+from .uv_raster import mesh_uv_triangles, mesh_triangle_geometry, uv_islands, dilate, UVRaster, RasterCache
+from .vertex_colors import can_bake_vertex_colors, read_loop_colors, write_loop_colors, loop_uvs, loop_material_indices
+
+# Events a running modal bake lets through, the view can move but nothing can be edited
+NAVIGATION_EVENTS = {'MOUSEMOVE', 'INBETWEEN_MOUSEMOVE', 'MIDDLEMOUSE', 'WHEELUPMOUSE', 'WHEELDOWNMOUSE',
+                     'WHEELINMOUSE', 'WHEELOUTMOUSE', 'TRACKPADPAN', 'TRACKPADZOOM', 'MOUSEROTATE', 'NDOF_MOTION',
+                     'NUMPAD_0', 'NUMPAD_1', 'NUMPAD_2', 'NUMPAD_3', 'NUMPAD_4', 'NUMPAD_5', 'NUMPAD_6',
+                     'NUMPAD_7', 'NUMPAD_8', 'NUMPAD_9', 'NUMPAD_PERIOD', 'NUMPAD_PLUS', 'NUMPAD_MINUS',
+                     'WINDOW_DEACTIVATE', 'TIMER_REPORT', 'TIMERREGION'}
+
 class EasyPBRBake(Operator):
     bl_idname = "object.easy_pbr_bake"
     bl_label = "Bake Textures"
 
+    # Set on EasyPBRBake while any bake runs, bakes don't start on top of each other
+    running = False
+
     original_mats = []
     materials = []
     principled_shaders = []
-    emission_shaders = []
     texture_nodes = []
+    rigs = []
+    bake_materials = {}
+    tile = None
+    streams = {}
+    band_parts = {}
+    bake_selection = []
+    cache = None
+    cache_keys = {}
+    journal = None
+    journals = []
+    writer = None
+    bake_report = None
+    progress = None
+    render_settings = None
+    raster_cache = None
+    buffers = None
+    image_pool = None
+    capture = None
+    write_files = True
+    pass_maps = []
+    scalar_maps = {}
+    pack_keys = set()
+    pack_sources = {}
+    steps = None
+    timer = None
 
     def set_bake_materials(self, mat_slots):
-        """ Create new materials from the original ones and add necessary shader nodes """
+        """ Get the bake rigs of the slots, building them from the original materials if needed
+
+        Rigs are shared by every object using the same original material until
+        clean_materials is called.
+        """
+        self.original_mats = []
+        self.materials = []
+        self.principled_shaders = []
+        self.texture_nodes = []
+        self.rigs = []
         for ms in mat_slots:
             or_material = ms.material
+            if or_material is None:
+                return False
+            if or_material not in self.bake_materials:
+                self.bake_materials[or_material] = BakeRig(or_material)
+            rig = self.bake_materials[or_material]
+            if not rig.valid:
+                return False
             self.original_mats.append(or_material)
-            material = or_material.copy()
-            self.materials.append(material)
-            nodes = material.node_tree.nodes
-            for node in nodes:
-                if node.bl_idname == 'ShaderNodeOutputMaterial':
-                    links = node.inputs['Surface'].links
-                    if len(links) == 0:
-                        return False
-                    if links[0].from_node.bl_idname != 'ShaderNodeBsdfPrincipled':
-                        return False
-                    self.principled_shaders.append(links[0].from_node)
-                    emission_node = nodes.new('ShaderNodeEmission')
-                    material.node_tree.links.new(emission_node.outputs[0], node.inputs['Surface'], verify_limits = True)
-                    self.emission_shaders.append(emission_node)
-                    tex_node = nodes.new('ShaderNodeTexImage')
-                    nodes.active = tex_node
-                    self.texture_nodes.append(tex_node)
-                    break
+            self.materials.append(rig.material)
+            self.principled_shaders.append(rig.principled)
+            self.texture_nodes.append(rig.texture)
+            self.rigs.append(rig)
 
         return True
     
     def clean_materials(self, mat_slots):
         """ Remove all created materials """
-        for mat in self.materials:
-            bpy.data.materials.remove(mat, do_unlink = True, do_id_user = True, do_ui_user = True)
+        for rig in self.bake_materials.values():
+            rig.remove()
         
         self.original_mats = []
         self.materials = []
         self.principled_shaders = []
-        self.emission_shaders = []
         self.texture_nodes = []
+        self.rigs = []
+        self.bake_materials = {}
     
-    def get_image(self, name, props, clear, clear_color, colorspace):
-        """ Return an image to bake to """
-        file_path = self.ext_file_name(props.dir_path + name, 'png')
+    def get_resolution(self, props):
+        """ Return the size of the images to bake, the tile size when baking by tiles """
+        if self.tile is not None:
+            return self.tile.width, self.tile.height
+        return props.x_res, props.y_res
+
+    def get_image(self, bake_map, props):
+        """ Return an image to bake a map to, from the image pool when it is cleared """
+        name = bake_map.name
+        if self.tile is not None:
+            name = name + self.tile.suffix
+        file_path = self.ext_file_name(props.dir_path + name, FORMAT_EXTENSIONS[bake_map.file_format])
         image = None
-        if clear or not self.file_exists(file_path):
-            image = bpy.data.images.new(name, props.x_res, props.y_res, alpha = False)
-            image.generated_color = clear_color
-            image.colorspace_settings.name = colorspace
-            image.file_format = 'PNG'
+        # Bands can't add to a texture, each one only has some of its rows
+        band = self.tile is not None and self.tile.rows is not None
+        if bake_map.clear or band or not self.file_exists(bpy.path.abspath(file_path)):
+            width, height = self.get_resolution(props)
+            float_buffer = bake_map.file_format in FLOAT_FORMATS
+            image = self.image_pool.acquire(name, width, height, bake_map.clear_color, bake_map.colorspace,
+                                            alpha = bake_map.alpha, float_buffer = float_buffer)
+            if bake_map.file_format == 'EXR':
+                image.file_format = 'OPEN_EXR'
+            else:
+                image.file_format = 'PNG'
             image.filepath_raw = file_path 
         else:
             image = bpy.data.images.load(file_path, check_existing = False)
@@ -80,225 +158,1173 @@ class EasyPBRBake(Operator):
         else:
             return file_name + '.' + ext
 
-    def get_output_socket(self, shader, input_name, nodes):
-        output_socket = None
-        input_socket = shader.inputs[input_name]
-        if input_socket.is_linked:
-            output_socket = input_socket.links[0].from_socket
+    def get_direct_sources(self, key, mesh):
+        """ Return where the value of a map comes from in every material slot, None if any slot needs a bake
+
+        A source is either ('CONSTANT', rgba) or ('TEXTURE', image texture node, output name).
+        """
+        input_name = MAP_INPUTS.get(key)
+        if input_name is None or len(self.principled_shaders) == 0:
+            return None
+        sources = []
+        for shader in self.principled_shaders:
+            value = constant_input(shader, input_name)
+            if value is not None:
+                sources.append(('CONSTANT', value))
+                continue
+            texture = texture_input(shader, input_name, mesh)
+            if texture is None:
+                return None
+            sources.append(('TEXTURE',) + texture)
+        return sources
+
+    def sample_source(self, source, bake_map, props, cache, srgb):
+        """ Return the RGB values of a direct source for every texel, or a single value if constant
+
+        Values are sRGB encoded when srgb is set, linear otherwise.
+        """
+        if source[0] == 'CONSTANT':
+            value = np.array(source[1][:3], dtype = np.float32)
+            return linear_to_srgb(value) if srgb else value
+
+        node, output_name = source[1], source[2]
+        cache_key = (node.image.name, output_name, node.interpolation, node.extension)
+        if cache_key not in cache:
+            pixels = self.texture_pixels(node, output_name, bake_map)
+            width, height = self.get_resolution(props)
+            window = self.tile.window if self.tile is not None else (0.0, 0.0, 1.0, 1.0)
+            pixels = resample(pixels, width, height, node.interpolation, node.extension, window)
+            cache[cache_key] = linear_to_srgb(pixels) if srgb else pixels
+        return cache[cache_key]
+
+    def texture_pixels(self, node, output_name, bake_map):
+        """ Return the linear RGB values an image texture node output gives to the input of a map """
+        image = node.image
+        pixels = read_pixels(image)
+        if output_name == 'Alpha':
+            return np.repeat(pixels[:, :, 3:4], 3, axis = 2)
+        pixels = pixels[:, :, :3]
+        if not image.is_float and image.colorspace_settings.name == 'sRGB':
+            pixels = srgb_to_linear(pixels)
+        if bake_map.input_name != 'Base Color':
+            # Color to float conversion of the shader
+            pixels = np.repeat(np.dot(pixels, LUMINANCE)[:, :, None], 3, axis = 2)
+        return pixels
+
+    def get_uv_raster(self, context, obj, props):
+        """ Return the UV raster of the object for the image being baked
+
+        Rasters are computed once per mesh, UV layer and image size, and shared by every
+        map and by objects with the same mesh.
+        """
+        # Modifiers can change the UVs of each object using the mesh
+        mesh_key = obj.as_pointer() if len(obj.modifiers) > 0 else obj.data.as_pointer()
+        key = (mesh_key, obj.data.uv_layers.active.name, self.get_resolution(props),
+               self.tile.name if self.tile is not None else None)
+
+        def build():
+            tri_uvs, material_indices = self.get_uv_triangles(context, obj)
+            if self.tile is not None:
+                tri_uvs = self.tile.transform(tri_uvs)
+            width, height = self.get_resolution(props)
+            return UVRaster(tri_uvs, material_indices, width, height)
+
+        return self.raster_cache.get(key, build)
+
+    def apply_margin(self, pixels, props):
+        """ Extend the baked texels over the margin, in place
+
+        Cycles bakes without margin. The texel copied into each margin texel is found once
+        per UV raster and margin, every map then fills its margin with a single gather.
+        """
+        if props.margin > 0:
+            with self.bake_report.stage('margin', maps = self.pass_maps, texels = pixels.shape[0] * pixels.shape[1]):
+                raster = self.get_uv_raster(bpy.context, self.bake_obj, props)
+                dilate(pixels, raster.margin_sources(props.margin))
+
+    def get_uv_triangles(self, context, obj):
+        """ Return the UVs and material indices of the triangles of the object being baked """
+        if self.uv_triangles is None:
+            self.uv_triangles = mesh_uv_triangles(obj, context.evaluated_depsgraph_get())
+        return self.uv_triangles
+
+    def denoise_ao(self, pixels, channel, props):
+        """ Filter the ambient occlusion in a channel of baked pixels, in place """
+        if not props.ao_denoise:
+            return
+        with self.bake_report.stage('ao_denoise', maps = ['ao'], texels = pixels.shape[0] * pixels.shape[1]):
+            context = bpy.context
+            raster = self.get_uv_raster(context, self.bake_obj, props)
+            if self.triangle_guide is None:
+                tri_uvs = self.get_uv_triangles(context, self.bake_obj)[0]
+                positions, normals = mesh_triangle_geometry(self.bake_obj, context.evaluated_depsgraph_get())
+                self.triangle_guide = (positions, normals, uv_islands(tri_uvs))
+            guide = TexelGuide(raster.tri_index, raster.barycentric, *self.triangle_guide)
+            pixels[:, :, channel] = denoise(pixels[:, :, channel], guide, props.ao_denoise_iterations)
+
+    def set_tile_uvs(self, mesh, tile):
+        """ Fill the tile UV layer with the active UVs mapped to the UV space of a tile """
+        uv_layer = mesh.uv_layers.get(TILE_UV_LAYER)
+        if uv_layer is None:
+            active_index = mesh.uv_layers.active_index
+            uv_layer = mesh.uv_layers.new(name = TILE_UV_LAYER, do_init = False)
+            mesh.uv_layers.active_index = active_index
+        uvs = np.empty(len(mesh.loops) * 2, dtype = np.float32)
+        mesh.uv_layers.active.data.foreach_get('uv', uvs)
+        uv_layer.data.foreach_set('uv', tile.transform(uvs.reshape(-1, 2)).ravel())
+
+    def remove_tile_uvs(self, mesh):
+        """ Remove the tile UV layer if it was created """
+        uv_layer = mesh.uv_layers.get(TILE_UV_LAYER)
+        if uv_layer is not None:
+            mesh.uv_layers.remove(uv_layer)
+
+    def get_map_socket(self, bake_map, index, props):
+        """ Return the socket that outputs the value of a map in the material of a slot """
+        if bake_map.key == 'ao':
+            return self.rigs[index].ao_socket(props.ao_samples, props.ao_distance)
+        return self.rigs[index].input_socket(bake_map.input_name)
+
+    def get_cache_keys(self, context, obj, props):
+        """ Return the bake cache key of every map that is cleared before baking
+
+        Keys hash the geometry, the part of the materials each map is baked from and
+        the bake settings, so maps like AO and normals stay valid when only material
+        parameters change. AO also hashes the other geometry its rays can reach, the AO
+        node of the rigs is occluded by the whole scene.
+        """
+        depsgraph = context.evaluated_depsgraph_get()
+        common = [mesh_hash(obj, depsgraph), props.x_res, props.y_res, props.margin]
+        if props.use_render_profiles:
+            common += [props.emit_samples, props.ao_pass_samples, props.normal_samples]
         else:
-            rgb_node = nodes.new('ShaderNodeRGB')
-            output_socket = rgb_node.outputs['Color']
-            color_val = None
-            if input_socket.type == 'RGBA':
-                color_val = input_socket.default_value
-            elif input_socket.type == 'VALUE':
-                color_val = (input_socket.default_value, input_socket.default_value, input_socket.default_value, 1)
-            output_socket.default_value = color_val
-        return output_socket
+            common.append(context.scene.cycles.samples)
+        if props.selected_to_active:
+            common += [props.cage_extrusion, props.cage_object]
+            for other in context.selected_objects:
+                if other != obj:
+                    common.append(mesh_hash(other, depsgraph))
+                    for ms in other.material_slots:
+                        output = ms.material.node_tree.get_output_node('CYCLES') if ms.material else None
+                        common.append(socket_hash(output.inputs['Surface']) if output else None)
+
+        keys = {}
+        for key in ('albedo',) + SCALAR_KEYS:
+            if key == 'ao':
+                parts = [props.ao_samples, props.ao_distance, props.ao_denoise and props.ao_denoise_iterations]
+                if props.enable_ao:
+                    parts.append(occluders_hash(obj, depsgraph, props.ao_distance))
+            else:
+                parts = [socket_hash(shader.inputs[MAP_INPUTS[key]]) for shader in self.principled_shaders]
+            keys[key] = combine_hash(common, key, parts, tuple(getattr(props, key + '_clear_color')))
+        keys['normal'] = combine_hash(common, 'normal', props.normal_space, props.normal_convention,
+                                      sorted(props.normal_variants),
+                                      [socket_hash(shader.inputs['Normal']) for shader in self.principled_shaders])
+
+        cache_keys = {key: combine_hash(value, getattr(props, key + '_format'), props.compression)
+                      for key, value in keys.items() if getattr(props, key + '_clear')}
+        # Normal maps converted from the same bake
+        if 'normal' in cache_keys:
+            for suffix in ('_gl', '_dx', '_object'):
+                cache_keys['normal' + suffix] = combine_hash(cache_keys['normal'], suffix)
+        # Packed textures depend on the maps of their channels
+        if props.pack_channels and props.packed_clear:
+            for packed_map in packed_outputs(props):
+                channel_keys = [keys[CHANNEL_MAPS[channel]] for channel in packed_map.channels if channel is not None]
+                cache_keys[packed_map.cache_name] = combine_hash(common, 'packed', packed_map.channels, channel_keys,
+                                                                 tuple(props.packed_clear_color), props.packed_format,
+                                                                 props.compression)
+        return cache_keys
+
+    def get_journal_job(self, props, object_name):
+        """ Return the name of the journal of the maps baked from an object with the current settings """
+        maps = [key for key in ('albedo',) + SCALAR_KEYS + ('normal',) if getattr(props, 'enable_' + key)]
+        packed = sorted(props.packed_layouts) if props.pack_channels else None
+        names = [props.get_map_name(key, object_name) for key in maps]
+        return combine_hash(maps, packed, names, props.output_mode, props.tile_mode)[:12]
+
+    def get_file_path(self, props, bake_map, lod_suffix = ''):
+        """ Return the absolute path of the file a map is saved to """
+        name = bake_map.name + lod_suffix
+        if self.tile is not None:
+            name = name + self.tile.suffix
+        return bpy.path.abspath(self.ext_file_name(props.dir_path + name, FORMAT_EXTENSIONS[bake_map.file_format]))
+
+    def get_lods(self, props, bake_map):
+        """ Return the (file path, width, height, cache key) of the smaller sizes saved with a map
+
+        Textures baked in bands are never complete in memory, they have no smaller sizes.
+        """
+        if props.tile_mode == 'TILES':
+            return []
+        width, height = self.get_resolution(props)
+        # Files are named after the size of the whole texture, tiles are halved like it
+        names = lod_sizes(props.x_res, props.y_res, props.lod_count)
+        cache_key = self.cache_keys.get(bake_map.cache_name)
+        lods = []
+        for (lod_width, lod_height), (name_width, name_height) in zip(lod_sizes(width, height, props.lod_count), names):
+            file_path = self.get_file_path(props, bake_map, props.get_lod_suffix(name_width, name_height))
+            lod_key = None
+            if cache_key is not None:
+                lod_key = combine_hash(cache_key, 'lod', lod_width, lod_height, props.lod_filter)
+            lods.append((file_path, lod_width, lod_height, lod_key))
+        return lods
+
+    def get_outputs(self, props, bake_map):
+        """ Return the (file path, cache key) of every file saved for a map, keys are None when not cached """
+        maps = [bake_map]
+        if bake_map.key == 'normal':
+            maps = [output_map for output_map, _, _ in normal_outputs(props, bake_map)]
+        outputs = []
+        for output_map in maps:
+            outputs.append((self.get_file_path(props, output_map), self.cache_keys.get(output_map.cache_name)))
+            outputs += [(lod_path, lod_key) for lod_path, _, _, lod_key in self.get_lods(props, output_map)]
+        return outputs
+
+    def write_pixels_file(self, pixels, file_path, bake_map, props, is_float, cache_key):
+        """ Save pixels to a file in the format of a map
+
+        EXR files are written by Blender, every other format is encoded on a background
+        thread while the next map is baked. Returns the future of the write when the
+        writer encodes the pixels array itself, it must not change until it is done.
+        """
+        if bake_map.file_format == 'EXR':
+            height, width = pixels.shape[:2]
+            image = self.image_pool.acquire('EasyPBRBake_lod', width, height, (0.0, 0.0, 0.0, 1.0),
+                                            alpha = bake_map.alpha, float_buffer = True)
+            image.file_format = 'OPEN_EXR'
+            image.filepath_raw = file_path
+            write_pixels(image, pixels)
+            self.save_exr(image, file_path)
+            self.image_pool.release(image)
+            self.saved_files.append((file_path, cache_key))
+            self.checkpoint(file_path, cache_key)
+            return None
+        encoded = pixels
+        if is_float and bake_map.colorspace == 'sRGB':
+            encoded = pixels.copy()
+            encoded[:, :, :3] = linear_to_srgb(encoded[:, :, :3])
+        future = self.writer.submit(encoded, file_path, bake_map.file_format, props.compression, cache_key, bake_map.alpha)
+        self.checkpoint(file_path, cache_key, future)
+        return future if encoded is pixels else None
+
+    def save_exr(self, image, file_path):
+        """ Save a float image as a half float OpenEXR file
+
+        Image.save keeps the 32 bit floats of the buffer, so the image is saved with the
+        output settings of the scene set to 16 bit OpenEXR, and they are restored afterwards.
+        """
+        settings = bpy.context.scene.render.image_settings
+        file_format, color_depth = settings.file_format, settings.color_depth
+        try:
+            settings.file_format = 'OPEN_EXR'
+            settings.color_depth = '16'
+            image.save_render(bpy.path.abspath(file_path))
+        finally:
+            settings.file_format = file_format
+            settings.color_depth = color_depth
+
+    def checkpoint(self, file_path, cache_key, future = None):
+        """ Record a saved file in the journal of the object, once the future writing it is done """
+        journal = self.journal
+        if journal is None or cache_key is None:
+            return
+        if future is None:
+            journal.finish(file_path, cache_key)
+            return
+
+        def written(future):
+            if future.exception() is None:
+                journal.finish(file_path, cache_key)
+        future.add_done_callback(written)
+
+    def save_image(self, image, bake_map, props, margin = True, pixels = None):
+        """ Add the margin to a baked image, save it with its smaller sizes and give it back to the pool
+
+        pixels are the values of the image when the caller already read or changed them,
+        they don't need to be written back. The array goes back to the buffer pool once
+        the files are written, it must not be used after the call.
+
+        Maps packed into other textures are kept in memory, maps that are only packed
+        aren't saved. Bakes started from bake_to_arrays keep every saved array and may
+        not write the files.
+        """
+        file_path = bpy.path.abspath(image.filepath_raw)
+        cache_key = self.cache_keys.get(bake_map.cache_name)
+        is_float = image.is_float
+        changed = pixels is not None
+        packed = bake_map.key in self.pack_keys
+        band = self.tile is not None and self.tile.rows is not None
+        if pixels is None and (packed or band or self.capture is not None or (margin and props.margin > 0) or
+                               props.lod_count > 0 or bake_map.file_format != 'EXR'):
+            pixels = self.buffers.read(image)
+        if packed:
+            self.pack_sources[bake_map.key] = pixels[:, :, 0].copy()
+        if not bake_map.save:
+            self.image_pool.release(image)
+            self.buffers.release(pixels)
+            return
+        if margin and props.margin > 0:
+            self.apply_margin(pixels, props)
+            changed = True
+
+        if band:
+            with self.bake_report.stage('save', maps = [bake_map.key], texels = image.size[0] * image.size[1]):
+                self.save_band(pixels, file_path, bake_map, props, is_float)
+                self.image_pool.release(image)
+            self.buffers.release(pixels)
+            return
+
+        future = None
+        if self.capture is not None:
+            self.capture.add(file_path, pixels)
+        with self.bake_report.stage('save', maps = [bake_map.key], texels = image.size[0] * image.size[1]):
+            if self.write_files and bake_map.file_format == 'EXR':
+                if changed:
+                    write_pixels(image, pixels)
+                self.save_exr(image, file_path)
+                self.saved_files.append((file_path, cache_key))
+                self.checkpoint(file_path, cache_key)
+            elif self.write_files:
+                future = self.write_pixels_file(pixels, file_path, bake_map, props, is_float, cache_key)
+            self.image_pool.release(image)
+
+        if props.lod_count > 0:
+            # Byte images hold sRGB encoded colors, float images linear ones
+            kind = 'LINEAR'
+            if bake_map.key == 'normal':
+                kind = 'NORMAL'
+            elif bake_map.colorspace == 'sRGB' and not is_float:
+                kind = 'SRGB'
+            level = pixels
+            for lod_path, lod_width, lod_height, lod_key in self.get_lods(props, bake_map):
+                with self.bake_report.stage('lod', maps = [bake_map.key], texels = lod_width * lod_height):
+                    level = downsample(level, kind, props.lod_filter)
+                    if self.capture is not None:
+                        self.capture.add(lod_path, level)
+                    if self.write_files:
+                        self.write_pixels_file(level, lod_path, bake_map, props, is_float, lod_key)
+
+        # Captured arrays belong to the caller
+        if pixels is not None and self.capture is None:
+            buffers = self.buffers
+            if future is not None:
+                future.add_done_callback(lambda _: buffers.release(pixels))
+            else:
+                buffers.release(pixels)
+
+    def save_band(self, pixels, file_path, bake_map, props, is_float):
+        """ Add the saved rows of the band being baked to the texture of a map
+
+        Byte based formats are streamed to the file, EXR textures and the textures kept by
+        bake_to_arrays are assembled from the bands and saved with the last one.
+        """
+        start, end = self.tile.rows
+        rows = pixels[start:end].copy()
+        assembled = self.capture is not None or bake_map.file_format == 'EXR'
+        if assembled:
+            # Bands come from the top of the texture down
+            self.band_parts.setdefault(file_path, []).append(rows)
+            if self.tile.last:
+                texture = np.concatenate(self.band_parts.pop(file_path)[::-1])
+                if self.capture is not None:
+                    self.capture.add(file_path, texture)
+                if self.write_files and bake_map.file_format == 'EXR':
+                    self.write_pixels_file(texture, file_path, bake_map, props, is_float, None)
+        if not self.write_files or bake_map.file_format == 'EXR':
+            return
+
+        if is_float and bake_map.colorspace == 'sRGB':
+            if assembled:
+                rows = rows.copy()
+            rows[:, :, :3] = linear_to_srgb(rows[:, :, :3])
+        stream = self.streams.get(file_path)
+        if stream is None:
+            stream = RowStreamWriter(file_path, bake_map.file_format, props.x_res, props.y_res, props.compression,
+                                     bake_map.alpha)
+            self.streams[file_path] = stream
+        stream.write_rows(rows)
+        if self.tile.last:
+            self.writer.add(self.streams.pop(file_path).close())
+
+    def fill_empty_band(self, props, passes):
+        """ Add the rows of a band without faces to every saved texture, filled with the clear colors """
+        for bake_pass in passes:
+            for bake_map in bake_pass.maps:
+                outputs = [bake_map]
+                if bake_map.key == 'normal':
+                    outputs = [output_map for output_map, _, _ in normal_outputs(props, bake_map)]
+                for output_map in outputs:
+                    if output_map.save:
+                        self.save_image(self.get_image(output_map, props), output_map, props, margin = False)
+
+    def begin_bake(self, props):
+        """ Prepare the state shared by every object baked in a run """
+        self.bake_materials = {}
+        self.saved_files = []
+        self.journal = None
+        self.journals = []
+        self.streams = {}
+        self.band_parts = {}
+        self.capture = get_capture()
+        self.write_files = self.capture is None or self.capture.write_files
+        self.bake_report = BakeReport()
+        self.progress = BakeProgress()
+        self.raster_cache = RasterCache()
+        self.buffers = BufferPool()
+        self.image_pool = ImagePool(self.buffers)
+        self.render_settings = RenderSettings(bpy.context.scene) if props.use_render_profiles else None
+        self.report_path = bpy.path.abspath(props.report_path) if props.report_path else ''
+        self.writer = ImageWriter(props.encode_threads)
+        self.cache = None
+        if props.use_cache and props.tile_mode == 'NONE' and props.output_mode == 'TEXTURE' and self.write_files:
+            self.cache = BakeCache(bpy.path.abspath(props.dir_path), props.cache_size * 1024 * 1024)
+        EasyPBRBake.running = True
+
+    def end_bake(self):
+        """ Wait for the images still being written and remove everything created for the run
+
+        Returns the report of the run.
+        """
+        self.bake_report.object_name = None
+        try:
+            with self.bake_report.stage('encode_wait'):
+                written = self.saved_files + self.writer.wait()
+            if self.cache is not None:
+                for file_path, cache_key in written:
+                    if cache_key is not None:
+                        self.cache.store(file_path, cache_key)
+                self.cache.save()
+            # Objects baked completely don't need to be resumed
+            for journal in self.journals:
+                if journal.complete:
+                    journal.remove()
+        finally:
+            with self.bake_report.stage('cleanup'):
+                if self.render_settings is not None:
+                    self.render_settings.restore()
+                    self.render_settings = None
+                # Textures of a cancelled bake in bands are incomplete
+                for stream in self.streams.values():
+                    stream.abort()
+                self.streams = {}
+                self.band_parts = {}
+                self.writer.close()
+                self.writer = None
+                self.cache = None
+                self.journal = None
+                self.journals = []
+                self.raster_cache = None
+                self.image_pool.clear()
+                self.image_pool = None
+                self.buffers = None
+                self.capture = None
+                self.clean_materials(None)
+                EasyPBRBake.running = False
+        return self.bake_report.finish(self.report_path)
+
+    def cycles_bake(self, props, bake_type, profile = None, **kwargs):
+        """ Run a Cycles bake into the active texture nodes
+
+        profile forces a render settings profile, it is applied even when the bake
+        render settings are disabled.
+        """
+        if self.tile is not None:
+            kwargs['uv_layer'] = TILE_UV_LAYER
+        self.select_bake_objects()
+        width, height = self.get_resolution(props)
+        render_settings = self.render_settings
+        if profile is not None and render_settings is None:
+            render_settings = RenderSettings(bpy.context.scene)
+        elif render_settings is not None and profile is None:
+            profile = get_profile_kind(bake_type, self.pass_maps)
+        if profile is not None:
+            render_settings.apply(get_profile(profile, props, render_settings.scene))
+        try:
+            with self.bake_report.stage('cycles_bake', bake_type = bake_type, maps = self.pass_maps, texels = width * height,
+                                        profile = profile):
+                bpy.ops.object.bake(type = bake_type, width = width, height = height,
+                                    use_clear = False, margin = 0, use_selected_to_active = props.selected_to_active,
+                                    cage_extrusion = props.cage_extrusion, cage_object = props.cage_object, **kwargs)
+        finally:
+            if render_settings is not self.render_settings:
+                render_settings.restore()
+
+    def select_bake_objects(self):
+        """ Make the object being baked active and the objects selected when its bake started the only
+        selected ones, the selection may change between the passes of a modal bake
+        """
+        view_layer = bpy.context.view_layer
+        for other in view_layer.objects:
+            selected = other in self.bake_selection
+            if other.select_get() != selected:
+                other.select_set(selected)
+        view_layer.objects.active = self.bake_obj
+
+    def check(self, context, props):
+        """ Return an error message if the bake can't start """
+        if context.active_object is None:
+            return 'No active object'
+        return None
+
+    def run_steps(self, context, props):
+        """ Generator baking one pass per step, returns the result passed to finish_run """
+        error = yield from self.bake_steps(context, context.active_object, props)
+        return error
+
+    def report_error(self, message):
+        """ Report an error, also to the bake_to_arrays call running the operator """
+        self.report({'ERROR'}, message)
+        capture = get_capture()
+        if capture is not None:
+            capture.error = message
+
+    def finish_run(self, result):
+        """ Report the result of run_steps and return the operator result """
+        if result is not None:
+            self.report_error(result)
+            return {'FINISHED', 'CANCELLED'}
+        return {'FINISHED'}
 
     def execute(self, context):
-        self.original_mats = []
-        self.materials = []
-        self.principled_shaders = []
-        self.emission_shaders = []
-        self.texture_nodes = []
+        props = context.scene.easy_pbr_bake_props
+        error = 'A bake is already running' if EasyPBRBake.running else self.check(context, props)
+        if error is not None:
+            self.report_error(error)
+            return {'CANCELLED'}
+
+        self.begin_bake(props)
+        try:
+            result = self.run_all(self.run_steps(context, props))
+        finally:
+            self.end_bake()
 
+        return self.finish_run(result)
+
+    def invoke(self, context, event):
+        """ Bake from a modal operator that runs one pass per timer event, so the UI stays responsive
+        and Esc cancels the bake between passes
+        """
         props = context.scene.easy_pbr_bake_props
-        obj = context.active_object
+        error = 'A bake is already running' if EasyPBRBake.running else self.check(context, props)
+        if error is not None:
+            self.report_error(error)
+            return {'CANCELLED'}
+
+        self.begin_bake(props)
+        self.steps = self.run_steps(context, props)
+        wm = context.window_manager
+        self.timer = wm.event_timer_add(0.1, window = context.window)
+        wm.modal_handler_add(self)
+        wm.progress_begin(0, 100)
+        context.workspace.status_text_set('Easy PBR Bake: starting, Esc to cancel')
+        return {'RUNNING_MODAL'}
+
+    def modal(self, context, event):
+        if event.type == 'ESC' and event.value == 'PRESS':
+            self.steps.close()
+            self.end_modal(context)
+            message = 'Bake cancelled after {} passes'.format(self.progress.done_passes)
+            print(message)
+            self.report({'WARNING'}, message)
+            return {'CANCELLED'}
+
+        if event.type != 'TIMER':
+            # Edits and undo between passes would change or free the data being baked
+            if event.type in NAVIGATION_EVENTS:
+                return {'PASS_THROUGH'}
+            return {'RUNNING_MODAL'}
+
+        try:
+            next(self.steps)
+        except StopIteration as stop:
+            self.end_modal(context)
+            return self.finish_run(stop.value)
+        except Exception:
+            self.end_modal(context)
+            raise
+
+        status = self.progress.status()
+        context.window_manager.progress_update(int(self.progress.fraction * 100))
+        context.workspace.status_text_set('Easy PBR Bake: ' + status + ', Esc to cancel')
+        return {'RUNNING_MODAL'}
+
+    def end_modal(self, context):
+        """ Remove the timer and the progress display, then finish the bake """
+        wm = context.window_manager
+        wm.event_timer_remove(self.timer)
+        self.timer = None
+        self.steps = None
+        wm.progress_end()
+        context.workspace.status_text_set(None)
+        self.end_bake()
+
+    def run_all(self, steps):
+        """ Run every step of a generator, return its result """
+        while True:
+            try:
+                next(steps)
+            except StopIteration as stop:
+                return stop.value
+
+    def bake_object(self, context, obj, props, object_name = None):
+        """ Bake all enabled maps of an object, return an error message if it can't be baked
+
+        When object_name is given it is added to the texture names.
+        """
+        return self.run_all(self.bake_steps(context, obj, props, object_name))
+
+    def bake_steps(self, context, obj, props, object_name = None):
+        """ Generator version of bake_object that yields after each pass
+
+        Closing the generator between passes restores the original materials.
+        """
+        self.direct_sources = {}
+        self.uv_triangles = None
+        self.triangle_guide = None
+        self.projected_sources = {}
+        self.hit_map = None
+        self.bake_obj = obj
+        self.bake_selection = list(context.selected_objects)
+        if obj not in self.bake_selection:
+            self.bake_selection.append(obj)
+        self.cache_keys = {}
+        self.bake_report.object_name = object_name or obj.name
+
+        # Put back the materials an interrupted bake left swapped before copying them
+        self.journal = None
+        if props.use_journal and self.write_files:
+            self.journal = BakeJournal(bpy.path.abspath(props.dir_path), obj.name, self.get_journal_job(props, object_name))
+            self.journals.append(self.journal)
+            restored = self.journal.restore_materials(obj.material_slots)
+            if restored:
+                print('Restored {} materials left by an interrupted bake'.format(restored))
 
         # Get data from materials
-        if not self.set_bake_materials(obj.material_slots):
-            self.clean_materials(obj.material_slots)
-            self.report({'ERROR'}, 'Incorrect materials setup')
-            return {'FINISHED', 'CANCELLED'}
+        with self.bake_report.stage('material_setup'):
+            valid = self.set_bake_materials(obj.material_slots)
+        if not valid:
+            return 'Incorrect materials setup'
+        vertex_colors = props.output_mode == 'VERTEX_COLORS'
+        if vertex_colors and not can_bake_vertex_colors() and obj.data.uv_layers.active is None:
+            return 'Before Blender 2.92 vertex colors are sampled from a texture bake, the object needs a UV map'
         
         # Replace materials
+        if self.journal is not None:
+            self.journal.swap_materials(obj.material_slots, self.materials)
         for i, ms in enumerate(obj.material_slots):
             ms.material = self.materials[i]
 
-        # Bake albedo
-        if props.enable_albedo:
-            self.bake_albedo(props, obj.material_slots)
-        
-        # Bake packed textures
-        if props.pack_channels:
-            if props.enable_metallic or props.enable_roughness or props.enable_ao:
-                self.bake_channels(props, obj.material_slots)
-        else:
-            # Bake metallic
-            if props.enable_metallic:
-                self.bake_metallic(props, obj.material_slots)
+        try:
+            with self.bake_report.stage('planning'):
+                # Find maps that come from constants or image textures in every material and don't need Cycles
+                if not props.selected_to_active and obj.data.uv_layers.active is not None:
+                    for key in ('albedo',) + SCALAR_KEYS:
+                        sources = self.get_direct_sources(key, obj.data)
+                        if sources is not None:
+                            self.direct_sources[key] = sources
+                sources = {key: 'DIRECT' for key in self.direct_sources}
 
-            # Bake roughness
-            if props.enable_roughness:
-                self.bake_roughness(props, obj.material_slots)
-            
-            # Bake ao
-            if props.enable_ao:
-                self.bake_ao(props, obj.material_slots)
-        
-        # Bake normals
-        if props.enable_normal:
-            self.bake_normal(props, obj.material_slots)
+                # Fill maps of selected to active bakes from a single hit map when it saves Cycles bakes
+                if props.selected_to_active and not vertex_colors:
+                    sources = self.plan_projection(context, obj, props, sources, object_name)
 
-        # Restore and clean materials
-        for i, ms in enumerate(obj.material_slots):
-            ms.material = self.original_mats[i]
-        self.clean_materials(obj.material_slots)
+                # Skip maps saved by an interrupted run with the same settings, or whose inputs didn't
+                # change since they were baked
+                resume = self.journal is not None and props.tile_mode == 'NONE' and not vertex_colors
+                if self.cache is not None or resume:
+                    self.cache_keys = self.get_cache_keys(context, obj, props)
+                    for bake_pass in plan_passes(props, None, object_name):
+                        for bake_map in bake_pass.maps:
+                            if not bake_map.save or bake_map.cache_name not in self.cache_keys:
+                                continue
+                            outputs = self.get_outputs(props, bake_map)
+                            if resume and all(self.journal.is_finished(file_path, key) for file_path, key in outputs):
+                                sources[bake_map.cache_name] = 'RESUMED'
+                            elif self.cache is not None and all(key is not None and self.cache.has(file_path, key)
+                                                                for file_path, key in outputs):
+                                sources[bake_map.cache_name] = 'CACHED'
 
-        return {'FINISHED'}
-    
-    def bake_albedo(self, props, mat_slots):
-        print('Baking albedo texture')
+                passes = plan_passes(props, sources, object_name)
+                # Scalar maps read by the packed textures
+                self.scalar_maps = {bake_map.key: bake_map for bake_pass in passes for bake_map in bake_pass.maps
+                                    if bake_map.key in SCALAR_KEYS}
+                self.pack_keys = set(CHANNEL_MAPS[channel] for bake_pass in passes if bake_pass.kind == 'PACK'
+                                     for channel in bake_pass.maps[0].channels if channel is not None)
 
-        image = self.get_image(props.albedo_name, props, props.albedo_clear, props.albedo_clear_color, 'sRGB')
-            
-        # Set active texture in materials
-        for tn in self.texture_nodes:
-            tn.image = image
-        
-        # Connect Base Color to Emit shader
-        for i, ms in enumerate(mat_slots):
-            albedo_output = self.get_output_socket(self.principled_shaders[i], 'Base Color', ms.material.node_tree.nodes)
-            ms.material.node_tree.links.new(albedo_output, self.emission_shaders[i].inputs['Color'], verify_limits = True)
-        
-        # Bake
-        bpy.ops.object.bake(type = 'EMIT', width = props.x_res, height = props.y_res,
-                            use_clear = False, margin = props.margin, use_selected_to_active = props.selected_to_active,
-                            cage_extrusion = props.cage_extrusion, cage_object = props.cage_object)
-        
-        # Save and clear image
-        image.save()
-        bpy.data.images.remove(image, do_unlink = True, do_id_user = True, do_ui_user = True)
+            if vertex_colors:
+                for bake_pass in passes:
+                    self.progress.add_pass(bake_pass.kind, len(obj.data.loops))
+                error = yield from self.bake_vertex_passes(context, obj, props, passes)
+                if error is None and self.journal is not None:
+                    self.journal.complete = True
+                return error
+
+            # Bake the whole image at once or tile by tile
+            tiles = [None]
+            if props.tile_mode != 'NONE':
+                tiles = get_tiles(props, self.get_uv_triangles(context, obj)[0])
+            for tile in tiles:
+                texels = tile.width * tile.height if tile is not None else props.x_res * props.y_res
+                for bake_pass in passes:
+                    self.progress.add_pass(bake_pass.kind, texels)
+            for tile in tiles:
+                self.tile = tile
+                if tile is not None:
+                    # Tiles only overlapping the bounds of faces may have no texel to bake
+                    if not self.get_uv_raster(context, obj, props).covered.any():
+                        print('Skipping empty tile ' + tile.name)
+                        if tile.rows is not None:
+                            # The rows are still part of the textures
+                            self.fill_empty_band(props, passes)
+                        self.progress.skip_passes(len(passes))
+                        continue
+                    print('Baking tile ' + tile.name)
+                    self.set_tile_uvs(obj.data, tile)
+                self.pack_sources = {}
+                yield from self.bake_passes(context, obj, props, passes)
+            if self.journal is not None:
+                self.journal.complete = True
+        finally:
+            if self.tile is not None:
+                self.remove_tile_uvs(obj.data)
+                self.tile = None
+            self.pack_sources = {}
+
+            # Restore materials
+            for i, ms in enumerate(obj.material_slots):
+                ms.material = self.original_mats[i]
+            if self.journal is not None:
+                self.journal.clear_materials()
+
+        return None
     
-    def bake_channels(self, props, mat_slots):
-        print('Baking metallic, roughness channels')
-            
-        image = self.get_image(props.packed_name, props, props.packed_clear, props.packed_clear_color, 'Linear')
-        
-        # Set active texture in materials
+    def plan_projection(self, context, obj, props, sources, object_name):
+        """ Return the sources with the maps that can be filled from the hit map, if it saves Cycles bakes """
+        high_objects = [other for other in context.selected_objects if other != obj]
+        projected = {}
+        for key in ('albedo',) + SCALAR_KEYS:
+            input_name = MAP_INPUTS.get(key)
+            if key in sources or input_name is None:
+                continue
+            key_sources = projection_sources(high_objects, input_name)
+            if key_sources is not None:
+                projected[key] = key_sources
+        if not projected:
+            return sources
+
+        with_projection = dict(sources)
+        with_projection.update({key: 'PROJECTED' for key in projected})
+        bakes = len([p for p in plan_passes(props, sources, object_name) if p.kind in CYCLES_PASS_KINDS])
+        projected_bakes = len([p for p in plan_passes(props, with_projection, object_name) if p.kind in CYCLES_PASS_KINDS])
+        # The hit map is a Cycles bake as well
+        if projected_bakes + 1 >= bakes:
+            return sources
+        self.projected_sources = projected
+        return with_projection
+
+    def get_hit_map(self, context, obj, props):
+        """ Return the hit map of the image being baked, baking it the first time """
+        tile_name = self.tile.name if self.tile is not None else None
+        if self.hit_map is None or self.hit_map[0] != tile_name:
+            self.hit_map = (tile_name, self.bake_hit_map(context, obj, props))
+        return self.hit_map[1]
+
+    def bake_hit_map(self, context, obj, props):
+        """ Bake the surface of the selected objects hit by each texel """
+        print('Baking selected to active hit map')
+        width, height = self.get_resolution(props)
+        image = self.image_pool.acquire('EasyPBRBake_hits', width, height, (0.0, 0.0, 0.0, 0.0),
+                                        alpha = True, float_buffer = True)
         for tn in self.texture_nodes:
             tn.image = image
-        
-        # Connect channels
-        for i, ms in enumerate(mat_slots):
-            combine_node = ms.material.node_tree.nodes.new('ShaderNodeCombineRGB')
-            ms.material.node_tree.links.new(combine_node.outputs['Image'], self.emission_shaders[i].inputs['Color'], verify_limits = True)
-            if props.enable_metallic:
-                metallic_output = self.get_output_socket(self.principled_shaders[i], 'Metallic', ms.material.node_tree.nodes)
-                ms.material.node_tree.links.new(metallic_output, combine_node.inputs[0], verify_limits = True)
-            if props.enable_roughness:
-                roughness_output = self.get_output_socket(self.principled_shaders[i], 'Roughness', ms.material.node_tree.nodes)
-                ms.material.node_tree.links.new(roughness_output, combine_node.inputs[1], verify_limits = True)
-            if props.enable_ao:
-                ao_node = ms.material.node_tree.nodes.new('ShaderNodeAmbientOcclusion')
-                ao_node.samples = props.ao_samples
-                ao_node.inputs[1].default_value = props.ao_distance
-                ao_output = ao_node.outputs[1]
-                ms.material.node_tree.links.new(ao_output,  combine_node.inputs[1], verify_limits = True)
-        
-        # Bake
-        bpy.ops.object.bake(type = 'EMIT', width = props.x_res, height = props.y_res,
-                            use_clear = False, margin = props.margin, use_selected_to_active = props.selected_to_active,
-                            cage_extrusion = props.cage_extrusion, cage_object = props.cage_object)
-        
+
+        high_objects = [other for other in context.selected_objects if other != obj]
+        slots, originals = replace_hit_materials(high_objects)
+        try:
+            self.cycles_bake(props, 'EMIT', profile = 'HITS')
+        finally:
+            restore_hit_materials(originals)
+
+        pixels = self.buffers.read(image)
+        self.image_pool.release(image)
+        hit_map = read_hit_map(pixels, slots)
+        self.buffers.release(pixels)
+        return hit_map
+
+    def bake_projected(self, context, obj, props, bake_map):
+        """ Fill a map from the inputs of the selected objects at the surface each texel hits """
+        hit_map = self.get_hit_map(context, obj, props)
+        print('Filling ' + bake_map.key + ' texture from the hit map')
+
+        width, height = self.get_resolution(props)
+        with self.bake_report.stage('projection_fill', maps = [bake_map.key], texels = width * height):
+            image = self.get_image(bake_map, props)
+            # Byte images store sRGB encoded values, float images are always linear
+            srgb = bake_map.colorspace == 'sRGB' and not image.is_float
+            textures = {}
+
+            pixels = self.buffers.read(image)
+            for slot_id, source in enumerate(self.projected_sources[bake_map.key]):
+                mask = hit_map.ids == slot_id
+                if not mask.any():
+                    continue
+                if source[0] == 'CONSTANT':
+                    values = np.array(source[1][:3], dtype = np.float32)
+                else:
+                    node, output_name = source[1], source[2]
+                    texture_key = (node.image.name, output_name)
+                    if texture_key not in textures:
+                        textures[texture_key] = self.texture_pixels(node, output_name, bake_map)
+                    values = sample_points(textures[texture_key], hit_map.uvs[mask], node.interpolation, node.extension)
+                pixels[mask, :3] = linear_to_srgb(values) if srgb else values
+
         # Save and clear image
-        image.save()
-        bpy.data.images.remove(image, do_unlink = True, do_id_user = True, do_ui_user = True)
-    
-    def bake_metallic(self, props, mat_slots):
-        print('Baking metallic texture')
+        self.save_image(image, bake_map, props, pixels = pixels)
+
+    def bake_passes(self, context, obj, props, passes):
+        """ Bake every pass of the plan, yielding after each one """
+        for bake_pass in passes:
+            start = time.perf_counter()
+            self.pass_maps = [bake_map.key for bake_map in bake_pass.maps]
+            if bake_pass.kind == 'CACHED':
+                self.restore_cached(props, bake_pass.maps[0])
+            elif bake_pass.kind == 'RESUMED':
+                print('Keeping ' + bake_pass.maps[0].key + ' texture saved by an interrupted bake')
+            elif bake_pass.kind == 'DIRECT':
+                self.bake_direct(context, obj, props, bake_pass.maps[0])
+            elif bake_pass.kind == 'PROJECTED':
+                self.bake_projected(context, obj, props, bake_pass.maps[0])
+            elif bake_pass.kind == 'EMIT':
+                self.bake_emit(props, obj.material_slots, bake_pass.maps[0])
+            elif bake_pass.kind == 'SPLIT':
+                self.bake_split(props, obj.material_slots, bake_pass.maps)
+            elif bake_pass.kind == 'PACK':
+                self.bake_packed(context, obj, props, bake_pass.maps[0])
+            elif bake_pass.kind == 'NORMAL':
+                self.bake_normal(props, obj.material_slots, bake_pass.maps[0])
+            self.progress.finish_pass(time.perf_counter() - start)
+            yield bake_pass
+
+    def bake_vertex_passes(self, context, obj, props, passes):
+        """ Bake every pass of the plan into vertex color layers named after the maps, yielding after each one
+
+        Returns an error message if a layer can't be added.
+        """
+        mesh = obj.data
+        loop_values = {}
+        for bake_pass in passes:
+            start = time.perf_counter()
+            self.pass_maps = [bake_map.key for bake_map in bake_pass.maps]
+            print('Baking ' + ', '.join(self.pass_maps) + ' vertex colors')
+            if bake_pass.kind in ('DIRECT', 'PACK'):
+                with self.bake_report.stage('vertex_fill', maps = self.pass_maps, texels = len(mesh.loops)):
+                    if bake_pass.kind == 'DIRECT':
+                        colors = self.direct_loop_colors(mesh, bake_pass.maps[0])
+                    else:
+                        colors = self.pack_loop_colors(bake_pass.maps[0], loop_values, len(mesh.loops))
+                colors = {bake_pass.maps[0].key: colors}
+            else:
+                colors = self.bake_loop_colors(context, obj, props, bake_pass.maps)
+                if colors is None:
+                    return 'Too many vertex color layers'
+
+            with self.bake_report.stage('vertex_write', maps = self.pass_maps, texels = len(mesh.loops)):
+                for bake_map in bake_pass.maps:
+                    if bake_map.key in self.pack_keys:
+                        loop_values[bake_map.key] = colors[bake_map.key][:, 0]
+                    if not bake_map.save:
+                        continue
+                    if not write_loop_colors(mesh, bake_map.name, colors[bake_map.key]):
+                        return 'Too many vertex color layers'
+                    if self.capture is not None:
+                        self.capture.arrays[bake_map.name] = colors[bake_map.key]
+            self.progress.finish_pass(time.perf_counter() - start)
+            yield bake_pass
+        return None
+
+    def bake_loop_colors(self, context, obj, props, maps):
+        """ Bake up to three maps through the emission shader, return the linear RGBA color of every loop of each map
+
+        Blender 2.92 and later bake the loops directly, older versions bake an image
+        that is sampled at the UVs of the loops. Returns None if the bake layer can't
+        be added.
+        """
+        for i, rig in enumerate(self.rigs):
+            if len(maps) == 1:
+                rig.set_emission(self.get_map_socket(maps[0], i, props))
+                continue
+            # Route each map into its own channel
+            combine_node = rig.combine_node()
+            rig.set_emission(combine_node.outputs['Image'])
+            for c, bake_map in enumerate(maps):
+                rig.link(self.get_map_socket(bake_map, i, props), combine_node.inputs[c])
+
+        mesh = obj.data
+        if can_bake_vertex_colors():
+            active_index = mesh.vertex_colors.active_index
+            layer = mesh.vertex_colors.new(name = 'EasyPBRBake_loops')
+            if layer is None:
+                return None
+            mesh.vertex_colors.active = layer
+            try:
+                self.cycles_bake(props, 'EMIT', target = 'VERTEX_COLORS')
+                baked = read_loop_colors(layer)
+            finally:
+                mesh.vertex_colors.remove(layer)
+                if active_index >= 0 and active_index < len(mesh.vertex_colors):
+                    mesh.vertex_colors.active_index = active_index
+        else:
+            width, height = self.get_resolution(props)
+            image = self.image_pool.acquire('EasyPBRBake_loops', width, height, (0.0, 0.0, 0.0, 0.0),
+                                            alpha = True, float_buffer = True)
+            for tn in self.texture_nodes:
+                tn.image = image
+            self.cycles_bake(props, 'EMIT')
+            pixels = self.buffers.read(image)
+            self.image_pool.release(image)
+            # The margin keeps the interpolation at UV seams from reading unbaked texels
+            self.apply_margin(pixels, props)
+            baked = sample_points(pixels, loop_uvs(mesh), 'Linear', 'EXTEND')
+            self.buffers.release(pixels)
+
+        colors = {}
+        for c, bake_map in enumerate(maps):
+            values = np.ones((len(baked), 4), dtype = np.float32)
+            values[:, :3] = baked[:, :3] if len(maps) == 1 else baked[:, c, None]
+            colors[bake_map.key] = values
+        return colors
+
+    def direct_loop_colors(self, mesh, bake_map):
+        """ Return the linear RGBA color of every loop from the constant inputs and image textures of the materials """
+        sources = self.direct_sources[bake_map.key]
+        colors = np.ones((len(mesh.loops), 4), dtype = np.float32)
+        loop_slots = np.clip(loop_material_indices(mesh), 0, len(sources) - 1)
+        uvs = None
+        textures = {}
+        for slot, source in enumerate(sources):
+            mask = loop_slots == slot
+            if not mask.any():
+                continue
+            if source[0] == 'CONSTANT':
+                colors[mask, :3] = source[1][:3]
+                continue
+            node, output_name = source[1], source[2]
+            texture_key = (node.image.name, output_name)
+            if texture_key not in textures:
+                textures[texture_key] = self.texture_pixels(node, output_name, bake_map)
+            if uvs is None:
+                uvs = loop_uvs(mesh)
+            colors[mask, :3] = sample_points(textures[texture_key], uvs[mask], node.interpolation, node.extension)
+        return colors
+
+    def pack_loop_colors(self, packed_map, loop_values, loops):
+        """ Return the RGBA color of every loop packing the channels of scalar maps """
+        colors = np.empty((loops, 4), dtype = np.float32)
+        colors[:] = packed_map.clear_color
+        pack_texels(colors, packed_map.channels, loop_values, np.ones(loops, dtype = bool))
+        return colors
+
+    def restore_cached(self, props, bake_map):
+        """ Restore a map from the bake cache """
+        print('Restoring ' + bake_map.key + ' texture from cache')
+        with self.bake_report.stage('cache_restore', maps = [bake_map.key]):
+            for file_path, key in self.get_outputs(props, bake_map):
+                self.cache.restore(file_path, key)
+                self.checkpoint(file_path, key)
+
+    def bake_direct(self, context, obj, props, bake_map):
+        """ Fill a map from the constant inputs and image textures of the materials without baking """
+        print('Filling ' + bake_map.key + ' texture from material inputs')
+
+        width, height = self.get_resolution(props)
+        with self.bake_report.stage('direct_fill', maps = [bake_map.key], texels = width * height):
+            image = self.get_image(bake_map, props)
+            sources = self.direct_sources[bake_map.key]
+            cache = {}
+            # Byte images store sRGB encoded values, float images are always linear
+            srgb = bake_map.colorspace == 'sRGB' and not image.is_float
 
-        image = self.get_image(props.metallic_name, props, props.metallic_clear, props.metallic_clear_color, 'Linear')
+            pixels = self.buffers.read(image)
+            if bake_map.clear and all(source[1:] == sources[0][1:] for source in sources):
+                # Same source everywhere, no need to know where the faces are
+                pixels[:, :, :3] = self.sample_source(sources[0], bake_map, props, cache, srgb)
+                covered = None
+            else:
+                # Rasterize the faces of each slot in UV space
+                raster = self.get_uv_raster(context, obj, props)
+                covered = raster.covered
+                texel_slots = np.full(covered.shape, -1, dtype = np.int32)
+                texel_slots[covered] = np.clip(raster.material_indices[raster.tri_index[covered]], 0, len(sources) - 1)
+                for slot, source in enumerate(sources):
+                    slot_mask = texel_slots == slot
+                    if not slot_mask.any():
+                        continue
+                    values = self.sample_source(source, bake_map, props, cache, srgb)
+                    pixels[slot_mask, :3] = values[slot_mask] if values.ndim == 3 else values
+
+        # Save and clear image, a uniform fill needs no margin
+        self.save_image(image, bake_map, props, margin = covered is not None, pixels = pixels)
+
+    def bake_emit(self, props, mat_slots, bake_map):
+        print('Baking ' + bake_map.key + ' texture')
+
+        image = self.get_image(bake_map, props)
             
         # Set active texture in materials
         for tn in self.texture_nodes:
             tn.image = image
         
-        # Connect Base Color to Emit shader
-        for i, ms in enumerate(mat_slots):
-            metallic_output = self.get_output_socket(self.principled_shaders[i], 'Metallic', ms.material.node_tree.nodes)
-            ms.material.node_tree.links.new(metallic_output, self.emission_shaders[i].inputs['Color'], verify_limits = True)
+        # Connect map output to Emit shader
+        for i, rig in enumerate(self.rigs):
+            rig.set_emission(self.get_map_socket(bake_map, i, props))
         
         # Bake
-        bpy.ops.object.bake(type = 'EMIT', width = props.x_res, height = props.y_res,
-                            use_clear = False, margin = props.margin, use_selected_to_active = props.selected_to_active,
-                            cage_extrusion = props.cage_extrusion, cage_object = props.cage_object)
+        self.cycles_bake(props, 'EMIT')
+
+        pixels = None
+        if bake_map.key == 'ao' and props.ao_denoise:
+            pixels = self.buffers.read(image)
+            self.denoise_ao(pixels, 0, props)
+            pixels[:, :, 1] = pixels[:, :, 0]
+            pixels[:, :, 2] = pixels[:, :, 0]
         
         # Save and clear image
-        image.save()
-        bpy.data.images.remove(image, do_unlink = True, do_id_user = True, do_ui_user = True)
+        self.save_image(image, bake_map, props, pixels = pixels)
     
-    def bake_roughness(self, props, mat_slots):
-        print('Baking roughness texture')
+    def bake_split(self, props, mat_slots, maps):
+        """ Bake up to three scalar maps in a single pass through the R, G and B channels and split the result """
+        print('Baking ' + ', '.join(bake_map.key for bake_map in maps) + ' textures in a single pass')
+
+        # Float image with transparent clear color, the alpha tells which texels were baked
+        width, height = self.get_resolution(props)
+        image = self.image_pool.acquire('EasyPBRBake_split', width, height, (0.0, 0.0, 0.0, 0.0),
+                                        alpha = True, float_buffer = True)
 
-        image = self.get_image(props.roughness_name, props, props.roughness_clear, props.roughness_clear_color, 'Linear')
-            
         # Set active texture in materials
         for tn in self.texture_nodes:
             tn.image = image
         
-        # Connect Base Color to Emit shader
-        for i, ms in enumerate(mat_slots):
-            roughness_output = self.get_output_socket(self.principled_shaders[i], 'Roughness', ms.material.node_tree.nodes)
-            ms.material.node_tree.links.new(roughness_output, self.emission_shaders[i].inputs['Color'], verify_limits = True)
+        # Route each map into its own channel
+        for i, rig in enumerate(self.rigs):
+            combine_node = rig.combine_node()
+            rig.set_emission(combine_node.outputs['Image'])
+            for c, bake_map in enumerate(maps):
+                rig.link(self.get_map_socket(bake_map, i, props), combine_node.inputs[c])
         
         # Bake
-        bpy.ops.object.bake(type = 'EMIT', width = props.x_res, height = props.y_res,
-                            use_clear = False, margin = props.margin, use_selected_to_active = props.selected_to_active,
-                            cage_extrusion = props.cage_extrusion, cage_object = props.cage_object)
-        
-        # Save and clear image
-        image.save()
-        bpy.data.images.remove(image, do_unlink = True, do_id_user = True, do_ui_user = True)
+        self.cycles_bake(props, 'EMIT')
+
+        with self.bake_report.stage('split_channels', maps = self.pass_maps, texels = width * height):
+            baked = self.buffers.read(image)
+            self.image_pool.release(image)
+            baked_mask = baked[:, :, 3] > 0.0
+        for c, bake_map in enumerate(maps):
+            if bake_map.key == 'ao':
+                self.denoise_ao(baked, c, props)
+
+        # Split channels into the map images
+        for c, bake_map in enumerate(maps):
+            with self.bake_report.stage('split_channels', maps = [bake_map.key], texels = width * height):
+                map_image = self.get_image(bake_map, props)
+                pixels = self.buffers.read(map_image)
+                pixels[baked_mask, :3] = baked[baked_mask, c, None]
+
+            # Save and clear image
+            self.save_image(map_image, bake_map, props, pixels = pixels)
+        self.buffers.release(baked)
     
-    def bake_ao(self, props, mat_slots):
-        print('Baking ao texture')
+    def bake_packed(self, context, obj, props, packed_map):
+        """ Assemble a channel packed texture from the scalar maps baked by the previous passes """
+        print('Packing ' + ', '.join(channel or '-' for channel in packed_map.channels) + ' channels')
+
+        width, height = self.get_resolution(props)
+        with self.bake_report.stage('pack_channels', maps = [packed_map.cache_name], texels = width * height):
+            sources = {}
+            for channel in packed_map.channels:
+                if channel is None:
+                    continue
+                key = CHANNEL_MAPS[channel]
+                if key not in self.pack_sources:
+                    # Restored from the cache or saved by an interrupted bake, read the saved file back
+                    self.pack_sources[key] = self.read_map_file(props, self.scalar_maps[key])
+                sources[key] = self.pack_sources[key]
+
+            image = self.get_image(packed_map, props)
+            pixels = self.buffers.read(image)
+            pack_texels(pixels, packed_map.channels, sources, self.get_uv_raster(context, obj, props).covered)
 
-        image = self.get_image(props.ao_name, props, props.ao_clear, props.ao_clear_color, 'Linear')
-            
-        # Set active texture in materials
-        for tn in self.texture_nodes:
-            tn.image = image
-        
-        # Connect Base Color to Emit shader
-        for i, ms in enumerate(mat_slots):
-            ao_node = ms.material.node_tree.nodes.new('ShaderNodeAmbientOcclusion')
-            ao_node.samples = props.ao_samples
-            ao_node.inputs[1].default_value = props.ao_distance
-            ao_output = ao_node.outputs[1]
-            ms.material.node_tree.links.new(ao_output, self.emission_shaders[i].inputs['Color'], verify_limits = True)
-        
-        # Bake
-        bpy.ops.object.bake(type = 'EMIT', width = props.x_res, height = props.y_res,
-                            use_clear = False, margin = props.margin, use_selected_to_active = props.selected_to_active,
-                            cage_extrusion = props.cage_extrusion, cage_object = props.cage_object)
-        
         # Save and clear image
-        image.save()
+        self.save_image(image, packed_map, props, pixels = pixels)
+
+    def read_map_file(self, props, bake_map):
+        """ Return the first channel of the saved file of a map """
+        image = bpy.data.images.load(self.get_file_path(props, bake_map), check_existing = False)
+        image.colorspace_settings.name = bake_map.colorspace
+        values = read_pixels(image)[:, :, 0].copy()
         bpy.data.images.remove(image, do_unlink = True, do_id_user = True, do_ui_user = True)
+        return values
     
-    def bake_normal(self, props, mat_slots):
+    def bake_normal(self, props, mat_slots, bake_map):
         print('Baking normal map')
 
-        image = self.get_image(props.normal_name, props, props.normal_clear, (0.5, 0.5, 1.0, 1.0), 'Linear')
+        # Bake the main map in its own space and convert it to the other outputs
+        outputs = normal_outputs(props, bake_map)
+        spaces = set(space for _, space, _ in outputs)
+        bake_space = props.normal_space
+
+        image = self.get_image(bake_map, props)
             
         # Set active texture in materials
         for tn in self.texture_nodes:
             tn.image = image
         
-        # Connect Base Color to Emit shader
-        for i, ms in enumerate(mat_slots):
-            shader_output = self.principled_shaders[i].outputs[0]
-            mo_input = self.emission_shaders[i].outputs[0].links[0].to_socket
-            ms.material.node_tree.links.new(shader_output, mo_input, verify_limits = True)
+        # Connect the Principled shader to the material output
+        for rig in self.rigs:
+            rig.set_shader()
         
         # Bake
-        bpy.ops.object.bake(type = 'NORMAL', width = props.x_res, height = props.y_res,
-                            use_clear = False, margin = props.margin, use_selected_to_active = props.selected_to_active,
-                            cage_extrusion = props.cage_extrusion, cage_object = props.cage_object, normal_space = props.normal_space,
-                            normal_r = 'POS_X', normal_g = 'POS_Y', normal_b = 'POS_Z')
-        
-        # Save and clear image
-        image.save()
-        bpy.data.images.remove(image, do_unlink = True, do_id_user = True, do_ui_user = True)
+        self.cycles_bake(props, 'NORMAL', normal_space = bake_space,
+                         normal_r = 'POS_X', normal_g = 'POS_Y', normal_b = 'POS_Z')
+
+        if len(outputs) == 1 and outputs[0][2] == 'OPENGL':
+            # Save and clear image
+            self.save_image(image, bake_map, props)
+            return
+
+        context = bpy.context
+        covered = self.get_uv_raster(context, self.bake_obj, props).covered
+        baked = {bake_space: self.buffers.read(image)}
+        if 'TANGENT' in spaces and bake_space == 'OBJECT':
+            with self.bake_report.stage('normal_convert', maps = ['normal'], texels = covered.size):
+                frames = mesh_tangent_frames(self.bake_obj, context.evaluated_depsgraph_get())
+                if frames is not None:
+                    raster = self.get_uv_raster(context, self.bake_obj, props)
+                    baked['TANGENT'] = object_to_tangent(baked['OBJECT'], raster, *frames)
+            if frames is None:
+                print('Tangents of n-gons are not available, baking the tangent space normals again')
+                self.cycles_bake(props, 'NORMAL', normal_space = 'TANGENT',
+                                 normal_r = 'POS_X', normal_g = 'POS_Y', normal_b = 'POS_Z')
+                baked['TANGENT'] = self.buffers.read(image)
+        elif 'OBJECT' in spaces and bake_space == 'TANGENT':
+            # The main tangent map stays the Cycles bake, object space outputs take their own bake
+            self.cycles_bake(props, 'NORMAL', normal_space = 'OBJECT',
+                             normal_r = 'POS_X', normal_g = 'POS_Y', normal_b = 'POS_Z')
+            baked['OBJECT'] = self.buffers.read(image)
+
+        for index, (output_map, space, convention) in enumerate(outputs):
+            if index == 0:
+                output_image = image
+                pixels = self.buffers.acquire(baked[space].shape)
+                np.copyto(pixels, baked[space])
+            else:
+                # Texels outside the UVs keep the clear color or the previous file
+                output_image = self.get_image(output_map, props)
+                pixels = self.buffers.read(output_image)
+                pixels[covered] = baked[space][covered]
+            if convention == 'DIRECTX':
+                flip_green(pixels, covered)
+            # Save and clear image
+            self.save_image(output_image, output_map, props, pixels = pixels)
+        for pixels in baked.values():
+            self.buffers.release(pixels)
@@ -0,0 +1,218 @@
+""" Run Easy PBR Bake jobs on a pool of background Blender processes
+
+Usage:
+    python headless_bake.py jobs.json
+
+The job file is a JSON object:
+    {
+        "blender": "blender",                 Blender executable (optional)
+        "blend_file": "props.blend",          File opened by every worker (optional per job)
+        "workers": 8,                         Maximum number of Blender processes (optional)
+        "threads_per_worker": 4,              Cycles threads of each process (optional)
+        "split_maps": false,                  Run one process per map instead of per object (optional)
+        "settings": {"x_res": 2048, ...},     EasyPBRBakeProp values for every job (optional)
+        "report": "results.json",             Where to write the results (optional)
+        "jobs": [
+            {"object": "Crate", "maps": ["albedo", "normal"], "settings": {...}},
+            ...
+        ]
+    }
+
+Settings with several choices, like packed_layouts or normal_variants, are given as
+lists, and unknown setting names fail the job.
+
+With split_maps and pack_channels, the scalar maps and the packed textures stay in one
+job so they are baked once.
+
+Every worker opens the blend file in `blender --background`, applies the settings,
+makes the object active and runs the object.easy_pbr_bake operator. Unless the
+settings of a job give a base_name, the object name is appended to it.
+"""
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ADDON_DIR = os.path.dirname(os.path.abspath(__file__))
+MAP_KEYS = ('albedo', 'metallic', 'roughness', 'ao', 'normal')
+SCALAR_KEYS = ('metallic', 'roughness', 'ao')
+
+def worker_count(requested, threads_per_worker, num_jobs):
+    """ Number of processes to run so the workers don't oversubscribe the CPU """
+    cpu_count = os.cpu_count() or 1
+    if threads_per_worker <= 0:
+        threads_per_worker = 1
+    limit = max(1, cpu_count // threads_per_worker)
+    if requested is None or requested <= 0:
+        requested = limit
+    return max(1, min(requested, limit, num_jobs))
+
+def expand_jobs(job_file):
+    """ Return the list of worker jobs described by a job file """
+    base_settings = job_file.get('settings', {})
+    jobs = []
+    for job in job_file['jobs']:
+        settings = dict(base_settings)
+        settings.update(job.get('settings', {}))
+        maps = job.get('maps')
+        if maps is None:
+            maps = [key for key in MAP_KEYS if settings.get('enable_' + key, False)]
+        worker_job = {
+            'object': job['object'],
+            'blend_file': job.get('blend_file', job_file.get('blend_file')),
+            'settings': settings,
+            'maps': maps
+        }
+        if job_file.get('split_maps', False) and len(maps) > 1:
+            groups = [[key] for key in maps]
+            if settings.get('pack_channels', False):
+                # The packed textures are baked once, by the worker baking the scalar maps they are read from
+                groups = [[key for key in maps if key in SCALAR_KEYS]] + [[key] for key in maps if key not in SCALAR_KEYS]
+            for i, group in enumerate(groups):
+                split_settings = settings if i == 0 else dict(settings, pack_channels = False)
+                jobs.append(dict(worker_job, maps = group, settings = split_settings))
+        else:
+            jobs.append(worker_job)
+    return jobs
+
+def run_job(blender, job, threads, work_dir, index):
+    """ Run one job in a background Blender process and return its result """
+    job_path = os.path.join(work_dir, 'job_{}.json'.format(index))
+    result_path = os.path.join(work_dir, 'result_{}.json'.format(index))
+    with open(job_path, 'w') as file:
+        json.dump(job, file)
+
+    command = [blender, '--background']
+    if job['blend_file']:
+        command.append(job['blend_file'])
+    command += ['--threads', str(threads), '--python-exit-code', '1',
+                '--python', os.path.abspath(__file__), '--', '--worker', job_path, result_path]
+
+    # Keep NumPy and other OpenMP users within the thread budget of the worker
+    env = dict(os.environ, OMP_NUM_THREADS = str(threads))
+
+    start = time.perf_counter()
+    process = subprocess.run(command, stdout = subprocess.PIPE, stderr = subprocess.STDOUT,
+                             universal_newlines = True, env = env)
+    result = {'object': job['object'], 'maps': job['maps'], 'returncode': process.returncode}
+    try:
+        with open(result_path) as file:
+            result.update(json.load(file))
+    except (OSError, ValueError):
+        result['status'] = 'FAILED'
+        result['error'] = 'Worker exited without result'
+    if process.returncode != 0 and result.get('status') != 'FAILED':
+        result['status'] = 'FAILED'
+        result['error'] = 'Worker exited with code {}'.format(process.returncode)
+    result['wall_time'] = time.perf_counter() - start
+    if result['status'] == 'FAILED':
+        result['log'] = process.stdout[-4000:]
+    return result
+
+def run_pool(job_file):
+    """ Run every job of a job file on a pool of Blender processes, return the results """
+    jobs = expand_jobs(job_file)
+    threads = job_file.get('threads_per_worker', 1)
+    workers = worker_count(job_file.get('workers'), threads, len(jobs))
+    blender = job_file.get('blender', 'blender')
+    print('Running {} jobs on {} workers with {} threads each'.format(len(jobs), workers, threads))
+
+    with tempfile.TemporaryDirectory(prefix = 'easy_pbr_bake_') as work_dir:
+        with ThreadPoolExecutor(max_workers = workers) as pool:
+            futures = [pool.submit(run_job, blender, job, threads, work_dir, i) for i, job in enumerate(jobs)]
+            results = []
+            for future in futures:
+                result = future.result()
+                status = result['status'] if result['status'] != 'FAILED' else 'FAILED (' + result['error'] + ')'
+                print('  {} [{}]: {} in {:.2f}s'.format(result['object'], ', '.join(result['maps']), status, result['wall_time']))
+                results.append(result)
+    return results
+
+def import_addon():
+    """ Import and register the add-on this script belongs to inside Blender """
+    import importlib
+    sys.path.insert(0, os.path.dirname(ADDON_DIR))
+    addon = importlib.import_module(os.path.basename(ADDON_DIR))
+    try:
+        addon.register()
+    except ValueError:
+        # Already registered by the user preferences
+        pass
+    return addon
+
+def apply_settings(props, settings):
+    """ Set bake properties from the JSON values of a job, lists become sets for enum flag properties """
+    properties = props.bl_rna.properties
+    for name, value in settings.items():
+        if name not in properties or name == 'rna_type':
+            raise ValueError("Unknown bake setting '{}'".format(name))
+        if isinstance(value, list) and getattr(properties[name], 'is_enum_flag', False):
+            value = set(value)
+        setattr(props, name, value)
+
+def run_worker(job_path, result_path):
+    """ Bake a single job inside a background Blender process """
+    import bpy
+
+    with open(job_path) as file:
+        job = json.load(file)
+
+    result = {'status': 'FAILED'}
+    start = time.perf_counter()
+    try:
+        addon = import_addon()
+        scene = bpy.context.scene
+        scene.render.engine = 'CYCLES'
+        props = scene.easy_pbr_bake_props
+
+        settings = dict(job['settings'])
+        for key in MAP_KEYS:
+            settings['enable_' + key] = key in job['maps']
+        if 'base_name' not in job['settings']:
+            settings['base_name'] = props.base_name + '_' + job['object']
+        apply_settings(props, settings)
+
+        obj = scene.objects[job['object']]
+        view_layer = bpy.context.view_layer
+        for other in view_layer.objects:
+            other.select_set(False)
+        obj.select_set(True)
+        view_layer.objects.active = obj
+
+        status = bpy.ops.object.easy_pbr_bake()
+        if 'CANCELLED' in status:
+            result['error'] = 'Bake cancelled'
+        else:
+            result['status'] = 'FINISHED'
+        result['report'] = addon.bake_report.get_last_report()
+    except Exception as e:
+        result['error'] = str(e)
+    result['bake_time'] = time.perf_counter() - start
+
+    with open(result_path, 'w') as file:
+        json.dump(result, file)
+
+def main(argv):
+    if '--worker' in argv:
+        index = argv.index('--worker')
+        run_worker(argv[index + 1], argv[index + 2])
+        return 0
+
+    with open(argv[0]) as file:
+        job_file = json.load(file)
+    results = run_pool(job_file)
+
+    failed = [result for result in results if result['status'] == 'FAILED']
+    print('Baked {} jobs, {} failed'.format(len(results) - len(failed), len(failed)))
+    if 'report' in job_file:
+        with open(job_file['report'], 'w') as file:
+            json.dump(results, file, indent = 2)
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    args = sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else sys.argv[1:]
+    sys.exit(main(args))
@@ -0,0 +1,60 @@
+import bpy
+import numpy as np
+
+from .pixel_buffers import srgb_to_linear, write_pixels
+
+class ImagePool:
+    """ Blender images reused as bake targets by every pass and object of a run
+
+    Images are kept by size, alpha, float buffer and colorspace. Taking an image again
+    clears its pixels in place instead of creating a new one, so a run allocates each
+    kind of image once.
+    """
+
+    def __init__(self, buffers):
+        self.buffers = buffers
+        self.keys = {}
+        self.free = {}
+
+    def acquire(self, name, width, height, clear_color, colorspace = 'Linear', alpha = False, float_buffer = False):
+        """ Return an image of some size filled with clear_color """
+        key = (width, height, alpha, float_buffer, colorspace)
+        free = self.free.get(key)
+        if not free:
+            image = bpy.data.images.new(name, width, height, alpha = alpha, float_buffer = float_buffer)
+            image.generated_color = clear_color
+            image.colorspace_settings.name = colorspace
+            self.keys[image.as_pointer()] = (key, image)
+            return image
+
+        image = free.pop()
+        image.name = name
+        color = np.array(clear_color, dtype = np.float32)
+        # Fill it like a new image: generated_color is stored as is in byte images, and converted
+        # from sRGB to linear in float images holding colors
+        if float_buffer and colorspace != 'Non-Color':
+            color[:3] = srgb_to_linear(color[:3])
+        pixels = self.buffers.acquire((height, width, image.channels))
+        pixels[:] = color[:image.channels]
+        write_pixels(image, pixels)
+        self.buffers.release(pixels)
+        return image
+
+    def release(self, image):
+        """ Give an image back to the pool, images the pool didn't create are removed """
+        entry = self.keys.get(image.as_pointer())
+        if entry is None:
+            bpy.data.images.remove(image, do_unlink = True, do_id_user = True, do_ui_user = True)
+            return
+        self.free.setdefault(entry[0], []).append(image)
+
+    def clear(self):
+        """ Remove every image created by the pool """
+        for _, image in self.keys.values():
+            try:
+                bpy.data.images.remove(image, do_unlink = True, do_id_user = True, do_ui_user = True)
+            except ReferenceError:
+                # Already removed by the user
+                pass
+        self.keys = {}
+        self.free = {}
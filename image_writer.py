@@ -0,0 +1,220 @@
+import os
+import struct
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+# File extension of each output format
+FORMAT_EXTENSIONS = {
+    'PNG': 'png',
+    'PNG_BW': 'png',
+    'PNG16': 'png',
+    'TGA': 'tga',
+    'EXR': 'exr'
+}
+
+# Formats that need more than 8 bits per channel while baking
+FLOAT_FORMATS = ('PNG16', 'EXR')
+
+def _png_chunk(chunk_type, data):
+    chunk = chunk_type + data
+    return struct.pack('>I', len(data)) + chunk + struct.pack('>I', zlib.crc32(chunk) & 0xffffffff)
+
+def _png_header(width, height, bit_depth, channels):
+    """ Return the signature and IHDR chunk of a PNG file """
+    color_type = {1: 0, 2: 4, 3: 2, 4: 6}[channels]
+    header = struct.pack('>IIBBBBB', width, height, bit_depth, color_type, 0, 0, 0)
+    return b'\x89PNG\r\n\x1a\n' + _png_chunk(b'IHDR', header)
+
+def _png_scanlines(pixels, bit_depth, previous = None):
+    """ Return the filtered PNG scanlines of pixels, top row first, and the last unfiltered row
+
+    previous is the last unfiltered row of the rows above pixels, None for the first rows of the image.
+    """
+    height = pixels.shape[0]
+    max_value = (1 << bit_depth) - 1
+    values = np.round(np.clip(pixels[::-1], 0.0, 1.0) * max_value)
+    if bit_depth == 16:
+        rows = values.astype('>u2').view(np.uint8).reshape(height, -1)
+    else:
+        rows = values.astype(np.uint8).reshape(height, -1)
+
+    # Up filter on every row but the first, it compresses smooth bakes well and is vectorizable
+    filtered = np.empty((height, rows.shape[1] + 1), dtype = np.uint8)
+    filtered[:, 0] = 2
+    if previous is None:
+        filtered[0, 0] = 0
+        filtered[0, 1:] = rows[0]
+    else:
+        filtered[0, 1:] = rows[0] - previous
+    filtered[1:, 1:] = rows[1:] - rows[:-1]
+    return filtered, rows[-1].copy()
+
+def encode_png(pixels, bit_depth = 8, compression = 15):
+    """ Encode an array with shape (rows, columns, channels) of values in [0, 1] as a PNG file
+
+    Rows are stored bottom to top like Blender images. One channel is written as
+    grayscale, three as RGB and four as RGBA.
+    """
+    height, width, channels = pixels.shape
+    filtered, _ = _png_scanlines(pixels, bit_depth)
+    data = zlib.compress(filtered.tobytes(), min(9, max(0, compression // 10)))
+    return _png_header(width, height, bit_depth, channels) + _png_chunk(b'IDAT', data) + _png_chunk(b'IEND', b'')
+
+def _tga_header(width, height, channels, top_down = False):
+    # Bit 5 of the descriptor stores the rows top to bottom
+    descriptor = (8 if channels == 4 else 0) | (0x20 if top_down else 0)
+    return struct.pack('<BBBHHBHHHHBB', 0, 0, 2, 0, 0, 0, 0, 0, width, height, channels * 8, descriptor)
+
+def _tga_rows(pixels):
+    """ Return the BGR(A) bytes of pixels """
+    channels = pixels.shape[2]
+    values = np.round(np.clip(pixels, 0.0, 1.0) * 255).astype(np.uint8)
+    return values[:, :, [2, 1, 0] + ([3] if channels == 4 else [])].tobytes()
+
+def encode_tga(pixels):
+    """ Encode an array with shape (rows, columns, 3 or 4) of values in [0, 1] as an uncompressed TGA file """
+    height, width, channels = pixels.shape
+    # TGA stores rows bottom to top by default, like Blender images
+    return _tga_header(width, height, channels) + _tga_rows(pixels)
+
+def format_channels(file_format, alpha = False):
+    """ Number of channels written to a file of a byte based output format """
+    if file_format == 'PNG_BW':
+        return 1
+    return 4 if alpha else 3
+
+def encode_image(pixels, file_format, compression, alpha = False):
+    """ Encode pixels with shape (rows, columns, channels) in one of the byte based output formats
+
+    The alpha channel is only written when alpha is True, grayscale PNG files never have it.
+    """
+    channels = format_channels(file_format, alpha)
+    if file_format == 'PNG_BW':
+        return encode_png(pixels[:, :, :1], 8, compression)
+    elif file_format == 'PNG16':
+        return encode_png(pixels[:, :, :channels], 16, compression)
+    elif file_format == 'TGA':
+        return encode_tga(pixels[:, :, :channels])
+    return encode_png(pixels[:, :, :channels], 8, compression)
+
+def write_image(pixels, file_path, file_format, compression, alpha = False):
+    """ Encode pixels and write them to a file, replacing it only once it is complete """
+    data = encode_image(pixels, file_format, compression, alpha)
+    temp_path = file_path + '.tmp'
+    with open(temp_path, 'wb') as file:
+        file.write(data)
+    os.replace(temp_path, file_path)
+    return file_path
+
+class RowStreamWriter:
+    """ Writes an image of a byte based format band by band, from the top rows down, without holding
+    the whole image
+
+    PNG files are compressed as one zlib stream split into IDAT chunks, TGA files store
+    their rows top to bottom. Bands are encoded in order on a thread of their own, and
+    the file replaces the old one once the last rows are written.
+    """
+
+    def __init__(self, file_path, file_format, width, height, compression, alpha = False):
+        self.file_path = file_path
+        self.file_format = file_format
+        self.channels = format_channels(file_format, alpha)
+        self.bit_depth = 16 if file_format == 'PNG16' else 8
+        self.compressor = zlib.compressobj(min(9, max(0, compression // 10)))
+        self.previous = None
+        self.error = None
+        self.executor = ThreadPoolExecutor(max_workers = 1)
+        self.temp_path = file_path + '.tmp'
+        self.file = open(self.temp_path, 'wb')
+        if file_format == 'TGA':
+            self.file.write(_tga_header(width, height, self.channels, top_down = True))
+        else:
+            self.file.write(_png_header(width, height, self.bit_depth, self.channels))
+
+    def write_rows(self, pixels):
+        """ Queue the next band, an array with shape (rows, columns, channels) stored bottom to top like
+        Blender images. It must not change until the file is closed
+        """
+        self.executor.submit(self._encode, pixels)
+
+    def _encode(self, pixels):
+        if self.error is not None:
+            return
+        try:
+            pixels = pixels[:, :, :self.channels]
+            if self.file_format == 'TGA':
+                self.file.write(_tga_rows(pixels[::-1]))
+                return
+            filtered, self.previous = _png_scanlines(pixels, self.bit_depth, self.previous)
+            data = self.compressor.compress(filtered.tobytes())
+            if data:
+                self.file.write(_png_chunk(b'IDAT', data))
+        except Exception as e:
+            self.error = e
+
+    def _finish(self):
+        try:
+            if self.error is None and self.file_format != 'TGA':
+                self.file.write(_png_chunk(b'IDAT', self.compressor.flush()) + _png_chunk(b'IEND', b''))
+        finally:
+            self.file.close()
+        if self.error is not None:
+            os.remove(self.temp_path)
+            raise self.error
+        os.replace(self.temp_path, self.file_path)
+        return self.file_path
+
+    def abort(self):
+        """ Remove the unfinished file once the queued bands are written """
+        def discard():
+            self.file.close()
+            os.remove(self.temp_path)
+        self.executor.submit(discard)
+        self.executor.shutdown(wait = True)
+
+    def close(self):
+        """ Finish the file once the queued bands are written, returns the future of the write """
+        future = self.executor.submit(self._finish)
+        self.executor.shutdown(wait = False)
+        return future
+
+class ImageWriter:
+    """ Encodes and writes images on background threads while the next bake runs
+
+    zlib releases the GIL, so PNG compression of several maps runs in parallel.
+    """
+
+    def __init__(self, threads = 0):
+        if threads <= 0:
+            threads = os.cpu_count() or 1
+        self.pool = ThreadPoolExecutor(max_workers = threads)
+        self.pending = []
+
+    def submit(self, pixels, file_path, file_format, compression, data = None, alpha = False):
+        """ Queue pixels to be written, data is returned with the path once the file is written
+
+        Returns the future of the write, pixels must not change until it is done.
+        """
+        future = self.pool.submit(write_image, pixels, file_path, file_format, compression, alpha)
+        self.pending.append((future, data))
+        return future
+
+    def add(self, future, data = None):
+        """ Wait for a write started elsewhere, its result must be the path of the written file """
+        self.pending.append((future, data))
+
+    def wait(self):
+        """ Wait for every queued image, return the (file path, data) of each written one """
+        written = []
+        try:
+            for future, data in self.pending:
+                written.append((future.result(), data))
+        finally:
+            self.pending = []
+        return written
+
+    def close(self):
+        self.pool.shutdown(wait = True)
+        self.pending = []
@@ -1,6 +1,9 @@
 import bpy
 from bpy.types import Panel
 
+from .bake_tiles import band_rows
+from .mip_levels import lod_sizes
+
 class EPBRB_PT_main_panel(Panel):
     bl_label = 'Easy PBR Bake'
     bl_space_type = 'PROPERTIES'
@@ -29,6 +32,36 @@ class EPBRB_PT_main_panel(Panel):
         layout.prop(props, 'y_res')
         
         layout.prop(props, 'margin')
+
+        layout.prop(props, 'lod_count')
+        col = layout.column()
+        col.prop(props, 'lod_filter')
+        col.prop(props, 'lod_suffix')
+        if props.lod_count > 0:
+            sizes = lod_sizes(props.x_res, props.y_res, props.lod_count)
+            col.label(text = 'Names: ' + ', '.join(props.get_map_name('albedo') + props.get_lod_suffix(*size) for size in sizes))
+        col.enabled = props.lod_count > 0
+
+        layout.prop(props, 'compression')
+        layout.prop(props, 'encode_threads')
+        layout.prop(props, 'use_cache')
+        if props.use_cache:
+            layout.prop(props, 'cache_size')
+        layout.prop(props, 'use_journal')
+        layout.prop(props, 'report_path')
+
+        layout.prop(props, 'use_render_profiles')
+        col = layout.column(align = True)
+        col.prop(props, 'emit_samples')
+        col.prop(props, 'ao_pass_samples')
+        col.prop(props, 'normal_samples')
+        col.enabled = props.use_render_profiles
+
+        layout.prop(props, 'tile_mode')
+        if props.tile_mode == 'TILES':
+            layout.prop(props, 'memory_budget')
+            layout.label(text = 'Band Size: {} x {}'.format(props.x_res, band_rows(props)))
+
         layout.prop(props, 'selected_to_active')
         row = layout.row()
         row.prop(props, 'cage_extrusion', text = 'Ray Distance')
@@ -38,5 +71,6 @@ class EPBRB_PT_main_panel(Panel):
             row.enabled = False
         
         layout.prop(props, 'pack_channels')
+        layout.prop(props, 'output_mode')
         
         layout.operator('object.easy_pbr_bake')
\ No newline at end of file
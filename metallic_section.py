@@ -31,6 +31,7 @@ class EPBRB_PT_metallic_section(Panel):
             row.enabled = False
         else:
             row.enabled = True
+        layout.prop(props, 'metallic_format')
         layout.prop(props, 'metallic_clear')
         if props.metallic_clear:
             layout.prop(props, 'metallic_clear_color')
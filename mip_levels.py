@@ -0,0 +1,78 @@
+import numpy as np
+
+from .pixel_buffers import linear_to_srgb, srgb_to_linear
+
+def _kaiser_weights(beta = 4.0, half_width = 4):
+    """ Kaiser windowed sinc weights of a 2x decimation, for input texels at -3.5 to 3.5 texels from the output """
+    offsets = np.arange(-half_width, half_width) + 0.5
+    weights = np.sinc(offsets / 2.0) * np.i0(beta * np.sqrt(1.0 - (offsets / half_width) ** 2)) / np.i0(beta)
+    return (weights / weights.sum()).astype(np.float32)
+
+KAISER_WEIGHTS = _kaiser_weights()
+
+def lod_sizes(width, height, count):
+    """ Sizes of the count images after the full resolution one, each half the size of the previous one """
+    sizes = []
+    for _ in range(count):
+        if width == 1 and height == 1:
+            break
+        width = max(1, (width + 1) // 2)
+        height = max(1, (height + 1) // 2)
+        sizes.append((width, height))
+    return sizes
+
+def size_label(width, height):
+    """ Short name of an image size like 2k or 512 """
+    size = max(width, height)
+    if size >= 1024 and size % 1024 == 0:
+        return '{}k'.format(size // 1024)
+    return str(size)
+
+def _halve(values, axis, filter_type):
+    """ Halve an array along an axis, odd sizes repeat their last texel """
+    if values.shape[axis] == 1:
+        return values
+    if values.shape[axis] % 2 == 1:
+        pad = [(0, 0)] * values.ndim
+        pad[axis] = (0, 1)
+        values = np.pad(values, pad, mode = 'edge')
+    size = values.shape[axis] // 2
+
+    def taps(start):
+        index = [slice(None)] * values.ndim
+        index[axis] = slice(start, start + 2 * size, 2)
+        return tuple(index)
+
+    if filter_type == 'KAISER':
+        pad = [(0, 0)] * values.ndim
+        pad[axis] = (3, 3)
+        padded = np.pad(values, pad, mode = 'edge')
+        result = np.zeros(values.shape[:axis] + (size,) + values.shape[axis + 1:], dtype = np.float32)
+        for k, weight in enumerate(KAISER_WEIGHTS):
+            result += weight * padded[taps(k)]
+        return result
+    return (values[taps(0)] + values[taps(1)]) * np.float32(0.5)
+
+def downsample(pixels, kind = 'LINEAR', filter_type = 'BOX'):
+    """ Return pixels with shape (rows, columns, channels) at half the size
+
+    kind tells how the color channels are encoded: 'LINEAR' values are filtered as they
+    are, 'SRGB' values are filtered in linear space and 'NORMAL' vectors are renormalized.
+    Alpha is always filtered linearly.
+    """
+    color = pixels[:, :, :3]
+    if kind == 'SRGB':
+        color = srgb_to_linear(np.clip(color, 0.0, 1.0))
+    elif kind == 'NORMAL':
+        color = color * 2.0 - 1.0
+    values = np.concatenate((color, pixels[:, :, 3:]), axis = 2).astype(np.float32)
+
+    values = _halve(_halve(values, 0, filter_type), 1, filter_type)
+
+    if kind == 'SRGB':
+        values[:, :, :3] = linear_to_srgb(values[:, :, :3])
+    elif kind == 'NORMAL':
+        vectors = values[:, :, :3]
+        vectors /= np.maximum(np.linalg.norm(vectors, axis = 2, keepdims = True), 1e-6)
+        values[:, :, :3] = vectors * 0.5 + 0.5
+    return values
@@ -0,0 +1,97 @@
+def socket_value(input_socket):
+    """ Return the value of an unlinked input socket as an RGBA tuple """
+    if input_socket.type == 'RGBA':
+        return tuple(input_socket.default_value)
+    elif input_socket.type == 'VALUE':
+        return (input_socket.default_value, input_socket.default_value, input_socket.default_value, 1)
+    return None
+
+def constant_input(shader, input_name):
+    """ Return the RGBA value of a shader input if it is not linked, None otherwise """
+    input_socket = shader.inputs[input_name]
+    if input_socket.is_linked:
+        return None
+    return socket_value(input_socket)
+
+# Colorspaces whose pixels can be used without an OCIO transform
+DIRECT_COLORSPACES = ('sRGB', 'Linear', 'Non-Color', 'Raw')
+
+def uv_map_name(vector_socket, mesh):
+    """ Return the name of the UV map a texture vector input uses, None if it is not a plain UV map """
+    default_name = mesh.uv_layers.active.name
+    for uv_layer in mesh.uv_layers:
+        if uv_layer.active_render:
+            default_name = uv_layer.name
+    if not vector_socket.is_linked:
+        return default_name
+    from_socket = vector_socket.links[0].from_socket
+    from_node = from_socket.node
+    if from_node.bl_idname == 'ShaderNodeUVMap':
+        return from_node.uv_map or default_name
+    if from_node.bl_idname == 'ShaderNodeTexCoord' and from_socket.name == 'UV':
+        return default_name
+    return None
+
+def texture_input(shader, input_name, mesh):
+    """ Return the image texture node and output name an input is linked to
+
+    Only textures sampled with the UV map being baked into, and with settings that
+    can be reproduced by resampling the image pixels, are returned. None otherwise.
+    """
+    input_socket = shader.inputs[input_name]
+    if not input_socket.is_linked:
+        return None
+    link = input_socket.links[0]
+    node = link.from_node
+    if node.bl_idname != 'ShaderNodeTexImage' or node.image is None:
+        return None
+    image = node.image
+    if image.source not in ('FILE', 'GENERATED') or image.size[0] == 0 or image.size[1] == 0:
+        return None
+    if not image.is_float and image.colorspace_settings.name not in DIRECT_COLORSPACES:
+        return None
+    if node.projection != 'FLAT' or node.interpolation not in ('Linear', 'Closest'):
+        return None
+    if node.extension not in ('REPEAT', 'EXTEND'):
+        return None
+    if uv_map_name(node.inputs['Vector'], mesh) != mesh.uv_layers.active.name:
+        return None
+    return node, link.from_socket.name
+
+# Texture nodes whose unlinked vector input doesn't default to the generated coordinates
+UV_DEFAULT_TEXTURES = ('ShaderNodeTexImage', 'ShaderNodeTexEnvironment', 'ShaderNodeTexSky', 'ShaderNodeTexIES',
+                       'ShaderNodeTexPointDensity')
+
+def object_dependent_nodes(node_tree, visited = None):
+    """ Return the names of the nodes of a tree, and of the node groups it uses, whose output depends
+    on the object being shaded rather than on its surface
+
+    These are texture coordinates relative to the object or its bounds, including the generated
+    coordinates procedural textures use by default, Object Info, and Attribute nodes reading
+    object or instancer properties.
+    """
+    if visited is None:
+        visited = set()
+    if node_tree is None or node_tree.as_pointer() in visited:
+        return []
+    visited.add(node_tree.as_pointer())
+
+    names = []
+    for node in node_tree.nodes:
+        used = any(output.is_linked for output in node.outputs)
+        if node.bl_idname == 'ShaderNodeGroup':
+            names += object_dependent_nodes(node.node_tree, visited)
+        elif node.bl_idname == 'ShaderNodeTexCoord':
+            if node.outputs['Generated'].is_linked or (node.outputs['Object'].is_linked and node.object is None):
+                names.append(node.name)
+        elif node.bl_idname == 'ShaderNodeObjectInfo':
+            if any(output.is_linked for output in node.outputs if output.name != 'Material Index'):
+                names.append(node.name)
+        elif node.bl_idname == 'ShaderNodeAttribute':
+            if used and getattr(node, 'attribute_type', 'GEOMETRY') != 'GEOMETRY':
+                names.append(node.name)
+        elif node.bl_idname.startswith('ShaderNodeTex') and node.bl_idname not in UV_DEFAULT_TEXTURES:
+            vector = node.inputs.get('Vector')
+            if used and vector is not None and not vector.is_linked:
+                names.append(node.name)
+    return names
@@ -0,0 +1,98 @@
+import numpy as np
+
+from .bake_planner import BakeMap
+
+# Space, green channel convention and file name suffix of the extra normal map outputs
+NORMAL_VARIANTS = {
+    'TANGENT_OPENGL': ('TANGENT', 'OPENGL', '_gl'),
+    'TANGENT_DIRECTX': ('TANGENT', 'DIRECTX', '_dx'),
+    'OBJECT': ('OBJECT', 'OPENGL', '_object')
+}
+# Number of texels converted at once, bounds the memory used by the temporary arrays
+CHUNK_TEXELS = 1 << 20
+
+def normal_outputs(props, bake_map):
+    """ Return the (map, space, convention) of every normal map saved from a bake, the main map first """
+    # The green channel convention only applies to tangent space
+    convention = props.normal_convention if props.normal_space == 'TANGENT' else 'OPENGL'
+    outputs = [(bake_map, props.normal_space, convention)]
+    for variant in sorted(props.normal_variants):
+        space, variant_convention, suffix = NORMAL_VARIANTS[variant]
+        if (space, variant_convention) == (props.normal_space, convention):
+            continue
+        variant_map = BakeMap(bake_map.key, bake_map.name + suffix, bake_map.clear, bake_map.clear_color,
+                              bake_map.colorspace, bake_map.file_format)
+        variant_map.cache_name = bake_map.cache_name + suffix
+        outputs.append((variant_map, space, variant_convention))
+    return outputs
+
+def mesh_tangent_frames(obj, depsgraph):
+    """ Return the tangents, bitangent signs and normals of the corners of the triangles of the evaluated
+    mesh, in the order of mesh_uv_triangles
+
+    Tangents and normals are in object space with shape (n, 3, 3), signs have shape (n, 3).
+    Returns None when the mesh has n-gons, Blender only computes tangents of triangles and quads.
+    """
+    eval_obj = obj.evaluated_get(depsgraph)
+    mesh = eval_obj.to_mesh()
+    try:
+        try:
+            mesh.calc_tangents(uvmap = mesh.uv_layers.active.name)
+        except RuntimeError:
+            return None
+        mesh.calc_loop_triangles()
+        num_tris = len(mesh.loop_triangles)
+        loops = np.empty(num_tris * 3, dtype = np.int32)
+        mesh.loop_triangles.foreach_get('loops', loops)
+        tangents = np.empty(len(mesh.loops) * 3, dtype = np.float32)
+        mesh.loops.foreach_get('tangent', tangents)
+        signs = np.empty(len(mesh.loops), dtype = np.float32)
+        mesh.loops.foreach_get('bitangent_sign', signs)
+        normals = np.empty(len(mesh.loops) * 3, dtype = np.float32)
+        mesh.loops.foreach_get('normal', normals)
+    finally:
+        eval_obj.to_mesh_clear()
+
+    return (tangents.reshape(-1, 3)[loops].reshape(num_tris, 3, 3), signs[loops].reshape(num_tris, 3),
+            normals.reshape(-1, 3)[loops].reshape(num_tris, 3, 3))
+
+def flip_green(pixels, mask):
+    """ Switch the covered texels of a tangent space normal map between the OpenGL (Y+) and
+    DirectX (Y-) conventions, in place
+    """
+    pixels[mask, 1] = 1.0 - pixels[mask, 1]
+
+def object_to_tangent(pixels, raster, tri_tangents, tri_signs, tri_normals):
+    """ Return a copy of an object space normal map with the covered texels in tangent space
+
+    The tangent frame of each texel is interpolated from the corners of its triangle the
+    way Blender bakes tangent space normals: the bitangent is the cross product of the
+    normal and the tangent, flipped by the sign of the triangle, and the object space
+    normal is transformed by the inverse of the (tangent, bitangent, normal) matrix.
+    """
+    result = pixels.copy()
+    rows, cols = np.nonzero(raster.covered)
+    for start in range(0, len(rows), CHUNK_TEXELS):
+        texel_rows = rows[start:start + CHUNK_TEXELS]
+        texel_cols = cols[start:start + CHUNK_TEXELS]
+        tris = raster.tri_index[texel_rows, texel_cols]
+        bary = raster.barycentric[texel_rows, texel_cols]
+
+        tangent = np.einsum('ni,nij->nj', bary, tri_tangents[tris])
+        normal = np.einsum('ni,nij->nj', bary, tri_normals[tris])
+        sign = np.where(tri_signs[tris].sum(axis = 1) < 0.0, -1.0, 1.0).astype(np.float32)
+        bitangent = np.cross(normal, tangent) * sign[:, None]
+        vector = pixels[texel_rows, texel_cols, :3] * 2.0 - 1.0
+
+        # Rows of the inverse of the matrix with columns tangent, bitangent and normal
+        det = np.einsum('nj,nj->n', tangent, np.cross(bitangent, normal))
+        valid = np.abs(det) > 1e-12
+        det[~valid] = 1.0
+        local = np.stack((np.einsum('nj,nj->n', np.cross(bitangent, normal), vector),
+                          np.einsum('nj,nj->n', np.cross(normal, tangent), vector),
+                          np.einsum('nj,nj->n', np.cross(tangent, bitangent), vector)), axis = 1) / det[:, None]
+        # Texels without UV derivatives keep the unperturbed normal
+        local[~valid] = (0.0, 0.0, 1.0)
+        local /= np.maximum(np.linalg.norm(local, axis = 1, keepdims = True), 1e-12)
+        result[texel_rows, texel_cols, :3] = local * 0.5 + 0.5
+    return result
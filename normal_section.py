@@ -27,9 +27,14 @@ class EPBRB_PT_normal_section(Panel):
             row.enabled = False
         else:
             row.enabled = True
+        layout.prop(props, 'normal_format')
         layout.prop(props, 'normal_clear')
 
         layout.prop(props, 'normal_space', text = 'Space')
+        row = layout.row()
+        row.prop(props, 'normal_convention')
+        row.active = props.normal_space == 'TANGENT'
+        layout.prop(props, 'normal_variants')
     
     def draw_header(self, context):
         layout = self.layout
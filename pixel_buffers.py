@@ -0,0 +1,86 @@
+import threading
+
+import numpy as np
+
+# Weights of the color to float conversion in shaders
+LUMINANCE = np.array((0.2126, 0.7152, 0.0722), dtype = np.float32)
+
+def read_pixels(image, out = None):
+    """ Return the pixels of an image as a float32 array with shape (height, width, channels)
+
+    out is a contiguous float32 array of that shape the pixels are copied into instead of
+    allocating a new one.
+    """
+    width, height = image.size
+    channels = image.channels
+    pixels = out.reshape(-1) if out is not None else np.empty(width * height * channels, dtype = np.float32)
+    try:
+        image.pixels.foreach_get(pixels)
+    except AttributeError:
+        # bpy_prop_array has no foreach_get before Blender 2.83
+        pixels[:] = image.pixels[:]
+    if out is not None:
+        return out
+    return pixels.reshape(height, width, channels)
+
+def write_pixels(image, pixels):
+    """ Copy an array with shape (height, width, channels) into the pixels of an image """
+    flat = np.ascontiguousarray(pixels, dtype = np.float32).ravel()
+    try:
+        image.pixels.foreach_set(flat)
+    except AttributeError:
+        image.pixels[:] = flat.tolist()
+    image.update()
+
+def linear_to_srgb(values):
+    """ Convert linear color values to the sRGB transfer curve """
+    values = np.clip(values, 0.0, 1.0)
+    return np.where(values <= 0.0031308, values * 12.92, 1.055 * np.power(values, 1.0 / 2.4) - 0.055).astype(np.float32)
+
+def srgb_to_linear(values):
+    """ Convert sRGB encoded color values to linear """
+    return np.where(values <= 0.04045, values / 12.92, np.power((values + 0.055) / 1.055, 2.4)).astype(np.float32)
+
+class BufferPool:
+    """ Float32 pixel arrays reused by the passes of a bake instead of allocating new ones
+
+    Released arrays are kept by shape until they hold more than max_bytes. Arrays can be
+    released from the image writer threads once their file is encoded.
+    """
+
+    def __init__(self, max_bytes = 1 << 30):
+        self.max_bytes = max_bytes
+        self.free = {}
+        self.free_bytes = 0
+        self.lock = threading.Lock()
+
+    def acquire(self, shape):
+        """ Return a float32 array with some shape, its values are undefined """
+        shape = tuple(shape)
+        with self.lock:
+            arrays = self.free.get(shape)
+            if arrays:
+                array = arrays.pop()
+                self.free_bytes -= array.nbytes
+                return array
+        return np.empty(shape, dtype = np.float32)
+
+    def release(self, array):
+        """ Give an array back to the pool, it must not be used anymore """
+        if array.dtype != np.float32 or not array.flags.c_contiguous or not array.flags.owndata:
+            return
+        with self.lock:
+            if self.free_bytes + array.nbytes > self.max_bytes:
+                return
+            self.free.setdefault(array.shape, []).append(array)
+            self.free_bytes += array.nbytes
+
+    def read(self, image):
+        """ Return the pixels of an image in an array of the pool """
+        width, height = image.size
+        return read_pixels(image, self.acquire((height, width, image.channels)))
+
+    def clear(self):
+        with self.lock:
+            self.free = {}
+            self.free_bytes = 0
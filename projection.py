@@ -0,0 +1,103 @@
+import bpy
+import numpy as np
+
+from .node_analysis import constant_input, texture_input
+
+def principled_shader(material):
+    """ Return the Principled BSDF connected to the output of a material, None if there is none """
+    if material is None or not material.use_nodes:
+        return None
+    output = material.node_tree.get_output_node('CYCLES')
+    if output is None or not output.inputs['Surface'].is_linked:
+        return None
+    node = output.inputs['Surface'].links[0].from_node
+    if node.bl_idname != 'ShaderNodeBsdfPrincipled':
+        return None
+    return node
+
+class HitMap:
+    """ Surface of the selected objects hit by the ray of each texel of a selected to active bake
+
+    ids holds the index of the (object, material slot) hit by each texel, -1 where nothing
+    was hit, and uvs the texture coordinates of the hit in the active UV map of that object.
+    """
+
+    def __init__(self, ids, uvs, slots):
+        self.ids = ids
+        self.uvs = uvs
+        self.slots = slots
+
+def projection_sources(high_objects, input_name):
+    """ Return the direct source of a Principled input for each (object, slot) of the selected objects
+
+    Sources are like the ones of EasyPBRBake.get_direct_sources. None if any slot needs a bake.
+    """
+    sources = []
+    for obj in high_objects:
+        if obj.type != 'MESH' or obj.data.uv_layers.active is None or len(obj.material_slots) == 0:
+            return None
+        for ms in obj.material_slots:
+            shader = principled_shader(ms.material)
+            if shader is None:
+                return None
+            value = constant_input(shader, input_name)
+            if value is not None:
+                sources.append(('CONSTANT', value))
+                continue
+            texture = texture_input(shader, input_name, obj.data)
+            if texture is None:
+                return None
+            sources.append(('TEXTURE',) + texture)
+    return sources
+
+def hit_material(uv_map, slot_id):
+    """ Material emitting the UV coordinates of a surface in R and G, and slot_id + 1 in B """
+    material = bpy.data.materials.new('EasyPBRBake_hits')
+    material.use_nodes = True
+    nodes = material.node_tree.nodes
+    links = material.node_tree.links
+    nodes.clear()
+    uv_node = nodes.new('ShaderNodeUVMap')
+    uv_node.uv_map = uv_map
+    separate = nodes.new('ShaderNodeSeparateXYZ')
+    combine = nodes.new('ShaderNodeCombineRGB')
+    combine.inputs['B'].default_value = slot_id + 1
+    emission = nodes.new('ShaderNodeEmission')
+    output = nodes.new('ShaderNodeOutputMaterial')
+    links.new(uv_node.outputs['UV'], separate.inputs[0])
+    links.new(separate.outputs['X'], combine.inputs['R'])
+    links.new(separate.outputs['Y'], combine.inputs['G'])
+    links.new(combine.outputs['Image'], emission.inputs['Color'])
+    links.new(emission.outputs[0], output.inputs['Surface'])
+    return material
+
+def replace_hit_materials(high_objects):
+    """ Give every slot of the selected objects a material emitting its hit attributes
+
+    Returns the (object, slot) of every id and the original materials to restore.
+    """
+    slots = []
+    originals = []
+    for obj in high_objects:
+        uv_map = obj.data.uv_layers.active.name
+        for index, ms in enumerate(obj.material_slots):
+            originals.append((ms, ms.material))
+            ms.material = hit_material(uv_map, len(slots))
+            slots.append((obj, index))
+    return slots, originals
+
+def restore_hit_materials(originals):
+    # Reverse order, slots of objects sharing a mesh were replaced more than once
+    for ms, material in reversed(originals):
+        hits = ms.material
+        ms.material = material
+        if hits is not None and hits.name.startswith('EasyPBRBake_hits'):
+            bpy.data.materials.remove(hits, do_unlink = True, do_id_user = True, do_ui_user = True)
+
+def read_hit_map(pixels, slots):
+    """ Build a hit map from the pixels of the baked hit image """
+    hit = pixels[:, :, 3] > 0.0
+    ids = np.full(hit.shape, -1, dtype = np.int32)
+    ids[hit] = np.rint(pixels[hit, 2]).astype(np.int32) - 1
+    ids[(ids < 0) | (ids >= len(slots))] = -1
+    return HitMap(ids, pixels[:, :, :2].copy(), slots)
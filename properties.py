@@ -1,6 +1,26 @@
 import bpy
 from bpy.types import PropertyGroup
-from bpy.props import BoolProperty, StringProperty, FloatProperty, IntProperty, FloatVectorProperty, EnumProperty
+from bpy.props import BoolProperty, StringProperty, FloatProperty, IntProperty, FloatVectorProperty, EnumProperty, PointerProperty
+
+from .mip_levels import size_label
+
+FORMAT_ITEMS = [
+    ('PNG', 'PNG', 'PNG, 8 bit RGB'),
+    ('PNG16', 'PNG 16 bit', 'PNG, 16 bit RGB'),
+    ('EXR', 'OpenEXR', 'OpenEXR, half float'),
+    ('TGA', 'Targa', 'Uncompressed Targa, 8 bit RGB')
+]
+
+# Single channel maps can also be saved as grayscale
+SCALAR_FORMAT_ITEMS = FORMAT_ITEMS[:1] + [('PNG_BW', 'PNG Grayscale', 'PNG, 8 bit single channel')] + FORMAT_ITEMS[1:]
+
+PACKED_CHANNEL_ITEMS = [
+    ('NONE', 'None', 'Keep the clear color'),
+    ('METALLIC', 'Metallic', 'Metallic map'),
+    ('ROUGHNESS', 'Roughness', 'Roughness map'),
+    ('SMOOTHNESS', 'Smoothness', 'Inverted roughness map'),
+    ('AO', 'Ambient Occlusion', 'Ambient occlusion map')
+]
 
 class EasyPBRBakeProp(PropertyGroup):
     DEFAULT_NAME = "bake"
@@ -13,6 +33,18 @@ class EasyPBRBakeProp(PropertyGroup):
             self.roughness_name = self.base_name + '_roughness'
             self.ao_name = self.base_name + '_ao'
             self.normal_name = self.base_name + '_normal'
+
+    def get_lod_suffix(self, width, height):
+        """ Return the suffix added to the texture names of a smaller size """
+        return self.lod_suffix.replace('{size}', size_label(width, height))
+
+    def get_map_name(self, key, object_name = None):
+        """ Return the texture name of a map, including the object name when baking several objects """
+        if object_name is None:
+            return getattr(self, key + '_name')
+        if self.autonames:
+            return self.base_name + '_' + object_name + '_' + key
+        return getattr(self, key + '_name') + '_' + object_name
     
     autonames = BoolProperty(
         name = "Automatic Names", 
@@ -84,6 +116,160 @@ class EasyPBRBakeProp(PropertyGroup):
         default = ""
     )
 
+    use_cache = BoolProperty(
+        name = 'Bake Cache',
+        description = 'Skip maps whose geometry, material inputs and settings did not change since they were baked, '
+                      'restoring them from cached copies when needed',
+        default = False
+    )
+
+    cache_size = IntProperty(
+        name = 'Cache Size',
+        description = 'Space in MB the cached copies of the textures may take, the least recently used ones are '
+                      'removed beyond it',
+        default = 2048,
+        min = 16
+    )
+
+    use_journal = BoolProperty(
+        name = 'Resume Interrupted Bakes',
+        description = 'Keep a journal of the finished maps next to the textures, so a bake that was interrupted '
+                      'continues from the first unfinished map and restores the materials it left swapped',
+        default = False
+    )
+
+    tile_mode = EnumProperty(
+        items = [('NONE', 'None', 'Bake each texture as a single image'),
+                 ('TILES', 'Bands', 'Bake each texture in bands of rows to limit memory usage, the rows are added to '
+                          'the file as soon as they are baked. EXR textures are assembled in memory. Smaller sizes '
+                          'aren\'t saved'),
+                 ('UDIM', 'UDIM', 'Bake each UDIM tile used by the UVs into its own image')],
+        name = 'Tiling',
+        description = 'Split the bake into tiles that are saved to disk as soon as they are finished',
+        default = 'NONE'
+    )
+
+    memory_budget = IntProperty(
+        name = 'Memory Budget',
+        description = 'Memory in MB a band may use, the number of rows of the bands is picked to fit it',
+        default = 2048,
+        min = 64
+    )
+
+    lod_count = IntProperty(
+        name = 'Smaller Sizes',
+        description = 'Number of smaller copies of every texture to save, each one half the size of the previous one',
+        default = 0,
+        min = 0,
+        max = 6
+    )
+
+    lod_filter = EnumProperty(
+        items = [('BOX', 'Box', 'Average of 2 x 2 texels, sharp and fast'),
+                 ('KAISER', 'Kaiser', 'Kaiser windowed sinc, keeps more detail with less aliasing')],
+        name = 'Size Filter',
+        description = 'Filter used to make the smaller sizes, colors are filtered in linear space and normals renormalized',
+        default = 'BOX'
+    )
+
+    lod_suffix = StringProperty(
+        name = 'Size Suffix',
+        description = 'Suffix added to the texture names of the smaller sizes, {size} is replaced by the size like 2k or 512',
+        default = '_{size}'
+    )
+
+    compression = IntProperty(
+        name = 'Compression',
+        description = 'Amount of compression of PNG files',
+        default = 15,
+        min = 0,
+        max = 100,
+        subtype = 'PERCENTAGE'
+    )
+
+    encode_threads = IntProperty(
+        name = 'Encoding Threads',
+        description = 'Threads used to encode the textures while the next map is baked, 0 to use all cores',
+        default = 0,
+        min = 0,
+        max = 64
+    )
+
+    use_render_profiles = BoolProperty(
+        name = 'Bake Render Settings',
+        description = 'Replace the samples, bounces, tile size and denoising of the scene by settings suited to each '
+                      'bake pass, the scene settings are restored after baking',
+        default = True
+    )
+
+    emit_samples = IntProperty(
+        name = 'Emit Samples',
+        description = 'Samples of the passes that bake shader inputs like albedo, metallic and roughness',
+        default = 1,
+        min = 1,
+        max = 4096
+    )
+
+    ao_pass_samples = IntProperty(
+        name = 'AO Samples',
+        description = 'Samples of the passes that bake ambient occlusion, each one traces the AO rays again',
+        default = 1,
+        min = 1,
+        max = 4096
+    )
+
+    normal_samples = IntProperty(
+        name = 'Normal Samples',
+        description = 'Samples of the normal map pass, more samples antialias the edges of the projection',
+        default = 1,
+        min = 1,
+        max = 4096
+    )
+
+    report_path = StringProperty(
+        name = 'Report File',
+        description = 'File where the timings and memory use of each bake stage are appended as JSON lines, '
+                      'empty to only print them to the console',
+        default = '',
+        subtype = 'FILE_PATH'
+    )
+
+    ########### Batch #######################
+    batch_source = EnumProperty(
+        items = [('SELECTED', 'Selected', 'Bake every selected object'),
+                 ('COLLECTION', 'Collection', 'Bake every object in a collection'),
+                 ('NAMES', 'Names', 'Bake the objects in a comma separated list of names')],
+        name = 'Objects',
+        description = 'Objects to bake in batch mode',
+        default = 'SELECTED'
+    )
+
+    batch_collection = PointerProperty(
+        type = bpy.types.Collection,
+        name = 'Collection',
+        description = 'Collection with the objects to bake'
+    )
+
+    batch_names = StringProperty(
+        name = 'Names',
+        description = 'Comma separated names of the objects to bake',
+        default = ''
+    )
+
+    atlas_uv_layer = StringProperty(
+        name = 'Atlas UV Map',
+        description = 'UV map shared by the objects of an atlas bake, the textures are baked through it',
+        default = 'Atlas'
+    )
+
+    atlas_generate_uvs = BoolProperty(
+        name = 'Generate Atlas UVs',
+        description = 'Fill the atlas UV map of every object with its active UVs, scaled to the same texel density '
+                      'and packed next to the other objects without overlap, before baking. The atlas UV map is '
+                      'kept on the meshes for the baked textures, the active UV map doesn\'t change',
+        default = False
+    )
+
     ########### Albedo #######################
     enable_albedo = BoolProperty(
         name = 'Enable Albedo', 
@@ -113,13 +299,69 @@ class EasyPBRBakeProp(PropertyGroup):
         subtype = 'COLOR_GAMMA'
     )
 
+    albedo_format = EnumProperty(
+        items = FORMAT_ITEMS,
+        name = 'File Format',
+        description = 'File format of the albedo texture',
+        default = 'PNG'
+    )
+
+    output_mode = EnumProperty(
+        items = [('TEXTURE', 'Textures', 'Bake the maps into image textures'),
+                 ('VERTEX_COLORS', 'Vertex Colors', 'Bake albedo, metallic, roughness, ambient occlusion and packed maps '
+                  'into vertex color layers named after the textures, without normal maps')],
+        name = 'Output',
+        description = 'Where the baked maps are stored',
+        default = 'TEXTURE'
+    )
+
     ########### Packed #######################
     pack_channels = BoolProperty(
         name = 'Channel Packing', 
-        description = 'Pack the metallic, roughness and ao bakes into a single image',
+        description = 'Pack the enabled metallic, roughness and ao maps into the channels of textures instead '
+                      'of saving them separately, the channels of disabled maps keep the clear color',
         default = False
     )
 
+    packed_layouts = EnumProperty(
+        items = [('MRA', 'MRA', 'Metallic, roughness and ambient occlusion in R, G and B'),
+                 ('ORM', 'ORM', 'Ambient occlusion, roughness and metallic in R, G and B (glTF, Unreal)'),
+                 ('MAS', 'Mask Map', 'Metallic in R, ambient occlusion in G and smoothness in A (Unity HDRP)'),
+                 ('CUSTOM', 'Custom', 'Channels picked for each component')],
+        name = 'Layouts',
+        description = 'Packed textures to save, with several layouts the layout name is added to the texture names',
+        options = {'ENUM_FLAG'},
+        default = {'MRA'}
+    )
+
+    packed_r = EnumProperty(
+        items = PACKED_CHANNEL_ITEMS,
+        name = 'Red',
+        description = 'Channel in the red component of the custom layout',
+        default = 'METALLIC'
+    )
+
+    packed_g = EnumProperty(
+        items = PACKED_CHANNEL_ITEMS,
+        name = 'Green',
+        description = 'Channel in the green component of the custom layout',
+        default = 'ROUGHNESS'
+    )
+
+    packed_b = EnumProperty(
+        items = PACKED_CHANNEL_ITEMS,
+        name = 'Blue',
+        description = 'Channel in the blue component of the custom layout',
+        default = 'AO'
+    )
+
+    packed_a = EnumProperty(
+        items = PACKED_CHANNEL_ITEMS,
+        name = 'Alpha',
+        description = 'Channel in the alpha component of the custom layout, the texture has no alpha when empty',
+        default = 'NONE'
+    )
+
     packed_name = StringProperty(
         name = "Texture Name",
         description = "Name for the channel packed texture file",
@@ -142,6 +384,13 @@ class EasyPBRBakeProp(PropertyGroup):
         subtype = 'COLOR'
     )
 
+    packed_format = EnumProperty(
+        items = FORMAT_ITEMS,
+        name = 'File Format',
+        description = 'File format of the channel packed texture',
+        default = 'PNG'
+    )
+
     ########### Metallic #######################
     enable_metallic = BoolProperty(
         name = 'Enable Metallic', 
@@ -171,6 +420,13 @@ class EasyPBRBakeProp(PropertyGroup):
         subtype = 'COLOR'
     )
 
+    metallic_format = EnumProperty(
+        items = SCALAR_FORMAT_ITEMS,
+        name = 'File Format',
+        description = 'File format of the metallic texture',
+        default = 'PNG'
+    )
+
     ########### Roughness #######################
     enable_roughness = BoolProperty(
         name = 'Enable Roughness', 
@@ -200,6 +456,13 @@ class EasyPBRBakeProp(PropertyGroup):
         subtype = 'COLOR'
     )
 
+    roughness_format = EnumProperty(
+        items = SCALAR_FORMAT_ITEMS,
+        name = 'File Format',
+        description = 'File format of the roughness texture',
+        default = 'PNG'
+    )
+
     ########### Ambient Occlusion #######################
     enable_ao = BoolProperty(
         name = 'Enable Ambient Occlusion', 
@@ -229,6 +492,13 @@ class EasyPBRBakeProp(PropertyGroup):
         subtype = 'COLOR'
     )
 
+    ao_format = EnumProperty(
+        items = SCALAR_FORMAT_ITEMS,
+        name = 'File Format',
+        description = 'File format of the AO texture',
+        default = 'PNG'
+    )
+
     ao_samples = IntProperty(
         name = "Samples",
         description = "Number of rays to trace per shader evaluation",
@@ -244,6 +514,21 @@ class EasyPBRBakeProp(PropertyGroup):
         min = 0.0,
     )
 
+    ao_denoise = BoolProperty(
+        name = 'Denoise',
+        description = 'Smooth the baked ambient occlusion with a filter that keeps creases and UV island borders, '
+                      'so a few samples give a clean result',
+        default = False
+    )
+
+    ao_denoise_iterations = IntProperty(
+        name = 'Denoise Radius',
+        description = 'Filter iterations, each one doubles the distance in texels the noise is smoothed over',
+        default = 3,
+        min = 1,
+        max = 5
+    )
+
     ########### Normal Map #######################
     enable_normal = BoolProperty(
         name = 'Enable Normal', 
@@ -263,9 +548,35 @@ class EasyPBRBakeProp(PropertyGroup):
         default = True
     )
 
+    normal_format = EnumProperty(
+        items = FORMAT_ITEMS,
+        name = 'File Format',
+        description = 'File format of the normal map texture',
+        default = 'PNG'
+    )
+
     normal_space = EnumProperty(
         items = [('OBJECT', 'Object', 'Bake the normals in object space'), ('TANGENT', 'Tangent', 'Bake the normals in tangent space')],
         name = 'Normal Space',
         description = 'Normal space used to bake',
         default = 'TANGENT'
+    )
+
+    normal_convention = EnumProperty(
+        items = [('OPENGL', 'OpenGL', 'Green channel points up (Y+), used by Blender'),
+                 ('DIRECTX', 'DirectX', 'Green channel points down (Y-)')],
+        name = 'Green Channel',
+        description = 'Direction of the green channel of tangent space normal maps',
+        default = 'OPENGL'
+    )
+
+    normal_variants = EnumProperty(
+        items = [('TANGENT_OPENGL', 'OpenGL', 'Also save a tangent space OpenGL normal map with the _gl suffix'),
+                 ('TANGENT_DIRECTX', 'DirectX', 'Also save a tangent space DirectX normal map with the _dx suffix'),
+                 ('OBJECT', 'Object', 'Also save an object space normal map with the _object suffix')],
+        name = 'Extra Outputs',
+        description = 'Other normal maps converted from the same bake when possible, an object space output of '
+                      'a tangent space bake takes a second bake',
+        options = {'ENUM_FLAG'},
+        default = set()
     )
\ No newline at end of file
@@ -0,0 +1,78 @@
+# Light paths are useless when baking shader inputs through an emission shader or
+# ambient occlusion, which traces its own rays
+NO_BOUNCES = (
+    ('cycles.max_bounces', 0),
+    ('cycles.diffuse_bounces', 0),
+    ('cycles.glossy_bounces', 0),
+    ('cycles.transmission_bounces', 0),
+    ('cycles.volume_bounces', 0),
+    ('cycles.transparent_max_bounces', 0),
+    ('cycles.caustics_reflective', False),
+    ('cycles.caustics_refractive', False)
+)
+
+# Settings that would multiply or filter the samples
+NO_SAMPLE_MODIFIERS = (
+    ('cycles.use_square_samples', False),
+    ('cycles.use_adaptive_sampling', False),
+    ('cycles.use_denoising', False),
+    ('view_layers.cycles.use_denoising', False)
+)
+
+def get_profile_kind(bake_type, maps):
+    """ Return the profile used by a Cycles bake of some maps """
+    if bake_type == 'NORMAL':
+        return 'NORMAL'
+    if 'ao' in maps:
+        return 'AO'
+    return 'EMIT'
+
+def get_profile(kind, props, scene):
+    """ Return the (setting path, value) pairs of a profile """
+    # The hit map needs the single ray of each texel, more samples would blend the hit attributes
+    samples = {'EMIT': props.emit_samples, 'AO': props.ao_pass_samples, 'NORMAL': props.normal_samples, 'HITS': 1}[kind]
+    # Big tiles keep GPUs busy, small ones balance the work between CPU threads
+    tile = 256 if getattr(scene.cycles, 'device', 'CPU') == 'GPU' else 64
+    return (('cycles.samples', samples), ('cycles.aa_samples', samples),
+            ('render.tile_x', tile), ('render.tile_y', tile)) + NO_BOUNCES + NO_SAMPLE_MODIFIERS
+
+class RenderSettings:
+    """ Applies render settings profiles to a scene and restores the original settings
+
+    Settings that don't exist in the running Blender version are skipped. Paths
+    starting with view_layers are set on every view layer.
+    """
+
+    def __init__(self, scene):
+        self.scene = scene
+        self.saved = {}
+
+    def targets(self, path):
+        """ Return the (owner, attribute) pairs a setting path refers to """
+        parts = path.split('.')
+        owners = [self.scene]
+        if parts[0] == 'view_layers':
+            owners = list(self.scene.view_layers)
+            parts = parts[1:]
+        targets = []
+        for owner in owners:
+            for part in parts[:-1]:
+                owner = getattr(owner, part, None)
+                if owner is None:
+                    break
+            if owner is not None and hasattr(owner, parts[-1]):
+                targets.append((owner, parts[-1]))
+        return targets
+
+    def apply(self, settings):
+        for path, value in settings:
+            for owner, attribute in self.targets(path):
+                key = (owner.as_pointer(), path)
+                if key not in self.saved:
+                    self.saved[key] = (owner, attribute, getattr(owner, attribute))
+                setattr(owner, attribute, value)
+
+    def restore(self):
+        for owner, attribute, value in self.saved.values():
+            setattr(owner, attribute, value)
+        self.saved = {}
@@ -30,6 +30,7 @@ class EPBRB_PT_roughness_section(Panel):
             row.enabled = False
         else:
             row.enabled = True
+        layout.prop(props, 'roughness_format')
         layout.prop(props, 'roughness_clear')
         if props.roughness_clear:
             layout.prop(props, 'roughness_clear_color')
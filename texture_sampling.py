@@ -0,0 +1,79 @@
+import numpy as np
+
+# Output rows resampled per vectorized step
+CHUNK_ROWS = 256
+
+def _axis_centers(size_out, start, end):
+    """ Texture coordinates of the texel centers of an axis covering [start, end] """
+    return start + (np.arange(size_out) + 0.5) * ((end - start) / size_out)
+
+def _axis_coords(size_out, size_src, extension, start, end):
+    """ Source texel indices and weights to bilinearly sample the texel centers of an axis """
+    coords = _axis_centers(size_out, start, end) * size_src - 0.5
+    i0 = np.floor(coords).astype(np.int64)
+    weights = (coords - i0).astype(np.float32)
+    i1 = i0 + 1
+    if extension == 'REPEAT':
+        i0 %= size_src
+        i1 %= size_src
+    else:
+        i0 = np.clip(i0, 0, size_src - 1)
+        i1 = np.clip(i1, 0, size_src - 1)
+    return i0, i1, weights
+
+def _nearest(size_out, size_src, extension, start, end):
+    """ Source texel indices of the texel centers of an axis """
+    indices = np.floor(_axis_centers(size_out, start, end) * size_src).astype(np.int64)
+    if extension == 'REPEAT':
+        return indices % size_src
+    return np.clip(indices, 0, size_src - 1)
+
+def resample(pixels, width, height, interpolation = 'Linear', extension = 'REPEAT', window = (0.0, 0.0, 1.0, 1.0)):
+    """ Sample an image with shape (rows, columns, channels) at the texel centers of a width x height image
+
+    window is the (u_min, v_min, u_max, v_max) rectangle of texture coordinates the output covers.
+    """
+    src_height, src_width, channels = pixels.shape
+    u_min, v_min, u_max, v_max = window
+    if interpolation == 'Closest':
+        xs = _nearest(width, src_width, extension, u_min, u_max)
+        ys = _nearest(height, src_height, extension, v_min, v_max)
+        return pixels[ys][:, xs]
+
+    x0, x1, fx = _axis_coords(width, src_width, extension, u_min, u_max)
+    y0, y1, fy = _axis_coords(height, src_height, extension, v_min, v_max)
+    fx = fx[None, :, None]
+    result = np.empty((height, width, channels), dtype = np.float32)
+    for start in range(0, height, CHUNK_ROWS):
+        rows = slice(start, start + CHUNK_ROWS)
+        wy = fy[rows, None, None]
+        lines = pixels[y0[rows]] * (1.0 - wy) + pixels[y1[rows]] * wy
+        result[rows] = lines[:, x0] * (1.0 - fx) + lines[:, x1] * fx
+    return result
+
+def sample_points(pixels, uvs, interpolation = 'Linear', extension = 'REPEAT'):
+    """ Sample an image with shape (rows, columns, channels) at texture coordinates with shape (n, 2) """
+    src_height, src_width, channels = pixels.shape
+    coords = uvs * (src_width, src_height)
+    if interpolation == 'Closest':
+        xs = np.floor(coords[:, 0]).astype(np.int64)
+        ys = np.floor(coords[:, 1]).astype(np.int64)
+        if extension == 'REPEAT':
+            return pixels[ys % src_height, xs % src_width]
+        return pixels[np.clip(ys, 0, src_height - 1), np.clip(xs, 0, src_width - 1)]
+
+    coords = coords - 0.5
+    x0 = np.floor(coords[:, 0]).astype(np.int64)
+    y0 = np.floor(coords[:, 1]).astype(np.int64)
+    fx = (coords[:, 0] - x0).astype(np.float32)[:, None]
+    fy = (coords[:, 1] - y0).astype(np.float32)[:, None]
+    x1 = x0 + 1
+    y1 = y0 + 1
+    if extension == 'REPEAT':
+        x0, x1, y0, y1 = x0 % src_width, x1 % src_width, y0 % src_height, y1 % src_height
+    else:
+        x0, x1 = np.clip(x0, 0, src_width - 1), np.clip(x1, 0, src_width - 1)
+        y0, y1 = np.clip(y0, 0, src_height - 1), np.clip(y1, 0, src_height - 1)
+    top = pixels[y0, x0] * (1.0 - fx) + pixels[y0, x1] * fx
+    bottom = pixels[y1, x0] * (1.0 - fx) + pixels[y1, x1] * fx
+    return top * (1.0 - fy) + bottom * fy
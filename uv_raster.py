@@ -0,0 +1,248 @@
+from collections import OrderedDict
+
+import numpy as np
+
+# Largest side of the texel block tested at once for a triangle, bigger triangles are split into blocks
+BLOCK_SIZE = 64
+# Number of candidate texels tested per vectorized step
+CHUNK_TEXELS = 1 << 20
+
+def mesh_uv_triangles(obj, depsgraph):
+    """ Return the UVs with shape (n, 3, 2) and the material indices of the triangles of the evaluated mesh """
+    eval_obj = obj.evaluated_get(depsgraph)
+    mesh = eval_obj.to_mesh()
+    try:
+        mesh.calc_loop_triangles()
+        num_tris = len(mesh.loop_triangles)
+        loops = np.empty(num_tris * 3, dtype = np.int32)
+        mesh.loop_triangles.foreach_get('loops', loops)
+        material_indices = np.empty(num_tris, dtype = np.int32)
+        mesh.loop_triangles.foreach_get('material_index', material_indices)
+        uvs = np.empty(len(mesh.loops) * 2, dtype = np.float32)
+        mesh.uv_layers.active.data.foreach_get('uv', uvs)
+    finally:
+        eval_obj.to_mesh_clear()
+
+    tri_uvs = uvs.reshape(-1, 2)[loops].reshape(num_tris, 3, 2)
+    return tri_uvs, material_indices
+
+def mesh_triangle_geometry(obj, depsgraph):
+    """ Return the world space positions and normals with shape (n, 3, 3) of the corners of the triangles
+    of the evaluated mesh, in the order of mesh_uv_triangles
+    """
+    eval_obj = obj.evaluated_get(depsgraph)
+    mesh = eval_obj.to_mesh()
+    try:
+        mesh.calc_loop_triangles()
+        mesh.calc_normals_split()
+        num_tris = len(mesh.loop_triangles)
+        loops = np.empty(num_tris * 3, dtype = np.int32)
+        mesh.loop_triangles.foreach_get('loops', loops)
+        loop_vertices = np.empty(len(mesh.loops), dtype = np.int32)
+        mesh.loops.foreach_get('vertex_index', loop_vertices)
+        normals = np.empty(len(mesh.loops) * 3, dtype = np.float32)
+        mesh.loops.foreach_get('normal', normals)
+        co = np.empty(len(mesh.vertices) * 3, dtype = np.float32)
+        mesh.vertices.foreach_get('co', co)
+    finally:
+        eval_obj.to_mesh_clear()
+
+    matrix = np.array(obj.matrix_world, dtype = np.float32)
+    co = co.reshape(-1, 3) @ matrix[:3, :3].T + matrix[:3, 3]
+    normals = normals.reshape(-1, 3) @ np.linalg.inv(matrix[:3, :3])
+    normals /= np.maximum(np.linalg.norm(normals, axis = 1, keepdims = True), 1e-12)
+    positions = co[loop_vertices[loops]].reshape(num_tris, 3, 3)
+    return positions, normals[loops].reshape(num_tris, 3, 3)
+
+def uv_islands(tri_uvs):
+    """ Return the UV island index of each triangle, triangles sharing UV coordinates are in the same island """
+    num_tris = len(tri_uvs)
+    if num_tris == 0:
+        return np.zeros(0, dtype = np.int64)
+    keys = np.round(tri_uvs.reshape(-1, 2).astype(np.float64) * (1 << 20)).astype(np.int64)
+    _, corners = np.unique(keys, axis = 0, return_inverse = True)
+    corners = corners.reshape(num_tris, 3)
+
+    # Connected components of the UV vertices, hooking roots to the smallest one and compressing paths
+    parent = np.arange(corners.max() + 1)
+    a = corners[:, [0, 1]].ravel()
+    b = corners[:, [1, 2]].ravel()
+    while True:
+        root_a = parent[a]
+        root_b = parent[b]
+        linked = root_a != root_b
+        if not linked.any():
+            break
+        low = np.minimum(root_a[linked], root_b[linked])
+        np.minimum.at(parent, root_a[linked], low)
+        np.minimum.at(parent, root_b[linked], low)
+        while True:
+            grand = parent[parent]
+            if np.array_equal(grand, parent):
+                break
+            parent = grand
+    return parent[corners[:, 0]]
+
+def _split_blocks(tris, x0, y0, x1, y1, block):
+    """ Split the texel bounds of the triangles into blocks with at most block texels per side """
+    nx = (x1 - x0) // block + 1
+    ny = (y1 - y0) // block + 1
+    counts = nx * ny
+    starts = np.repeat(np.cumsum(counts) - counts, counts)
+    k = np.arange(counts.sum()) - starts
+    nx = np.repeat(nx, counts)
+    bx0 = np.repeat(x0, counts) + (k % nx) * block
+    by0 = np.repeat(y0, counts) + (k // nx) * block
+    bx1 = np.minimum(bx0 + block - 1, np.repeat(x1, counts))
+    by1 = np.minimum(by0 + block - 1, np.repeat(y1, counts))
+    return np.repeat(tris, counts), bx0, by0, bx1, by1
+
+def rasterize_triangles(tri_uvs, width, height):
+    """ Rasterize triangles in UV space
+
+    Returns the index of the triangle covering each texel center (-1 where nothing is covered)
+    and the barycentric coordinates of the texel center in that triangle.
+    """
+    tri_index = np.full((height, width), -1, dtype = np.int32)
+    barycentric = np.zeros((height, width, 3), dtype = np.float32)
+    if len(tri_uvs) == 0:
+        return tri_index, barycentric
+
+    points = tri_uvs.astype(np.float64) * (width, height)
+    mins = points.min(axis = 1)
+    maxs = points.max(axis = 1)
+
+    # Texels whose centers lie inside the bounding box of each triangle
+    x0 = np.clip(np.ceil(mins[:, 0] - 0.5), 0, width).astype(np.int64)
+    y0 = np.clip(np.ceil(mins[:, 1] - 0.5), 0, height).astype(np.int64)
+    x1 = np.clip(np.floor(maxs[:, 0] - 0.5), -1, width - 1).astype(np.int64)
+    y1 = np.clip(np.floor(maxs[:, 1] - 0.5), -1, height - 1).astype(np.int64)
+    valid = (x1 >= x0) & (y1 >= y0)
+    tris, x0, y0, x1, y1 = _split_blocks(np.nonzero(valid)[0], x0[valid], y0[valid], x1[valid], y1[valid], BLOCK_SIZE)
+
+    # Group the blocks by size so small triangles do not test large blocks
+    sizes = np.maximum(x1 - x0, y1 - y0) + 1
+    bucket_sizes = 1 << np.ceil(np.log2(sizes)).astype(np.int64)
+    for size in np.unique(bucket_sizes):
+        in_bucket = np.nonzero(bucket_sizes == size)[0]
+        offset_y, offset_x = np.divmod(np.arange(size * size), size)
+        step = max(1, CHUNK_TEXELS // (size * size))
+        for start in range(0, len(in_bucket), step):
+            items = in_bucket[start:start + step]
+            xs = x0[items, None] + offset_x
+            ys = y0[items, None] + offset_y
+            inside_box = (xs <= x1[items, None]) & (ys <= y1[items, None])
+
+            a, b, c = (points[tris[items], i] for i in range(3))
+            v0 = b - a
+            v1 = c - a
+            px = xs + 0.5 - a[:, 0, None]
+            py = ys + 0.5 - a[:, 1, None]
+            denom = v0[:, 0] * v1[:, 1] - v1[:, 0] * v0[:, 1]
+            denom[denom == 0.0] = np.inf
+            w1 = (px * v1[:, 1, None] - v1[:, 0, None] * py) / denom[:, None]
+            w2 = (v0[:, 0, None] * py - px * v0[:, 1, None]) / denom[:, None]
+            w0 = 1.0 - w1 - w2
+            inside = inside_box & (w0 >= 0.0) & (w1 >= 0.0) & (w2 >= 0.0) & np.isfinite(denom)[:, None]
+
+            rows, cols = np.nonzero(inside)
+            ty = ys[rows, cols]
+            tx = xs[rows, cols]
+            tri_index[ty, tx] = tris[items][rows]
+            barycentric[ty, tx] = np.stack((w0[rows, cols], w1[rows, cols], w2[rows, cols]), axis = -1)
+
+    return tri_index, barycentric
+
+class UVRaster:
+    """ Triangle covering each texel of an image, with the barycentric coordinates of the texel center """
+
+    def __init__(self, tri_uvs, material_indices, width, height):
+        self.tri_index, self.barycentric = rasterize_triangles(tri_uvs, width, height)
+        self.covered = self.tri_index >= 0
+        self.material_indices = material_indices
+        self.margins = {}
+
+    def margin_sources(self, margin):
+        """ Return the margin_sources of the covered texels, computed once per margin """
+        if margin not in self.margins:
+            self.margins[margin] = margin_sources(self.covered, margin)
+        return self.margins[margin]
+
+    @property
+    def texels(self):
+        return self.tri_index.size
+
+class RasterCache:
+    """ UV rasters shared by every map of a bake and by the objects using the same mesh
+
+    The least recently used rasters are dropped once they hold more than max_texels texels.
+    """
+
+    def __init__(self, max_texels = 1 << 26):
+        self.max_texels = max_texels
+        self.rasters = OrderedDict()
+
+    def get(self, key, build):
+        """ Return the raster stored with a key, calling build() to create it when missing """
+        if key in self.rasters:
+            self.rasters.move_to_end(key)
+            return self.rasters[key]
+        raster = build()
+        self.rasters[key] = raster
+        while len(self.rasters) > 1 and sum(r.texels for r in self.rasters.values()) > self.max_texels:
+            self.rasters.popitem(last = False)
+        return raster
+
+def _neighbour_slices(dy, dx, height, width):
+    """ Slices of a texel region and of its neighbour region at offset (dy, dx) """
+    dst = (slice(max(0, -dy), height - max(0, dy)), slice(max(0, -dx), width - max(0, dx)))
+    src = (slice(max(0, dy), height - max(0, -dy)), slice(max(0, dx), width - max(0, -dx)))
+    return dst, src
+
+NEIGHBOURS = ((0, 1), (0, -1), (1, 0), (-1, 0), (1, 1), (1, -1), (-1, 1), (-1, -1))
+
+def margin_sources(mask, margin):
+    """ Return the texels a margin of some width around mask fills and the texel of mask each one copies
+
+    Rings are grown one texel at a time from the texels filled by the previous ring, so
+    only the border is visited. Each texel takes the value of the first filled neighbour
+    in NEIGHBOURS order. Returns ((rows, cols), (source rows, source cols)).
+    """
+    height, width = mask.shape
+    # Texels of the mask with a neighbour outside it
+    border = np.zeros_like(mask)
+    for dy, dx in NEIGHBOURS:
+        dst, src = _neighbour_slices(dy, dx, height, width)
+        border[src] |= ~mask[dst]
+    border &= mask
+
+    filled = mask.copy()
+    rows, cols = np.nonzero(border)
+    sources = rows.astype(np.int64) * width + cols
+    fills = []
+    for _ in range(margin):
+        ring = []
+        for dy, dx in NEIGHBOURS:
+            ring_rows = rows - dy
+            ring_cols = cols - dx
+            inside = (ring_rows >= 0) & (ring_rows < height) & (ring_cols >= 0) & (ring_cols < width)
+            ring_rows, ring_cols, ring_sources = ring_rows[inside], ring_cols[inside], sources[inside]
+            empty = ~filled[ring_rows, ring_cols]
+            ring_rows, ring_cols, ring_sources = ring_rows[empty], ring_cols[empty], ring_sources[empty]
+            filled[ring_rows, ring_cols] = True
+            ring.append((ring_rows, ring_cols, ring_sources))
+        rows, cols, sources = (np.concatenate(parts) for parts in zip(*ring))
+        if len(rows) == 0:
+            break
+        fills.append((rows, cols, sources))
+
+    if not fills:
+        empty = np.zeros(0, dtype = np.int64)
+        return (empty, empty), (empty, empty)
+    rows, cols, sources = (np.concatenate(parts) for parts in zip(*fills))
+    return (rows, cols), np.divmod(sources, width)
+
+def dilate(pixels, sources):
+    """ Extend the covered texels over the margin computed by margin_sources, in place """
+    fill, source = sources
+    pixels[fill] = pixels[source]
@@ -0,0 +1,62 @@
+import bpy
+import numpy as np
+
+from .pixel_buffers import linear_to_srgb, srgb_to_linear
+
+# Blender version whose bake operator can write vertex colors
+VERTEX_BAKE_VERSION = (2, 92, 0)
+# Blender version whose vertex color layers convert the byte colors to linear
+LINEAR_COLORS_VERSION = (3, 2, 0)
+
+def can_bake_vertex_colors():
+    return bpy.app.version >= VERTEX_BAKE_VERSION
+
+def read_loop_colors(layer):
+    """ Return the linear RGBA colors of a vertex color layer with shape (loops, 4) """
+    colors = np.empty(len(layer.data) * 4, dtype = np.float32)
+    layer.data.foreach_get('color', colors)
+    colors = colors.reshape(-1, 4)
+    if bpy.app.version < LINEAR_COLORS_VERSION:
+        # Older versions give the stored sRGB encoded bytes
+        colors[:, :3] = srgb_to_linear(colors[:, :3])
+    return colors
+
+def write_loop_colors(mesh, name, colors):
+    """ Write linear RGBA colors with shape (loops, 4) to a vertex color layer, creating it if needed
+
+    Returns False if the mesh already has the maximum number of vertex color layers.
+    """
+    layer = mesh.vertex_colors.get(name)
+    if layer is None:
+        layer = mesh.vertex_colors.new(name = name)
+        if layer is None:
+            return False
+    if bpy.app.version < LINEAR_COLORS_VERSION:
+        colors = colors.copy()
+        colors[:, :3] = linear_to_srgb(colors[:, :3])
+    layer.data.foreach_set('color', np.ascontiguousarray(colors, dtype = np.float32).ravel())
+    mesh.update()
+    return True
+
+def loop_uvs(mesh):
+    """ Return the coordinates of every loop in the active UV map with shape (loops, 2) """
+    uvs = np.empty(len(mesh.loops) * 2, dtype = np.float32)
+    mesh.uv_layers.active.data.foreach_get('uv', uvs)
+    return uvs.reshape(-1, 2)
+
+def loop_material_indices(mesh):
+    """ Return the material index of the face of every loop """
+    num_faces = len(mesh.polygons)
+    loop_starts = np.empty(num_faces, dtype = np.int32)
+    mesh.polygons.foreach_get('loop_start', loop_starts)
+    loop_totals = np.empty(num_faces, dtype = np.int32)
+    mesh.polygons.foreach_get('loop_total', loop_totals)
+    face_indices = np.empty(num_faces, dtype = np.int32)
+    mesh.polygons.foreach_get('material_index', face_indices)
+
+    # Index of every loop of each face, in face order
+    offsets = np.repeat(loop_starts - (np.cumsum(loop_totals) - loop_totals), loop_totals)
+    loops = np.arange(loop_totals.sum()) + offsets
+    material_indices = np.zeros(len(mesh.loops), dtype = np.int32)
+    material_indices[loops] = np.repeat(face_indices, loop_totals)
+    return material_indices